@@ -1,62 +1,1142 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from flask import (Flask, Response, render_template, request, jsonify, redirect, url_for, flash, abort, g, session,
+                   has_app_context, make_response, get_template_attribute, before_render_template,
+                   template_rendered, send_file)
+from flask.globals import app_ctx
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from jinja2 import FileSystemBytecodeCache
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError, OperationalError, SQLAlchemyError
+from array import array
+from collections import Counter, OrderedDict, namedtuple
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta
+from itertools import repeat
+import base64
+import contextvars
+import bisect
+import csv
+import difflib
+import functools
+import hashlib
+import heapq
+import io
+import json
 import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+import uuid
+import zlib
+
+from models import (Base, Box, ComponentType, BoxComponent, StockMovement, StockCheckpoint, StockCheckpointBox,
+                    ComponentTypeStock, AlertRule, Alert, Job, SiteTransfer, ScanTag, CatalogVersion,
+                    DEFAULT_DATABASE_URL, STOCK_CHECKPOINT_INTERVAL, checkpoint_stock_if_due, count_stock_movements,
+                    default_job_database_uri, is_sqlite_file, mark_catalog_changed, migrate, parse_sites,
+                    populate_search_index, populate_stock_summary, schema_is_current, unpack_checkpoint_box)
+from importer import IMPORT_BATCH_SIZE, IMPORT_MODES, batches, bulk_import
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key-here'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///toolkit_inventory.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db = SQLAlchemy(app)
-
-# Database Models
-class Box(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False, unique=True)
-    description = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    components = db.relationship('BoxComponent', backref='box', lazy=True, cascade='all, delete-orphan')
-
-class ComponentType(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False, unique=True)
-    description = db.Column(db.Text)
-    max_per_box = db.Column(db.Integer, nullable=False, default=1)
-    category = db.Column(db.String(50))
-
-class BoxComponent(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    box_id = db.Column(db.Integer, db.ForeignKey('box.id'), nullable=False)
-    component_type_id = db.Column(db.Integer, db.ForeignKey('component_type.id'), nullable=False)
-    quantity = db.Column(db.Integer, nullable=False, default=0)
-    last_updated = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    component_type = db.relationship('ComponentType', backref='box_components')
-    
-    __table_args__ = (db.UniqueConstraint('box_id', 'component_type_id'),)
+
+def create_app(config=None):
+    """Configure the app from the environment, then from config, and set up its database
+
+    Everything that serves or scripts the app calls this first: python app.py,
+    the job worker, the scan listener and the benchmarks, and a WSGI server
+    pointed at app:create_app(). Later calls return the app unchanged. No
+    engine is created here; each one is created when it is first used.
+    """
+    if 'sqlalchemy' in app.extensions:
+        return app
+
+    app.config['SECRET_KEY'] = 'your-secret-key-here'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # SQLite engine settings; every value can be overridden from the environment.
+    # WAL lets readers run alongside a writer, and synchronous=NORMAL only fsyncs
+    # at checkpoints, which is still durable against application crashes.
+    app.config['SQLITE_PRAGMAS'] = {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),  # negative means KiB
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),  # milliseconds
+        'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+    }
+    app.config['SQLITE_POOL_SIZE'] = int(os.environ.get('SQLITE_POOL_SIZE', 5))
+    app.config['SQLITE_MAX_OVERFLOW'] = int(os.environ.get('SQLITE_MAX_OVERFLOW', 10))
+    # Serve read-only routes from a second, query_only engine on the same file
+    app.config['SQLITE_READ_ENGINE'] = os.environ.get('SQLITE_READ_ENGINE', '1') == '1'
+
+    # Per-request profiling: Server-Timing headers, SQL statistics and /metrics.
+    # Off by default; when off none of its hooks are installed.
+    app.config['PROFILING'] = os.environ.get('PROFILING', '0') == '1'
+    # Fraction of requests to also run under cProfile, merged into one file per endpoint
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+
+    # Open /api/events streams allowed per process, each holding a worker thread
+    # (or greenlet) for as long as it is open; more are refused with 503
+    app.config['EVENT_MAX_SUBSCRIBERS'] = int(os.environ.get('EVENT_MAX_SUBSCRIBERS', 50))
+
+    # Where stock alert notifications go: 'log', 'file:PATH' or 'webhook:URL'
+    app.config['ALERT_SINK'] = os.environ.get('ALERT_SINK', 'log')
+
+    # Background jobs: worker processes started by scripts/job_worker.py, where job output
+    # files go, and the only directory import jobs may read files from
+    app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+    app.config['JOB_DIR'] = os.environ.get('JOB_DIR', os.path.join(app.instance_path, 'jobs'))
+    app.config['JOB_IMPORT_DIR'] = os.environ.get('JOB_IMPORT_DIR', os.path.join(app.instance_path, 'imports'))
+
+    # Other sites (labs) keep their boxes and stock in databases of their own,
+    # given as 'NAME=URL,NAME=URL'; this app's own database is the HOME_SITE
+    app.config['HOME_SITE'] = os.environ.get('HOME_SITE', 'main')
+    app.config['INVENTORY_SITES'] = parse_sites(os.environ.get('INVENTORY_SITES', ''))
+
+    # Compiled templates are cached on disk, so a fresh worker process skips
+    # compiling them on its first requests; an empty value turns the cache off
+    app.config['TEMPLATE_CACHE_DIR'] = os.environ.get('TEMPLATE_CACHE_DIR',
+                                                      os.path.join(app.instance_path, 'templates'))
+
+    app.config.update(config or {})
+
+    if app.config['HOME_SITE'] in app.config['INVENTORY_SITES']:
+        raise ValueError(f"INVENTORY_SITES cannot reuse the home site name {app.config['HOME_SITE']!r}")
+    if app.config['TEMPLATE_CACHE_DIR']:
+        os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+        # The environment already exists, the template filters are registered on it at import
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])
+
+    if is_sqlite_file(app.config['SQLALCHEMY_DATABASE_URI']):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'pool_size': app.config['SQLITE_POOL_SIZE'],
+            'max_overflow': app.config['SQLITE_MAX_OVERFLOW'],
+            'connect_args': {
+                'timeout': app.config['SQLITE_PRAGMAS']['busy_timeout'] / 1000,
+                'check_same_thread': False
+            }
+        }
+
+    # The job table has a database of its own, so job bookkeeping never waits on inventory writes
+    app.config['SQLALCHEMY_BINDS'] = {
+        'jobs': os.environ.get('JOB_DATABASE_URL', default_job_database_uri(app.config['SQLALCHEMY_DATABASE_URI']))
+    }
+    if is_sqlite_file(app.config['SQLALCHEMY_DATABASE_URI']) and app.config['SQLITE_READ_ENGINE']:
+        app.config['SQLALCHEMY_BINDS']['read'] = app.config['SQLALCHEMY_DATABASE_URI']
+    for site_name, site_url in app.config['INVENTORY_SITES'].items():
+        app.config['SQLALCHEMY_BINDS'][f'site:{site_name}'] = site_url
+
+    db.init_app(app)
+    if app.config['PROFILING']:
+        enable_profiling()
+    return app
+
+class RoutingSession(Session):
+    """Session that sends the queries of read_only views to the 'read' engine.
+
+    Flushes always go to the primary engine, so a view that turns out to write
+    still writes to the right place. Models with a __bind_key__ of their own,
+    such as Job, keep their engine. A session opened by site_context() sends
+    everything meant for the primary engine to that site's database instead,
+    and is read-only or not as site_context() was asked, whatever the view.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or engine is not self._db.engines[None]:
+            return engine
+        site = self.info.get('site')
+        if site is not None:
+            return self._db.engines[f'site:{site}']
+        read_only = self.info['read_only'] if 'read_only' in self.info else has_app_context() and g.get('read_only')
+        if not self._flushing and read_only and 'read' in self._db.engines:
+            return self._db.engines['read']
+        return engine
+
+def read_only(view):
+    """Mark a view as read-only so its queries use the read engine"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            # The app context can outlive the request, e.g. under test_client()
+            g.pop('read_only', None)
+    return wrapper
+
+def configure_sqlite_engine(engine, query_only=False):
+    """Apply SQLITE_PRAGMAS to every new connection of a SQLite engine"""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = dict(app.config['SQLITE_PRAGMAS'])
+    if query_only:
+        # The journal mode is a property of the file, set by the writer
+        pragmas.pop('journal_mode')
+        pragmas['query_only'] = 'ON'
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+
+class LazyEngines(Mapping):
+    """Bind key -> engine map that creates each engine the first time it is looked up"""
+
+    def __init__(self):
+        self._factories = {}
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def __setitem__(self, bind_key, factory):
+        self._factories[bind_key] = factory
+
+    def __getitem__(self, bind_key):
+        engine = self._engines.get(bind_key)
+        if engine is None:
+            factory = self._factories[bind_key]
+            with self._lock:
+                engine = self._engines.get(bind_key)
+                if engine is None:
+                    engine = self._engines[bind_key] = factory()
+        return engine
+
+    def __contains__(self, bind_key):
+        return bind_key in self._factories
+
+    def __iter__(self):
+        return iter(self._factories)
+
+    def __len__(self):
+        return len(self._factories)
+
+class InventorySQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with engines that are created, and configured, on first use.
+
+    A CLI job or a worker that never touches a site's database, or the read
+    engine, never pays for creating it.
+    """
+
+    def init_app(self, app):
+        self._app_engines[app] = LazyEngines()
+        super().init_app(app)
+
+    def _make_engine(self, bind_key, options, app):
+        make_engine = super()._make_engine
+
+        def create():
+            engine = make_engine(bind_key, options, app)
+            configure_sqlite_engine(engine, query_only=bind_key == 'read')
+            if app.config['PROFILING']:
+                profile_engine(engine)
+            return engine
+        return create
+
+# site_context() gives db.session a scope of its own inside the current app
+# context, so the view's session and its open transaction are left untouched
+_site_scope = contextvars.ContextVar('site_scope', default=None)
+
+def _session_scope():
+    return id(app_ctx._get_current_object()), _site_scope.get()
+
+db = InventorySQLAlchemy(model_class=Base, session_options={'class_': RoutingSession, 'scopefunc': _session_scope})
+
+# Full-text search index
+# component_type_fts (created by the schema in models.py) mirrors the
+# searchable ComponentType columns in an FTS5 table. It is kept in sync by the
+# mapper events below; bulk Query.delete() calls bypass those, so run
+# rebuild_search_index() after them.
+# BM25 column weights: a hit in the name outranks the category, which outranks the description
+SEARCH_RANK = db.func.bm25(db.literal_column('component_type_fts'), 10.0, 1.0, 5.0)
+SEARCH_MATCH = db.literal_column('component_type_fts').op('MATCH')
+search_index = db.table('component_type_fts', db.column('rowid'))
+
+def _index_row(component_type):
+    return {
+        'id': component_type.id,
+        'name': component_type.name,
+        'description': component_type.description or '',
+        'category': component_type.category or '',
+    }
+
+@event.listens_for(ComponentType, 'after_insert')
+def _index_component_type(mapper, connection, target):
+    connection.execute(db.text(
+        'INSERT INTO component_type_fts(rowid, name, description, category) '
+        'VALUES (:id, :name, :description, :category)'
+    ), _index_row(target))
+
+@event.listens_for(ComponentType, 'after_update')
+def _reindex_component_type(mapper, connection, target):
+    connection.execute(db.text('DELETE FROM component_type_fts WHERE rowid = :id'), {'id': target.id})
+    _index_component_type(mapper, connection, target)
+
+@event.listens_for(ComponentType, 'after_delete')
+def _unindex_component_type(mapper, connection, target):
+    connection.execute(db.text('DELETE FROM component_type_fts WHERE rowid = :id'), {'id': target.id})
+
+def rebuild_search_index():
+    """Repopulate component_type_fts from the component_type table and commit"""
+    populate_search_index(db.session.connection())
+    db.session.commit()
+
+def _similar_terms(token, max_terms=5):
+    """Return indexed terms within a small edit distance of token, for typo tolerance"""
+    # Typos rarely hit the first letter, so only that slice of the vocabulary is compared
+    rows = db.session.execute(db.text(
+        'SELECT term FROM component_type_fts_vocab WHERE term >= :low AND term < :high'
+    ), {'low': token[0], 'high': chr(ord(token[0]) + 1)})
+    terms = [term for term, in rows if abs(len(term) - len(token)) <= 2]
+    return difflib.get_close_matches(token, terms, n=max_terms, cutoff=0.75)
+
+def build_search_match(query):
+    """Translate free text into an FTS5 MATCH expression, or None if it has no searchable terms.
+
+    Every word is matched as a prefix so partial input finds results while
+    typing. When that finds nothing, each word is widened to the indexed terms
+    closest to it so that small misspellings still match.
+    """
+    tokens = re.findall(r'\w+', query.lower())
+    if not tokens:
+        return None
+
+    match = ' AND '.join(f'"{token}"*' for token in tokens)
+    if db.session.execute(
+        db.select(search_index.c.rowid).where(SEARCH_MATCH(match)).limit(1)
+    ).first():
+        return match
+
+    groups = []
+    for token in tokens:
+        alternatives = [f'"{token}"*'] + [f'"{term}"' for term in _similar_terms(token)]
+        groups.append('(' + ' OR '.join(alternatives) + ')')
+    return ' AND '.join(groups)
+
+def search_matches(match):
+    """Subquery of (id, rank) for the component types matching an FTS5 expression; lower rank is better"""
+    return db.select(
+        search_index.c.rowid.label('id'),
+        SEARCH_RANK.label('rank')
+    ).where(SEARCH_MATCH(match)).subquery()
+
+# Catalog cache
+# Boxes and component types change far less often than they are read, so
+# lookups by id or name are served from a process-local LRU cache of immutable
+# snapshots. A flush that touches either table bumps catalog_version in the
+# same transaction, and the commit clears this process's cache; other
+# processes notice the new version within CATALOG_VERSION_CHECK_INTERVAL.
+# Alert rules and scan tags are cached the same way, each with a cache and a
+# counter of its own, so editing them leaves the box and component type
+# snapshots, page ETags and box card fragments alone. Every site numbers its
+# boxes from 1 and keeps its own catalog version, so entries and versions are
+# kept per site, the site of the session that reads or commits them.
+CATALOG_CACHE_SIZE = 4096
+CATALOG_CACHE_TTL = 300  # seconds
+CATALOG_VERSION_CHECK_INTERVAL = 1.0  # seconds
+
+CachedBox = namedtuple('CachedBox', ['id', 'name', 'description', 'created_at'])
+CachedComponentType = namedtuple('CachedComponentType', ['id', 'name', 'description', 'max_per_box', 'category'])
+
+def current_site(session=None):
+    """Return the site whose database session (db.session by default) reads and writes"""
+    return (session or db.session).info.get('site', app.config['HOME_SITE'])
+
+class CatalogCache:
+    """Thread-safe LRU cache with a per-entry TTL, keyed by site, emptied for a site whenever its version changes"""
+
+    def __init__(self, max_size, ttl, version_check_interval):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version_check_interval = version_check_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._versions = {}  # site: (version, monotonic time it was read)
+
+    def clear(self, site=None):
+        """Drop the entries of one site, or of every site"""
+        with self._lock:
+            if site is None:
+                self._entries.clear()
+                self._versions.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == site]:
+                    del self._entries[key]
+                # Re-read the version on the next lookup instead of mistaking our
+                # own bump for a change made by another process
+                self._versions.pop(site, None)
+            self._generation += 1
+            self.invalidations += 1
+
+    def sync_version(self, load_version):
+        """Empty the current site's entries when load_version() reports a new version; checks once per interval"""
+        site = current_site()
+        now = time.monotonic()
+        version, checked_at = self._versions.get(site, (None, None))
+        if checked_at is not None and now - checked_at < self.version_check_interval:
+            return
+        new_version = load_version()
+        if version is not None and new_version != version:
+            self.clear(site)
+        with self._lock:
+            self._versions[site] = (new_version, now)
+
+    def _lookup(self, key, now):
+        """Return (found, value) for key; the caller holds the lock"""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= now:
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, entry[1]
+
+    def _store(self, key, value, now, generation):
+        """Cache value unless the cache was cleared while it was loading; the caller holds the lock"""
+        if generation != self._generation:
+            return
+        self._entries[key] = (now + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key, load):
+        """Return the current site's cached value for key, calling load() to fill it on a miss"""
+        key = (current_site(), key)
+        now = time.monotonic()
+        with self._lock:
+            found, value = self._lookup(key, now)
+            generation = self._generation
+        if found:
+            return value
+        value = load()
+        with self._lock:
+            self._store(key, value, now, generation)
+        return value
+
+    def get_many(self, kind, ids, load_many):
+        """Return the current site's {id: value} for the ids that exist, loading every miss with one load_many(ids)"""
+        site = current_site()
+        now = time.monotonic()
+        values = {}
+        missing = []
+        with self._lock:
+            for item_id in set(ids):
+                found, value = self._lookup((site, kind, item_id), now)
+                if found:
+                    values[item_id] = value
+                else:
+                    missing.append(item_id)
+            generation = self._generation
+        if missing:
+            loaded = load_many(missing)
+            with self._lock:
+                for item_id in missing:
+                    # Ids that do not exist are cached as None too
+                    self._store((site, kind, item_id), loaded.get(item_id), now, generation)
+            values.update(loaded)
+        return {item_id: value for item_id, value in values.items() if value is not None}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'size': len(self._entries),
+                'versions': {site: version for site, (version, _) in self._versions.items()},
+            }
+
+catalog_cache = CatalogCache(CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL, CATALOG_VERSION_CHECK_INTERVAL)
+# Alert rules are read on every stock change and scan tags on every scan
+alert_rule_cache = CatalogCache(1, CATALOG_CACHE_TTL, CATALOG_VERSION_CHECK_INTERVAL)
+scan_tag_cache = CatalogCache(1, CATALOG_CACHE_TTL, CATALOG_VERSION_CHECK_INTERVAL)
+# catalog_version counter -> (models whose changes bump it, cache it clears)
+CATALOG_CACHES = {
+    'version': ((Box, ComponentType), catalog_cache),
+    'alert_rules_version': ((AlertRule,), alert_rule_cache),
+    'scan_tags_version': ((ScanTag,), scan_tag_cache),
+}
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _bump_catalog_version(session, flush_context):
+    changed = list(session.new) + list(session.deleted) + [
+        instance for instance in session.dirty if session.is_modified(instance, include_collections=False)
+    ]
+    counters = [counter for counter, (models, _) in CATALOG_CACHES.items()
+                if any(isinstance(instance, models) for instance in changed)]
+    if counters:
+        mark_catalog_changed(session, counters)
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _invalidate_catalog_cache(session):
+    for counter in session.info.pop('catalog_changed', ()):
+        CATALOG_CACHES[counter][1].clear(current_site(session))
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_catalog_change(session):
+    session.info.pop('catalog_changed', None)
+
+def load_catalog_version(counter='version'):
+    return db.session.query(getattr(CatalogVersion, counter)).filter_by(id=1).scalar()
+
+def _cached_box(box):
+    return CachedBox(box.id, box.name, box.description, box.created_at)
+
+def _cached_component_type(component_type):
+    return CachedComponentType(
+        component_type.id, component_type.name, component_type.description,
+        component_type.max_per_box, component_type.category
+    )
+
+def _load_boxes(box_ids):
+    return {box.id: _cached_box(box) for box in Box.query.filter(Box.id.in_(box_ids))}
+
+def _load_component_types(component_type_ids):
+    return {
+        component_type.id: _cached_component_type(component_type)
+        for component_type in ComponentType.query.filter(ComponentType.id.in_(component_type_ids))
+    }
+
+def get_box(box_id):
+    """Return the cached snapshot of a box, or None if it does not exist"""
+    return get_boxes_by_id([box_id]).get(box_id)
+
+def get_boxes_by_id(box_ids):
+    """Return {box_id: CachedBox} for the given ids, fetching every uncached one in a single query"""
+    catalog_cache.sync_version(load_catalog_version)
+    return catalog_cache.get_many('box', box_ids, _load_boxes)
+
+def get_box_by_name(name):
+    catalog_cache.sync_version(load_catalog_version)
+    return catalog_cache.get(('box_name', name), lambda: next(
+        (_cached_box(box) for box in Box.query.filter_by(name=name)), None
+    ))
+
+def get_all_boxes():
+    """Return every box, in id order"""
+    catalog_cache.sync_version(load_catalog_version)
+    return catalog_cache.get(('boxes',), lambda: tuple(
+        _cached_box(box) for box in Box.query.order_by(Box.id)
+    ))
+
+def get_component_type(component_type_id):
+    """Return the cached snapshot of a component type, or None if it does not exist"""
+    return get_component_types_by_id([component_type_id]).get(component_type_id)
+
+def get_component_types_by_id(component_type_ids):
+    """Return {id: CachedComponentType} for the given ids, fetching every uncached one in a single query"""
+    catalog_cache.sync_version(load_catalog_version)
+    return catalog_cache.get_many('component_type', component_type_ids, _load_component_types)
+
+def get_component_type_by_name(name):
+    catalog_cache.sync_version(load_catalog_version)
+    return catalog_cache.get(('component_type_name', name), lambda: next(
+        (_cached_component_type(component_type) for component_type in ComponentType.query.filter_by(name=name)), None
+    ))
+
+def get_all_component_types():
+    """Return every component type, in id order"""
+    catalog_cache.sync_version(load_catalog_version)
+    return catalog_cache.get(('component_types',), lambda: tuple(
+        _cached_component_type(component_type) for component_type in ComponentType.query.order_by(ComponentType.id)
+    ))
+
+# Query helpers
+def get_box_stats(box_ids=None):
+    """Return {box_id: {'component_types': n, 'total_items': n}} from one GROUP BY query"""
+    query = db.session.query(
+        BoxComponent.box_id,
+        db.func.count(BoxComponent.id),
+        db.func.coalesce(db.func.sum(BoxComponent.quantity), 0)
+    )
+    if box_ids is not None:
+        query = query.filter(BoxComponent.box_id.in_(box_ids))
+    rows = query.group_by(BoxComponent.box_id).all()
+    return {box_id: {'component_types': count, 'total_items': total} for box_id, count, total in rows}
+
+def get_top_box_components(limit=5, box_ids=None):
+    """Return {box_id: [BoxComponent, ...]} holding the first `limit` entries of every box.
+
+    The entries are ranked per box with a window function and their component
+    types are eager-loaded, so the whole listing costs a single SELECT.
+    """
+    ranked = db.session.query(
+        BoxComponent.id.label('id'),
+        db.func.row_number().over(
+            partition_by=BoxComponent.box_id,
+            order_by=BoxComponent.id
+        ).label('position')
+    )
+    if box_ids is not None:
+        ranked = ranked.filter(BoxComponent.box_id.in_(box_ids))
+    ranked = ranked.subquery()
+    rows = BoxComponent.query.join(ranked, ranked.c.id == BoxComponent.id).filter(
+        ranked.c.position <= limit
+    ).options(db.joinedload(BoxComponent.component_type)).order_by(BoxComponent.box_id, BoxComponent.id).all()
+
+    top_components = {}
+    for box_component in rows:
+        top_components.setdefault(box_component.box_id, []).append(box_component)
+    return top_components
+
+# Keyset pagination
+PER_PAGE = 50
+MAX_PER_PAGE = 500
+
+def encode_cursor(value, row_id):
+    """Encode the sort value and id of a boundary row as an opaque URL-safe cursor"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([value, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+def decode_cursor(cursor, sort_expression):
+    """Decode a cursor produced by encode_cursor, raising ValueError if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if value is not None and isinstance(sort_expression.type, db.DateTime):
+            value = datetime.fromisoformat(value)
+        return value, int(row_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def paginate(query, sort_columns, id_column, default_sort):
+    """Return one keyset page of query, driven by the sort/order/after/before/per_page request args.
+
+    sort_columns maps each allowed ``sort`` value to a column expression and
+    id_column breaks ties so the ordering is total. Pages are located with a
+    row-value comparison against the boundary row rather than an OFFSET, so
+    with an index on the sort column a deep page costs the same as the first.
+    Raises ValueError for a malformed cursor.
+    """
+    sort = request.args.get('sort', default_sort)
+    if sort not in sort_columns:
+        sort = default_sort
+    order = 'desc' if request.args.get('order') == 'desc' else 'asc'
+    per_page = min(max(request.args.get('per_page', PER_PAGE, type=int), 1), MAX_PER_PAGE)
+    after = request.args.get('after')
+    before = request.args.get('before')
+
+    sort_expression = sort_columns[sort]
+    # Walking backwards from a `before` cursor runs the query in reverse order
+    # and flips the rows back afterwards
+    backwards = bool(before) and not after
+    descending = (order == 'desc') != backwards
+
+    query = query.add_columns(sort_expression.label('sort_value'), id_column.label('sort_id'))
+    cursor = after or before
+    if cursor:
+        value, row_id = decode_cursor(cursor, sort_expression)
+        key = db.tuple_(sort_expression, id_column)
+        # The redundant bound on the sort column alone lets SQLite seek into
+        # expression indexes, which it will not do for the row value
+        if descending:
+            query = query.filter(sort_expression <= value, key < (value, row_id))
+        else:
+            query = query.filter(sort_expression >= value, key > (value, row_id))
+    if descending:
+        query = query.order_by(sort_expression.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_expression.asc(), id_column.asc())
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    items = [row[0] if len(row) == 3 else tuple(row[:-2]) for row in rows]
+    first, last = (rows[0], rows[-1]) if rows else (None, None)
+    has_next = has_more if not backwards else True
+    has_prev = has_more if backwards else bool(cursor)
+
+    return {
+        'items': items,
+        'sort': sort,
+        'order': order,
+        'per_page': per_page,
+        'next_cursor': encode_cursor(last.sort_value, last.sort_id) if last and has_next else None,
+        'prev_cursor': encode_cursor(first.sort_value, first.sort_id) if first and has_prev else None,
+    }
+
+@app.template_global()
+def page_url(**args):
+    """Build a URL for the current listing with the pagination args replaced"""
+    params = {key: value for key, value in request.args.items() if key not in ('after', 'before')}
+    params.update({key: value for key, value in args.items() if value is not None})
+    return url_for(request.endpoint, **(request.view_args or {}), **params)
+
+BOX_SORTS = {
+    'name': Box.name,
+    'created_at': Box.created_at,
+}
+
+COMPONENT_TYPE_SORTS = {
+    'name': ComponentType.name,
+    'category': db.func.coalesce(ComponentType.category, ''),
+    'max_per_box': ComponentType.max_per_box,
+}
+
+BOX_COMPONENT_SORTS = {
+    'name': ComponentType.name,
+    'category': db.func.coalesce(ComponentType.category, ''),
+    'quantity': BoxComponent.quantity,
+    'last_updated': BoxComponent.last_updated,
+}
+
+SEARCH_SORTS = dict(BOX_COMPONENT_SORTS, box=Box.name)
+
+# Stock summary
+# component_type_stock holds the total quantity and the number of boxes holding
+# each component type, kept current by the SQLite triggers in models.py.
+def rebuild_stock_summary():
+    """Recompute component_type_stock from box_component and commit"""
+    populate_stock_summary(db.session.connection())
+    db.session.commit()
+
+def stock_summary_query():
+    """Query of (ComponentType, quantity, box_count) for every component type"""
+    return db.session.query(
+        ComponentType,
+        db.func.coalesce(ComponentTypeStock.quantity, 0),
+        db.func.coalesce(ComponentTypeStock.box_count, 0)
+    ).outerjoin(ComponentTypeStock, ComponentTypeStock.component_type_id == ComponentType.id)
+
+STOCK_SUMMARY_SORTS = dict(
+    COMPONENT_TYPE_SORTS,
+    quantity=db.func.coalesce(ComponentTypeStock.quantity, 0),
+    box_count=db.func.coalesce(ComponentTypeStock.box_count, 0),
+)
+
+# Atomic stock updates
+# Capacity and availability are checked by the UPDATE/INSERT statements
+# themselves, so two workers can never both pass a check against the same
+# stale quantity.
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.05
+
+class StockConflict(Exception):
+    """Raised when stock changed underneath a planned update and the transaction must be retried"""
+
+def add_stock(box_id, component_type_id, quantity, reason='add'):
+    """Add quantity to a box entry, creating it if needed, and record the movement.
+
+    Returns False, changing nothing, if the result would exceed the component
+    type's max_per_box.
+    """
+    now = datetime.utcnow()
+    within_capacity = db.select(
+        db.literal(box_id), db.literal(component_type_id), db.literal(quantity), db.literal(now)
+    ).where(ComponentType.id == component_type_id, ComponentType.max_per_box >= quantity)
+    statement = sqlite_insert(BoxComponent).from_select(
+        ['box_id', 'component_type_id', 'quantity', 'last_updated'], within_capacity
+    )
+    max_per_box = db.select(ComponentType.max_per_box).where(
+        ComponentType.id == component_type_id
+    ).scalar_subquery()
+    statement = statement.on_conflict_do_update(
+        index_elements=['box_id', 'component_type_id'],
+        set_={
+            'quantity': BoxComponent.quantity + statement.excluded.quantity,
+            'last_updated': statement.excluded.last_updated
+        },
+        where=BoxComponent.quantity + statement.excluded.quantity <= max_per_box
+    )
+    if db.session.execute(statement).rowcount != 1:
+        return False
+    record_movement(box_id, component_type_id, quantity, reason)
+    return True
+
+def remove_stock(box_id, component_type_id, quantity, reason='remove'):
+    """Take quantity out of a box entry, deleting it once empty, and record the movement.
+
+    Returns False, changing nothing, if the box holds fewer than quantity.
+    """
+    entry = db.and_(BoxComponent.box_id == box_id, BoxComponent.component_type_id == component_type_id)
+    updated = db.session.execute(
+        db.update(BoxComponent).where(entry, BoxComponent.quantity >= quantity).values(
+            quantity=BoxComponent.quantity - quantity,
+            last_updated=datetime.utcnow()
+        )
+    ).rowcount
+    if not updated:
+        return False
+    db.session.execute(db.delete(BoxComponent).where(entry, BoxComponent.quantity == 0))
+    record_movement(box_id, component_type_id, -quantity, reason)
+    return True
+
+def get_stock(box_id, component_type_id):
+    """Return the current quantity of a component type in a box"""
+    return db.session.query(BoxComponent.quantity).filter_by(
+        box_id=box_id, component_type_id=component_type_id
+    ).scalar() or 0
+
+def is_busy_error(error):
+    message = str(getattr(error, 'orig', error)).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+def begin_write():
+    """Take SQLite's write lock up front, so rows read before the first write cannot change under us"""
+    if db.session.get_bind().dialect.name == 'sqlite':
+        db.session.execute(db.text('BEGIN IMMEDIATE'))
+
+def run_transaction(operation, locked=False):
+    """Run operation(), which must commit, retrying with backoff on SQLite busy errors and StockConflict.
+
+    With locked, every attempt runs under the write lock, for operations that
+    read rows and then write values computed from them. After a StockConflict
+    the retries run under the write lock too, so a busy entry cannot make a
+    planned update lose the race over and over. This is the only place that
+    takes the lock; operations must not call begin_write() themselves.
+    """
+    for attempt in range(BUSY_RETRIES):
+        try:
+            if locked:
+                begin_write()
+            result = operation()
+            break
+        except (OperationalError, StockConflict) as e:
+            db.session.rollback()
+            retryable = isinstance(e, StockConflict) or is_busy_error(e)
+            if not retryable or attempt == BUSY_RETRIES - 1:
+                raise
+            locked = locked or isinstance(e, StockConflict)
+            time.sleep(BUSY_BACKOFF * 2 ** attempt)
+    return result
+
+# Stock ledger
+# Every stock change appends a StockMovement in the same transaction, so
+# BoxComponent always equals the sum of the ledger. Past stock is rebuilt from
+# the nearest stock checkpoint (see models.py) and the movements between it and
+# the requested time, rather than by summing the whole ledger. Checkpoints are
+# taken by StockCheckpointer on a background thread, outside any request's
+# transaction.
+MOVEMENT_REASONS = ('opening', 'add', 'remove', 'transfer_in', 'transfer_out', 'batch', 'import', 'pick',
+                    'site_out', 'site_in', 'site_revert', 'scan')
+
+# Movement times never decrease with id (see STOCK_LEDGER_DDL in models.py), so
+# the primary key doubles as the ledger order
+MOVEMENT_SORTS = {
+    'id': StockMovement.id,
+}
+
+def record_movement(box_id, component_type_id, delta, reason):
+    """Append one movement to the ledger in the current transaction"""
+    db.session.execute(db.insert(StockMovement).values(
+        box_id=box_id,
+        component_type_id=component_type_id,
+        delta=delta,
+        reason=reason,
+        created_at=datetime.utcnow()
+    ))
+    count_stock_movements(db.session, 1)
+    db.session.info['stock_moved'] = True
+
+def get_stock_as_of(at, box_id=None, component_type_id=None):
+    """Return {(box_id, component_type_id): quantity} as the stock stood at time at.
+
+    Starts from whichever checkpoint is nearer in the ledger, adding the
+    movements after an earlier one or taking back those up to a later one. It
+    reads one checkpoint (one box of it when box_id is given) and about half a
+    checkpoint interval of movements at most, however long the ledger is.
+    """
+    # Core rows straight off the connection; ORM rows would cost more than the queries
+    connection = db.session.connection()
+    # created_at follows id order, so the newest movement at or before at is
+    # also the one with the highest id, found with one seek of the time index
+    last_movement_id = connection.execute(
+        db.select(StockMovement.id).where(StockMovement.created_at <= at)
+        .order_by(StockMovement.created_at.desc(), StockMovement.id.desc()).limit(1)
+    ).scalar()
+    if last_movement_id is None:
+        return {}
+
+    checkpoints = db.select(StockCheckpoint.id, StockCheckpoint.last_movement_id).limit(1)
+    earlier = connection.execute(checkpoints.where(
+        StockCheckpoint.last_movement_id <= last_movement_id
+    ).order_by(StockCheckpoint.last_movement_id.desc())).first()
+    later = connection.execute(checkpoints.where(
+        StockCheckpoint.last_movement_id > last_movement_id
+    ).order_by(StockCheckpoint.last_movement_id)).first()
+    after_id = earlier.last_movement_id if earlier else 0
+    if later and later.last_movement_id - last_movement_id < last_movement_id - after_id:
+        checkpoint_id, after_id, up_to_id, sign = later.id, last_movement_id, later.last_movement_id, -1
+    else:
+        checkpoint_id, up_to_id, sign = earlier.id if earlier else None, last_movement_id, 1
+
+    stock = {}
+    if checkpoint_id is not None:
+        boxes = db.select(
+            StockCheckpointBox.box_id, StockCheckpointBox.component_type_ids, StockCheckpointBox.quantities
+        ).where(StockCheckpointBox.checkpoint_id == checkpoint_id)
+        if box_id is not None:
+            boxes = boxes.where(StockCheckpointBox.box_id == box_id)
+        for item_box_id, component_type_ids, quantities in connection.execute(boxes):
+            component_type_ids, quantities = unpack_checkpoint_box(component_type_ids, quantities)
+            if component_type_id is None:
+                stock.update(zip(zip(repeat(item_box_id), component_type_ids), quantities))
+            elif component_type_id in component_type_ids:
+                stock[(item_box_id, component_type_id)] = quantities[component_type_ids.index(component_type_id)]
+
+    movements = db.select(StockMovement.box_id, StockMovement.component_type_id, StockMovement.delta).where(
+        StockMovement.id > after_id, StockMovement.id <= up_to_id
+    )
+    if box_id is not None:
+        movements = movements.where(StockMovement.box_id == box_id)
+    if component_type_id is not None:
+        movements = movements.where(StockMovement.component_type_id == component_type_id)
+    replayed = set()
+    for movement_box_id, movement_type_id, delta in connection.execute(movements):
+        key = (movement_box_id, movement_type_id)
+        stock[key] = stock.get(key, 0) + sign * delta
+        replayed.add(key)
+    # Checkpoints hold no empty entries, so only replayed ones can have reached zero
+    for key in replayed:
+        if not stock[key]:
+            del stock[key]
+    return stock
+
+class StockCheckpointer:
+    """Takes stock checkpoints on one background thread once enough movements have been committed.
+
+    Commits report how many movements they wrote to each database, so whether
+    one is due is decided from counts in memory. Other processes write
+    movements too, so the thread checks the real gap under the write lock
+    before copying anything.
+    """
+
+    def __init__(self):
+        self.failed = 0
+        self._counts = Counter()
+        self._intervals = {}  # engine: movements between its checkpoints, once known
+        self._due = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def committed(self, movements):
+        """Count the movements of one commit, {engine: count}"""
+        with self._lock:
+            self._counts.update(movements)
+            for engine in movements:
+                if self._counts[engine] >= self._intervals.get(engine, STOCK_CHECKPOINT_INTERVAL):
+                    self._counts[engine] = 0
+                    self._due.add(engine)
+            if not self._due:
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stock-checkpointer', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            with self._lock:
+                due, self._due = self._due, set()
+            for engine in due:
+                try:
+                    with engine.begin() as connection:
+                        interval = checkpoint_stock_if_due(connection)
+                except SQLAlchemyError:
+                    self.failed += 1
+                    app.logger.exception('Stock checkpoint of %s failed', engine.url)
+                    # The next commit to this database tries again
+                    interval = 0
+                with self._lock:
+                    self._intervals[engine] = interval
+
+stock_checkpointer = StockCheckpointer()
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _count_committed_movements(session):
+    movements = session.info.pop('stock_movements', None)
+    if movements:
+        stock_checkpointer.committed(movements)
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_stock_movements(session):
+    session.info.pop('stock_movements', None)
+
+# HTTP caching
+# Read-heavy views carry a strong ETag built from the catalog version and a
+# stock version, and answer a matching If-None-Match with 304 before the view
+# runs, so an unchanged page costs one small query and no ORM loading or
+# template rendering. Every stock change appends a movement, so the newest
+# movement id (of one box, or of all of them) serves as the stock version.
+HTTP_CACHE_CONTROL = 'no-cache'  # browsers may keep a copy but must revalidate it
+BOX_CARD_CACHE_SIZE = 2048
+
+def _release_id():
+    """Identify the deployed code and templates, so an upgrade changes every ETag"""
+    template_dir = os.path.join(app.root_path, app.template_folder)
+    paths = [__file__] + [os.path.join(template_dir, name) for name in sorted(os.listdir(template_dir))]
+    stamps = [(os.path.basename(path), os.stat(path).st_mtime_ns) for path in paths]
+    return '%08x' % zlib.crc32(repr(stamps).encode())
+
+RELEASE_ID = os.environ.get('RELEASE_ID') or _release_id()
+
+def get_versions(box_id=None):
+    """Return (catalog version, stock version) in one query; the stock version is box_id's when given"""
+    stock_version = db.select(db.func.coalesce(db.func.max(StockMovement.id), 0))
+    if box_id is not None:
+        stock_version = stock_version.where(StockMovement.box_id == box_id)
+    return tuple(db.session.execute(db.select(
+        db.select(CatalogVersion.version).where(CatalogVersion.id == 1).scalar_subquery(),
+        stock_version.scalar_subquery()
+    )).one())
+
+def get_box_versions(box_ids):
+    """Return {box_id: stock version} for the boxes that have any movements, from one index walk"""
+    rows = db.session.query(StockMovement.box_id, db.func.max(StockMovement.id)).filter(
+        StockMovement.box_id.in_(box_ids)
+    ).group_by(StockMovement.box_id)
+    return dict(rows.all())
+
+def make_etag(endpoint, versions):
+    key = repr((RELEASE_ID, endpoint, versions, sorted(request.args.items(multi=True))))
+    return hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+
+def conditional(box_arg=None):
+    """Serve a view with a version ETag, answering If-None-Match with 304 without running it.
+
+    box_arg names the view argument holding a box id, for views that only show
+    that box's stock. The versions are left in g.versions for the view.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            g.versions = get_versions(kwargs[box_arg] if box_arg else None)
+            # Pending flash messages make the page a one-off
+            if session.get('_flashes'):
+                return view(*args, **kwargs)
+            etag = make_etag(request.endpoint, g.versions)
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = HTTP_CACHE_CONTROL
+            return response
+        return wrapper
+    return decorator
+
+class FragmentCache:
+    """Thread-safe LRU of rendered template fragments; keys carry their versions, so entries never go stale"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return fragment
+
+    def set(self, key, fragment):
+        with self._lock:
+            self._entries[key] = fragment
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+box_card_cache = FragmentCache(BOX_CARD_CACHE_SIZE)
+
+def render_box_cards(boxes, catalog_version):
+    """Return {box_id: rendered card}, rendering only the boxes whose stock or catalog version moved on"""
+    versions = get_box_versions([box.id for box in boxes])
+    keys = {box.id: (box.id, catalog_version, versions.get(box.id, 0)) for box in boxes}
+    cards = {box_id: box_card_cache.get(key) for box_id, key in keys.items()}
+    stale = [box for box in boxes if cards[box.id] is None]
+    if stale:
+        stale_ids = [box.id for box in stale]
+        box_stats = get_box_stats(stale_ids)
+        top_components = get_top_box_components(box_ids=stale_ids)
+        render_box_card = get_template_attribute('box_card.html', 'render_box_card')
+        for box in stale:
+            cards[box.id] = render_box_card(box, box_stats.get(box.id, {}).get('component_types', 0),
+                                            top_components.get(box.id, []))
+            box_card_cache.set(keys[box.id], cards[box.id])
+    return cards
 
 # Routes
 @app.route('/')
+@read_only
+@conditional()
 def index():
-    boxes = Box.query.all()
-    return render_template('index.html', boxes=boxes)
+    boxes = get_all_boxes()
+    box_stats = get_box_stats()
+    component_count = len(get_all_component_types())
+    total_items = sum(stats['total_items'] for stats in box_stats.values())
+    return render_template('index.html', boxes=boxes, box_stats=box_stats,
+                           component_count=component_count, total_items=total_items)
 
 @app.route('/boxes')
+@read_only
+@conditional()
 def boxes():
-    boxes = Box.query.all()
-    return render_template('boxes.html', boxes=boxes)
+    try:
+        page = paginate(Box.query, BOX_SORTS, Box.id, 'name')
+    except ValueError:
+        abort(400)
+    boxes = page['items']
+    box_cards = render_box_cards(boxes, catalog_version=g.versions[0])
+    return render_template('boxes.html', boxes=boxes, page=page, box_cards=box_cards)
 
 @app.route('/box/<int:box_id>')
+@read_only
+@conditional(box_arg='box_id')
 def view_box(box_id):
-    box = Box.query.get_or_404(box_id)
+    box = get_box(box_id) or abort(404)
     components = db.session.query(BoxComponent, ComponentType).join(ComponentType).filter(BoxComponent.box_id == box_id).all()
     return render_template('box_detail.html', box=box, components=components)
 
 @app.route('/components')
+@read_only
+@conditional()
 def components():
-    component_types = ComponentType.query.all()
-    return render_template('components.html', component_types=component_types)
+    try:
+        page = paginate(stock_summary_query(), COMPONENT_TYPE_SORTS, ComponentType.id, 'name')
+    except ValueError:
+        abort(400)
+    return render_template('components.html', component_types=page['items'], page=page,
+                           box_count=db.session.query(Box).count())
 
 @app.route('/add_box', methods=['GET', 'POST'])
 def add_box():
@@ -64,7 +1144,7 @@ def add_box():
         name = request.form['name']
         description = request.form.get('description', '')
         
-        if Box.query.filter_by(name=name).first():
+        if get_box_by_name(name):
             flash('Box name already exists!', 'error')
             return render_template('add_box.html')
         
@@ -84,7 +1164,7 @@ def add_component_type():
         max_per_box = int(request.form['max_per_box'])
         category = request.form.get('category', '')
         
-        if ComponentType.query.filter_by(name=name).first():
+        if get_component_type_by_name(name):
             flash('Component type already exists!', 'error')
             return render_template('add_component_type.html')
         
@@ -103,10 +1183,15 @@ def add_component_type():
 
 @app.route('/manage_inventory/<int:box_id>')
 def manage_inventory(box_id):
-    box = Box.query.get_or_404(box_id)
-    component_types = ComponentType.query.all()
-    current_components = {bc.component_type_id: bc.quantity for bc in box.components}
-    return render_template('manage_inventory.html', box=box, component_types=component_types, current_components=current_components)
+    box = get_box(box_id) or abort(404)
+    component_types = get_all_component_types()
+    current_components = dict(db.session.query(BoxComponent.component_type_id, BoxComponent.quantity).filter(
+        BoxComponent.box_id == box_id
+    ).order_by(BoxComponent.id))
+    catalog = get_component_types_by_id(current_components)
+    box_components = [(catalog[component_type_id], quantity) for component_type_id, quantity in current_components.items()]
+    return render_template('manage_inventory.html', box=box, component_types=component_types,
+                           current_components=current_components, box_components=box_components)
 
 @app.route('/api/add_component', methods=['POST'])
 def api_add_component():
@@ -118,36 +1203,23 @@ def api_add_component():
         if quantity <= 0:
             return jsonify({'success': False, 'message': 'Quantity must be positive'})
         
-        box = Box.query.get_or_404(box_id)
-        component_type = ComponentType.query.get_or_404(component_type_id)
+        box = get_box(box_id) or abort(404)
+        component_type = get_component_type(component_type_id) or abort(404)
         
-        # Check if component already exists in box
-        box_component = BoxComponent.query.filter_by(box_id=box_id, component_type_id=component_type_id).first()
-        
-        if box_component:
-            new_quantity = box_component.quantity + quantity
-        else:
-            new_quantity = quantity
+        def add():
+            added = add_stock(box_id, component_type_id, quantity)
+            if added:
+                evaluate_alerts([(box_id, component_type_id)])
+            db.session.commit()
+            return added
         
-        # Check capacity limit
-        if new_quantity > component_type.max_per_box:
+        # The capacity limit is enforced by the upsert itself
+        if not run_transaction(add):
             return jsonify({
                 'success': False, 
-                'message': f'Cannot add {quantity} {component_type.name}(s). Maximum allowed: {component_type.max_per_box}, Current: {box_component.quantity if box_component else 0}'
+                'message': f'Cannot add {quantity} {component_type.name}(s). Maximum allowed: {component_type.max_per_box}, Current: {get_stock(box_id, component_type_id)}'
             })
         
-        if box_component:
-            box_component.quantity = new_quantity
-            box_component.last_updated = datetime.utcnow()
-        else:
-            box_component = BoxComponent(
-                box_id=box_id,
-                component_type_id=component_type_id,
-                quantity=new_quantity
-            )
-            db.session.add(box_component)
-        
-        db.session.commit()
         return jsonify({'success': True, 'message': f'Added {quantity} {component_type.name}(s) to {box.name}'})
         
     except Exception as e:
@@ -164,25 +1236,22 @@ def api_remove_component():
         if quantity <= 0:
             return jsonify({'success': False, 'message': 'Quantity must be positive'})
         
-        box_component = BoxComponent.query.filter_by(box_id=box_id, component_type_id=component_type_id).first()
-        
-        if not box_component:
-            return jsonify({'success': False, 'message': 'Component not found in box'})
+        def remove():
+            removed = remove_stock(box_id, component_type_id, quantity)
+            if removed:
+                evaluate_alerts([(box_id, component_type_id)])
+            db.session.commit()
+            return removed
         
-        if box_component.quantity < quantity:
-            return jsonify({'success': False, 'message': f'Cannot remove {quantity} items. Only {box_component.quantity} available'})
+        # The availability check is part of the UPDATE, which also drops emptied entries
+        if not run_transaction(remove):
+            available = get_stock(box_id, component_type_id)
+            if not available:
+                return jsonify({'success': False, 'message': 'Component not found in box'})
+            return jsonify({'success': False, 'message': f'Cannot remove {quantity} items. Only {available} available'})
         
-        box_component.quantity -= quantity
-        box_component.last_updated = datetime.utcnow()
-        
-        # Remove component entry if quantity becomes 0
-        if box_component.quantity == 0:
-            db.session.delete(box_component)
-        
-        db.session.commit()
-        
-        component_type = ComponentType.query.get(component_type_id)
-        box = Box.query.get(box_id)
+        component_type = get_component_type(component_type_id)
+        box = get_box(box_id)
         return jsonify({'success': True, 'message': f'Removed {quantity} {component_type.name}(s) from {box.name}'})
         
     except Exception as e:
@@ -190,21 +1259,34 @@ def api_remove_component():
         return jsonify({'success': False, 'message': str(e)})
 
 @app.route('/transfer')
+@read_only
 def transfer():
-    boxes = Box.query.all()
-    return render_template('transfer.html', boxes=boxes)
+    try:
+        page = paginate(Box.query, BOX_SORTS, Box.id, 'name')
+    except ValueError:
+        abort(400)
+    return render_template('transfer.html', boxes=page['items'], page=page)
 
 @app.route('/api/get_box_components/<int:box_id>')
+@read_only
+@conditional(box_arg='box_id')
 def api_get_box_components(box_id):
-    components = db.session.query(BoxComponent, ComponentType).join(ComponentType).filter(BoxComponent.box_id == box_id).all()
+    query = db.session.query(BoxComponent, ComponentType).join(ComponentType).filter(BoxComponent.box_id == box_id)
+    try:
+        page = paginate(query, BOX_COMPONENT_SORTS, BoxComponent.id, 'name')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
     result = []
-    for box_component, component_type in components:
+    for box_component, component_type in page['items']:
         result.append({
             'id': component_type.id,
             'name': component_type.name,
-            'quantity': box_component.quantity
+            'category': component_type.category,
+            'quantity': box_component.quantity,
+            'last_updated': box_component.last_updated.isoformat() if box_component.last_updated else None
         })
-    return jsonify(result)
+    return jsonify({'items': result, 'next': page['next_cursor'], 'prev': page['prev_cursor']})
 
 @app.route('/api/transfer_component', methods=['POST'])
 def api_transfer_component():
@@ -220,46 +1302,32 @@ def api_transfer_component():
         if quantity <= 0:
             return jsonify({'success': False, 'message': 'Quantity must be positive'})
         
-        # Get components and validate
-        from_component = BoxComponent.query.filter_by(box_id=from_box_id, component_type_id=component_type_id).first()
-        if not from_component or from_component.quantity < quantity:
-            return jsonify({'success': False, 'message': 'Insufficient quantity in source box'})
+        component_type = get_component_type(component_type_id) or abort(404)
         
-        component_type = ComponentType.query.get(component_type_id)
-        to_component = BoxComponent.query.filter_by(box_id=to_box_id, component_type_id=component_type_id).first()
+        # Perform atomic transfer: both conditional statements succeed or
+        # the transaction is rolled back
+        def move():
+            if not remove_stock(from_box_id, component_type_id, quantity, reason='transfer_out'):
+                db.session.rollback()
+                return 'source'
+            if not add_stock(to_box_id, component_type_id, quantity, reason='transfer_in'):
+                db.session.rollback()
+                return 'destination'
+            evaluate_alerts([(from_box_id, component_type_id), (to_box_id, component_type_id)])
+            db.session.commit()
+            return None
         
-        # Check capacity in destination box
-        current_in_dest = to_component.quantity if to_component else 0
-        if current_in_dest + quantity > component_type.max_per_box:
+        failure = run_transaction(move)
+        if failure == 'source':
+            return jsonify({'success': False, 'message': 'Insufficient quantity in source box'})
+        if failure == 'destination':
             return jsonify({
                 'success': False, 
-                'message': f'Transfer would exceed capacity. Max: {component_type.max_per_box}, Current in destination: {current_in_dest}'
+                'message': f'Transfer would exceed capacity. Max: {component_type.max_per_box}, Current in destination: {get_stock(to_box_id, component_type_id)}'
             })
         
-        # Perform atomic transfer
-        # Remove from source
-        from_component.quantity -= quantity
-        if from_component.quantity == 0:
-            db.session.delete(from_component)
-        else:
-            from_component.last_updated = datetime.utcnow()
-        
-        # Add to destination
-        if to_component:
-            to_component.quantity += quantity
-            to_component.last_updated = datetime.utcnow()
-        else:
-            to_component = BoxComponent(
-                box_id=to_box_id,
-                component_type_id=component_type_id,
-                quantity=quantity
-            )
-            db.session.add(to_component)
-        
-        db.session.commit()
-        
-        from_box = Box.query.get(from_box_id)
-        to_box = Box.query.get(to_box_id)
+        from_box = get_box(from_box_id)
+        to_box = get_box(to_box_id)
         return jsonify({
             'success': True, 
             'message': f'Transferred {quantity} {component_type.name}(s) from {from_box.name} to {to_box.name}'
@@ -269,18 +1337,449 @@ def api_transfer_component():
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/api/stock_as_of')
+@read_only
+def api_stock_as_of():
+    try:
+        at = datetime.fromisoformat(request.args['at'])
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'message': 'at must be an ISO 8601 timestamp'}), 400
+    box_id = request.args.get('box_id', type=int)
+    component_type_id = request.args.get('component_type_id', type=int)
+
+    stock = get_stock_as_of(at, box_id=box_id, component_type_id=component_type_id)
+    items = [
+        {'box_id': item_box_id, 'component_type_id': item_type_id, 'quantity': quantity}
+        for (item_box_id, item_type_id), quantity in sorted(stock.items())
+    ]
+    return jsonify({'at': at.isoformat(), 'items': items})
+
+@app.route('/api/movements')
+@read_only
+def api_movements():
+    query = db.session.query(StockMovement)
+    box_id = request.args.get('box_id', type=int)
+    component_type_id = request.args.get('component_type_id', type=int)
+    if box_id is not None:
+        query = query.filter(StockMovement.box_id == box_id)
+    if component_type_id is not None:
+        query = query.filter(StockMovement.component_type_id == component_type_id)
+    try:
+        page = paginate(query, MOVEMENT_SORTS, StockMovement.id, 'id')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    result = []
+    for movement in page['items']:
+        result.append({
+            'id': movement.id,
+            'box_id': movement.box_id,
+            'component_type_id': movement.component_type_id,
+            'delta': movement.delta,
+            'reason': movement.reason,
+            'created_at': movement.created_at.isoformat()
+        })
+    return jsonify({'items': result, 'next': page['next_cursor'], 'prev': page['prev_cursor']})
+
+# Batch inventory operations
+MAX_BATCH_OPERATIONS = 1000
+BATCH_MODES = ('all_or_nothing', 'per_item')
+
+def parse_batch_operation(raw):
+    """Validate the shape of one batch operation, raising ValueError with a user-facing message"""
+    if not isinstance(raw, dict):
+        raise ValueError('Operation must be an object')
+    op = raw.get('op')
+    if op not in ('add', 'remove', 'transfer'):
+        raise ValueError(f"Unknown operation '{op}'")
+    try:
+        operation = {
+            'op': op,
+            'component_type_id': int(raw['component_type_id']),
+            'quantity': int(raw['quantity'])
+        }
+        if op == 'transfer':
+            operation['from_box_id'] = int(raw['from_box_id'])
+            operation['to_box_id'] = int(raw['to_box_id'])
+        else:
+            operation['box_id'] = int(raw['box_id'])
+    except KeyError as e:
+        raise ValueError(f'Missing field {e}') from e
+    except (TypeError, ValueError) as e:
+        raise ValueError('Fields must be integers') from e
+
+    if operation['quantity'] <= 0:
+        raise ValueError('Quantity must be positive')
+    if op == 'transfer' and operation['from_box_id'] == operation['to_box_id']:
+        raise ValueError('Cannot transfer to the same box')
+    return operation
+
+def plan_batch(operations):
+    """Validate parsed operations against pre-fetched rows without touching the database.
+
+    Boxes, component types and the affected BoxComponent rows are loaded with
+    one query each, then every operation is checked in order against a running
+    in-memory copy of the stock. Returns (results, stock, box_components) where
+    results holds a per-operation outcome (None marks a valid operation), stock
+    maps (box_id, component_type_id) to the quantity after all valid operations
+    and box_components maps the same keys to the rows that already exist.
+    """
+    box_ids = set()
+    component_type_ids = set()
+    pairs = set()
+    for operation in operations:
+        if operation is None:
+            continue
+        component_type_id = operation['component_type_id']
+        component_type_ids.add(component_type_id)
+        for key in ('box_id', 'from_box_id', 'to_box_id'):
+            if key in operation:
+                box_ids.add(operation[key])
+                pairs.add((operation[key], component_type_id))
+
+    boxes = get_boxes_by_id(box_ids)
+    component_types = get_component_types_by_id(component_type_ids)
+    box_components = {
+        (box_component.box_id, box_component.component_type_id): box_component
+        for box_component in BoxComponent.query.filter(
+            db.tuple_(BoxComponent.box_id, BoxComponent.component_type_id).in_(pairs)
+        )
+    } if pairs else {}
+    stock = {key: box_component.quantity for key, box_component in box_components.items()}
+
+    results = []
+    for operation in operations:
+        if operation is None:
+            results.append(None)
+            continue
+        results.append(_plan_operation(operation, boxes, component_types, stock))
+    return results, stock, box_components
+
+def _plan_operation(operation, boxes, component_types, stock):
+    """Apply one operation to the in-memory stock, returning (success, message)"""
+    component_type = component_types.get(operation['component_type_id'])
+    if component_type is None:
+        return False, 'Component type not found'
+    quantity = operation['quantity']
+
+    if operation['op'] == 'transfer':
+        from_box = boxes.get(operation['from_box_id'])
+        to_box = boxes.get(operation['to_box_id'])
+        if from_box is None or to_box is None:
+            return False, 'Box not found'
+        from_key = (from_box.id, component_type.id)
+        to_key = (to_box.id, component_type.id)
+        if stock.get(from_key, 0) < quantity:
+            return False, 'Insufficient quantity in source box'
+        current_in_dest = stock.get(to_key, 0)
+        if current_in_dest + quantity > component_type.max_per_box:
+            return False, f'Transfer would exceed capacity. Max: {component_type.max_per_box}, Current in destination: {current_in_dest}'
+        stock[from_key] -= quantity
+        stock[to_key] = current_in_dest + quantity
+        return True, f'Transferred {quantity} {component_type.name}(s) from {from_box.name} to {to_box.name}'
+
+    box = boxes.get(operation['box_id'])
+    if box is None:
+        return False, 'Box not found'
+    key = (box.id, component_type.id)
+    current = stock.get(key, 0)
+
+    if operation['op'] == 'add':
+        if current + quantity > component_type.max_per_box:
+            return False, f'Cannot add {quantity} {component_type.name}(s). Maximum allowed: {component_type.max_per_box}, Current: {current}'
+        stock[key] = current + quantity
+        return True, f'Added {quantity} {component_type.name}(s) to {box.name}'
+
+    if not current:
+        return False, 'Component not found in box'
+    if current < quantity:
+        return False, f'Cannot remove {quantity} items. Only {current} available'
+    stock[key] = current - quantity
+    return True, f'Removed {quantity} {component_type.name}(s) from {box.name}'
+
+def apply_stock(stock, box_components, reason='batch'):
+    """Write the planned quantities back as net deltas through the conditional stock updates.
+
+    Raises StockConflict if another writer changed an entry since it was
+    planned, so the caller can roll back and plan again.
+    """
+    for key, quantity in stock.items():
+        box_component = box_components.get(key)
+        delta = quantity - (box_component.quantity if box_component else 0)
+        if delta > 0 and not add_stock(*key, delta, reason=reason):
+            raise StockConflict()
+        if delta < 0 and not remove_stock(*key, -delta, reason=reason):
+            raise StockConflict()
+    evaluate_alerts(stock)
+
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    try:
+        payload = request.get_json(silent=True) or {}
+        raw_operations = payload.get('operations')
+        mode = payload.get('mode', 'all_or_nothing')
+
+        if mode not in BATCH_MODES:
+            return jsonify({'success': False, 'message': f"Mode must be one of: {', '.join(BATCH_MODES)}"})
+        if not isinstance(raw_operations, list) or not raw_operations:
+            return jsonify({'success': False, 'message': 'Operations must be a non-empty list'})
+        if len(raw_operations) > MAX_BATCH_OPERATIONS:
+            return jsonify({'success': False, 'message': f'At most {MAX_BATCH_OPERATIONS} operations per batch'})
+
+        operations = []
+        parse_errors = {}
+        for index, raw in enumerate(raw_operations):
+            try:
+                operations.append(parse_batch_operation(raw))
+            except ValueError as e:
+                operations.append(None)
+                parse_errors[index] = str(e)
+
+        def run_batch():
+            planned, stock, box_components = plan_batch(operations)
+            results = []
+            for index, outcome in enumerate(planned):
+                success, message = outcome if outcome else (False, parse_errors[index])
+                results.append({'index': index, 'success': success, 'message': message})
+
+            failed = sum(1 for result in results if not result['success'])
+            if failed and mode == 'all_or_nothing':
+                db.session.rollback()
+                for result in results:
+                    if result['success']:
+                        result['success'] = False
+                        result['message'] = 'Not applied: another operation in the batch failed'
+                return results, failed, 0
+
+            # stock only reflects operations that passed, so failed ones are never written
+            apply_stock(stock, box_components)
+            db.session.commit()
+            return results, failed, len(results) - failed
+
+        results, failed, applied = run_transaction(run_batch)
+        return jsonify({'success': failed == 0, 'mode': mode, 'applied': applied, 'failed': failed, 'results': results})
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)})
+
+# Pick planning
+# plan_pick() allocates a bill of materials across the boxes that hold it,
+# touching as few boxes as it can. Choosing the fewest boxes is a set cover
+# problem, so it takes the greedy route: repeatedly pick the box supplying the
+# most still-needed units, then drop any chosen box whose share the others can
+# absorb. Stock comes from one query over the component_type_id index, limited
+# to the types in the bill, so the cost follows the holders of those types
+# rather than the size of the inventory.
+MAX_PICK_ITEMS = 200
+MAX_PICK_KITS = 1000
+
+def parse_pick_request(payload):
+    """Validate a plan_pick payload, returning ({component_type_id: quantity per kit}, kits, target_box_id)"""
+    items = payload.get('items')
+    if not isinstance(items, list) or not items:
+        raise ValueError('Items must be a non-empty list')
+    if len(items) > MAX_PICK_ITEMS:
+        raise ValueError(f'At most {MAX_PICK_ITEMS} items per bill of materials')
+    try:
+        bill = {}
+        for item in items:
+            component_type_id = int(item['component_type_id'])
+            bill[component_type_id] = bill.get(component_type_id, 0) + int(item['quantity'])
+        kits = int(payload.get('kits', 1))
+        target_box_id = payload.get('target_box_id')
+        target_box_id = int(target_box_id) if target_box_id is not None else None
+    except KeyError as e:
+        raise ValueError(f'Missing field {e}') from e
+    except (TypeError, ValueError) as e:
+        raise ValueError('Fields must be integers') from e
+    if any(quantity <= 0 for quantity in bill.values()):
+        raise ValueError('Quantity must be positive')
+    if not 1 <= kits <= MAX_PICK_KITS:
+        raise ValueError(f'Kits must be between 1 and {MAX_PICK_KITS}')
+    return bill, kits, target_box_id
+
+def plan_pick(bill, kits=1, target_box_id=None):
+    """Allocate kits copies of bill ({component_type_id: quantity}) from current stock.
+
+    Stock already in target_box_id counts towards the bill and is never picked
+    from, and the target must be able to hold each line within max_per_box.
+    Returns {'feasible', 'picks': {box_id: {component_type_id: quantity}},
+    'shortfall': {component_type_id: missing}, 'over_capacity': [component_type_id]}.
+    Raises ValueError for an unknown component type or target box.
+    """
+    component_types = get_component_types_by_id(bill)
+    unknown = sorted(set(bill) - set(component_types))
+    if unknown:
+        raise ValueError(f'Component type {unknown[0]} not found')
+    if target_box_id is not None and get_box(target_box_id) is None:
+        raise ValueError('Target box not found')
+
+    required = {component_type_id: quantity * kits for component_type_id, quantity in bill.items()}
+    in_target = {}
+    if target_box_id is not None:
+        in_target = dict(db.session.query(BoxComponent.component_type_id, BoxComponent.quantity).filter(
+            BoxComponent.box_id == target_box_id, BoxComponent.component_type_id.in_(required)
+        ).all())
+    over_capacity = sorted(
+        component_type_id for component_type_id, quantity in required.items()
+        if target_box_id is not None and quantity > max(component_types[component_type_id].max_per_box,
+                                                        in_target.get(component_type_id, 0))
+    )
+    remaining = {
+        component_type_id: quantity - in_target.get(component_type_id, 0)
+        for component_type_id, quantity in required.items() if quantity > in_target.get(component_type_id, 0)
+    }
+
+    holdings = {}
+    if remaining:
+        rows = db.session.query(BoxComponent.box_id, BoxComponent.component_type_id, BoxComponent.quantity).filter(
+            BoxComponent.component_type_id.in_(remaining), BoxComponent.quantity > 0
+        )
+        if target_box_id is not None:
+            rows = rows.filter(BoxComponent.box_id != target_box_id)
+        for box_id, component_type_id, quantity in rows:
+            holdings.setdefault(box_id, {})[component_type_id] = quantity
+
+    def gain(box_id):
+        return sum(min(quantity, remaining[component_type_id])
+                   for component_type_id, quantity in holdings[box_id].items())
+
+    # Lazy greedy: a box's gain only shrinks as others are chosen, so a stale
+    # heap entry is an upper bound and only the top one needs recomputing
+    picks = {}
+    heap = [(-gain(box_id), box_id) for box_id in holdings]
+    heapq.heapify(heap)
+    while heap and any(remaining.values()):
+        _, box_id = heapq.heappop(heap)
+        box_gain = gain(box_id)
+        if not box_gain:
+            continue
+        if heap and box_gain < -heap[0][0]:
+            heapq.heappush(heap, (-box_gain, box_id))
+            continue
+        for component_type_id, quantity in holdings[box_id].items():
+            taken = min(quantity, remaining[component_type_id])
+            if taken:
+                picks.setdefault(box_id, {})[component_type_id] = taken
+                remaining[component_type_id] -= taken
+
+    # Greedy can leave a box whose share the other chosen boxes have spare stock for
+    for box_id in sorted(picks, key=lambda box_id: sum(picks[box_id].values())):
+        others = [other for other in picks if other != box_id]
+        spare = {
+            component_type_id: sum(holdings[other].get(component_type_id, 0) - picks[other].get(component_type_id, 0)
+                                   for other in others)
+            for component_type_id in picks[box_id]
+        }
+        if all(spare[component_type_id] >= quantity for component_type_id, quantity in picks[box_id].items()):
+            for component_type_id, quantity in picks.pop(box_id).items():
+                for other in others:
+                    taken = min(quantity, holdings[other].get(component_type_id, 0) - picks[other].get(component_type_id, 0))
+                    if taken:
+                        picks[other][component_type_id] = picks[other].get(component_type_id, 0) + taken
+                        quantity -= taken
+
+    shortfall = {component_type_id: missing for component_type_id, missing in remaining.items() if missing}
+    return {
+        'feasible': not shortfall and not over_capacity,
+        'picks': picks,
+        'shortfall': shortfall,
+        'over_capacity': over_capacity,
+    }
+
+def pick_transfers(picks, target_box_id):
+    """The batch transfer operations that carry out a plan's picks"""
+    return [
+        {'op': 'transfer', 'from_box_id': box_id, 'to_box_id': target_box_id,
+         'component_type_id': component_type_id, 'quantity': quantity}
+        for box_id, items in sorted(picks.items())
+        for component_type_id, quantity in sorted(items.items())
+    ]
+
+@app.route('/api/plan_pick', methods=['POST'])
+def api_plan_pick():
+    payload = request.get_json(silent=True) or {}
+    try:
+        bill, kits, target_box_id = parse_pick_request(payload)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    execute = bool(payload.get('execute'))
+    if execute and target_box_id is None:
+        return jsonify({'success': False, 'message': 'target_box_id is required to execute a plan'}), 400
+
+    def plan_and_execute():
+        plan = plan_pick(bill, kits, target_box_id)
+        if not execute or not plan['feasible'] or not plan['picks']:
+            db.session.rollback()
+            return plan, False
+        # Planned and applied in one transaction, so the stock cannot move in between
+        results, stock, box_components = plan_batch(pick_transfers(plan['picks'], target_box_id))
+        if not all(success for success, _ in results):
+            raise StockConflict()
+        apply_stock(stock, box_components, reason='pick')
+        db.session.commit()
+        return plan, True
+
+    try:
+        plan, executed = run_transaction(plan_and_execute)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except StockConflict:
+        return jsonify({'success': False, 'message': 'Stock kept changing while the pick was applied, try again'}), 409
+
+    boxes = get_boxes_by_id(plan['picks'])
+    component_types = get_component_types_by_id(bill)
+    response = {
+        'success': plan['feasible'],
+        'feasible': plan['feasible'],
+        'executed': executed,
+        'kits': kits,
+        'target_box_id': target_box_id,
+        'boxes_touched': len(plan['picks']),
+        'picks': [
+            {'box_id': box_id, 'box_name': boxes[box_id].name, 'items': [
+                {'component_type_id': component_type_id, 'name': component_types[component_type_id].name,
+                 'quantity': quantity}
+                for component_type_id, quantity in sorted(items.items())
+            ]}
+            for box_id, items in sorted(plan['picks'].items())
+        ],
+        'shortfall': [
+            {'component_type_id': component_type_id, 'name': component_types[component_type_id].name,
+             'missing': missing}
+            for component_type_id, missing in sorted(plan['shortfall'].items())
+        ],
+        'over_capacity': [
+            {'component_type_id': component_type_id, 'name': component_types[component_type_id].name,
+             'max_per_box': component_types[component_type_id].max_per_box}
+            for component_type_id in plan['over_capacity']
+        ],
+    }
+    if execute and not plan['feasible']:
+        response['message'] = 'Not enough stock or box capacity for this pick, nothing was moved'
+    return jsonify(response)
+
 @app.route('/search')
+@read_only
 def search():
     query = request.args.get('q', '')
     results = []
+    page = None
+    match = build_search_match(query) if query else None
     
-    if query:
+    if match:
         # Search for components across all boxes
-        components = db.session.query(BoxComponent, ComponentType, Box).join(ComponentType).join(Box).filter(
-            ComponentType.name.contains(query)
-        ).all()
+        matches = search_matches(match)
+        components = db.session.query(BoxComponent, ComponentType, Box).join(ComponentType).join(Box).join(
+            matches, matches.c.id == ComponentType.id
+        )
+        try:
+            page = paginate(components, dict(SEARCH_SORTS, relevance=matches.c.rank), BoxComponent.id, 'relevance')
+        except ValueError:
+            abort(400)
         
-        for box_component, component_type, box in components:
+        for box_component, component_type, box in page['items']:
             results.append({
                 'component_name': component_type.name,
                 'box_name': box.name,
@@ -288,25 +1787,2333 @@ def search():
                 'quantity': box_component.quantity
             })
     
-    return render_template('search.html', query=query, results=results)
+    return render_template('search.html', query=query, results=results, page=page)
 
-def init_db():
-    """Initialize database with sample data"""
-    db.create_all()
-    
-    # Check if data already exists
-    if ComponentType.query.first():
-        return
-    
-    # Add sample component types based on the Raspberry Pi kit
-    sample_components = [
-        ('Raspberry Pi Pico', 'Main microcontroller board', 1, 'Controllers'),
-        ('IR Tracking Sensor', 'Infrared tracking sensor module', 2, 'Sensors'),
-        ('IR Remote Module', 'Infrared remote control module', 1, 'Controllers'),
-        ('Infrared Remote Control', 'Remote control device', 1, 'Controllers'),
-        ('LED', 'Light emitting diode', 10, 'Electronics'),
-        ('RGB LED', 'Multi-color LED', 5, 'Electronics'),
-        ('Button', 'Push button switch', 5, 'Electronics'),
+@app.route('/api/search')
+@read_only
+def api_search():
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+
+    result = []
+    match = build_search_match(query)
+    if match:
+        matches = search_matches(match)
+        rows = db.session.query(ComponentType, matches.c.rank).join(
+            matches, matches.c.id == ComponentType.id
+        ).order_by(matches.c.rank, ComponentType.id).limit(limit).offset(offset).all()
+
+        for component_type, rank in rows:
+            result.append({
+                'id': component_type.id,
+                'name': component_type.name,
+                'category': component_type.category,
+                'description': component_type.description,
+                'max_per_box': component_type.max_per_box,
+                'score': -rank
+            })
+
+    return jsonify({'query': query, 'limit': limit, 'offset': offset, 'results': result})
+
+# Stock event stream
+# /api/events pushes every stock movement to connected pages as server-sent
+# events, so they can patch their tables in place instead of re-fetching them.
+# One background thread per process tails the movement ledger into a shared
+# ring buffer; subscribers only wait on a condition and read from that buffer,
+# so an idle subscriber costs a blocked thread (or greenlet) and no queries.
+# EVENT_MAX_SUBSCRIBERS caps the open streams, so subscribers can never take
+# every worker away from the rest of the app.
+# Tailing the ledger rather than hooking the routes means changes committed by
+# other processes and bulk imports are seen too, and a reconnecting client
+# resumes from its Last-Event-ID.
+EVENT_BUFFER_SIZE = 2000
+EVENT_POLL_INTERVAL = 1.0  # seconds between ledger polls when nothing was committed in this process
+EVENT_BATCH_LIMIT = 500  # a poll finding more new movements than this sends one reset instead
+EVENT_HEARTBEAT_INTERVAL = 15.0  # seconds
+EVENT_RETRY_AFTER = 30  # seconds a client refused over EVENT_MAX_SUBSCRIBERS is asked to wait
+
+class StockEventBroker:
+    """Recent stock events, fed by a ledger-tailing thread and streamed to a limited number of subscribers"""
+
+    def __init__(self, buffer_size, poll_interval, batch_limit, heartbeat_interval):
+        self.buffer_size = buffer_size
+        self.poll_interval = poll_interval
+        self.batch_limit = batch_limit
+        self.heartbeat_interval = heartbeat_interval
+        self.subscribers = 0
+        self._ids = []
+        self.messages = []
+        self._box_ids = []
+        self._last_id = None
+        # Events up to this movement id are no longer (or were never) buffered
+        self._evicted_through = None
+        self._condition = threading.Condition()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start tailing from the newest movement; called from a request on first use"""
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._last_id = self._evicted_through = db.session.query(db.func.max(StockMovement.id)).scalar() or 0
+            self._thread = threading.Thread(target=self._run, name='stock-events', daemon=True)
+            self._thread.start()
+
+    def subscribe(self, max_subscribers):
+        """Take a subscriber slot, returning False if all max_subscribers are taken; unsubscribe() frees it"""
+        with self._condition:
+            if self.subscribers >= max_subscribers:
+                return False
+            self.subscribers += 1
+            return True
+
+    def unsubscribe(self):
+        with self._condition:
+            self.subscribers -= 1
+
+    def wake(self):
+        """Poll now rather than at the next interval, after this process committed a movement"""
+        self._wake.set()
+
+    def _run(self):
+        with app.app_context():
+            g.read_only = True
+            while True:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                try:
+                    self.poll()
+                except Exception:
+                    app.logger.exception('Polling the stock ledger for events failed')
+                finally:
+                    db.session.remove()
+
+    def poll(self):
+        rows = db.session.query(
+            StockMovement.id, StockMovement.box_id, StockMovement.component_type_id, StockMovement.delta,
+            StockMovement.reason, ComponentType.name, ComponentType.category, ComponentType.max_per_box,
+            BoxComponent.quantity
+        ).join(ComponentType, ComponentType.id == StockMovement.component_type_id).outerjoin(BoxComponent, db.and_(
+            BoxComponent.box_id == StockMovement.box_id,
+            BoxComponent.component_type_id == StockMovement.component_type_id
+        )).filter(StockMovement.id > self._last_id).order_by(StockMovement.id).limit(self.batch_limit + 1).all()
+        if not rows:
+            return
+        if len(rows) > self.batch_limit:
+            # Too many to be worth streaming one by one, e.g. a bulk import
+            last_id = db.session.query(db.func.max(StockMovement.id)).scalar()
+            self._publish([(last_id, None, format_stock_event(last_id, 'reset', {}))])
+            return
+        self._publish([
+            (movement_id, box_id, format_stock_event(movement_id, 'stock', {
+                'box_id': box_id, 'component_type_id': component_type_id, 'name': name, 'category': category,
+                'max_per_box': max_per_box, 'delta': delta, 'quantity': quantity or 0, 'reason': reason
+            }))
+            for movement_id, box_id, component_type_id, delta, reason, name, category, max_per_box, quantity in rows
+        ])
+
+    def _publish(self, events):
+        with self._condition:
+            for movement_id, box_id, message in events:
+                self._ids.append(movement_id)
+                self._box_ids.append(box_id)
+                self.messages.append(message)
+            self._last_id = self._ids[-1]
+            # Trim in bulk so appends stay amortised O(1)
+            excess = len(self._ids) - self.buffer_size
+            if excess > self.buffer_size // 2:
+                self._evicted_through = self._ids[excess - 1]
+                del self._ids[:excess], self._box_ids[:excess], self.messages[:excess]
+            self._condition.notify_all()
+
+    def stream(self, after_id=None, box_ids=None):
+        """Yield server-sent event messages for movements after after_id, optionally only for box_ids"""
+        with self._condition:
+            if after_id is None or after_id > self._last_id:
+                after_id = self._last_id
+        yield f'retry: {int(self.poll_interval * 3000)}\n\n'
+        while True:
+            with self._condition:
+                if self._last_id <= after_id:
+                    self._condition.wait(self.heartbeat_interval)
+                if after_id < self._evicted_through:
+                    # Missed events that are gone from the buffer: the client must reload
+                    messages = [format_stock_event(self._last_id, 'reset', {})]
+                else:
+                    start = bisect.bisect_right(self._ids, after_id)
+                    messages = [
+                        message for box_id, message in zip(self._box_ids[start:], self.messages[start:])
+                        if box_ids is None or box_id is None or box_id in box_ids
+                    ]
+                waited_out = self._last_id <= after_id
+                after_id = self._last_id
+            if messages:
+                yield ''.join(messages)
+            elif waited_out:
+                yield ': keepalive\n\n'
+
+def format_stock_event(movement_id, event_type, data):
+    return f'id: {movement_id}\nevent: {event_type}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+stock_events = StockEventBroker(EVENT_BUFFER_SIZE, EVENT_POLL_INTERVAL, EVENT_BATCH_LIMIT, EVENT_HEARTBEAT_INTERVAL)
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _wake_stock_events(session):
+    if session.info.pop('stock_moved', False):
+        stock_events.wake()
+        stock_snapshot.invalidate()
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_stock_moved(session):
+    session.info.pop('stock_moved', None)
+
+@app.route('/api/events')
+def api_events():
+    box_ids = set(request.args.getlist('box_id', type=int)) or None
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id', ''))
+    after_id = int(last_event_id) if last_event_id.isdigit() else None
+    stock_events.start()
+    max_subscribers = app.config['EVENT_MAX_SUBSCRIBERS']
+    if not stock_events.subscribe(max_subscribers):
+        return jsonify({'success': False, 'message': f'At most {max_subscribers} event streams can be open, '
+                                                     'try again later'}), 503, {'Retry-After': str(EVENT_RETRY_AFTER)}
+    response = Response(stock_events.stream(after_id, box_ids), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Called when the stream ends, or when the client is gone before it started
+    response.call_on_close(stock_events.unsubscribe)
+    return response
+
+# Stock alerts
+# Alert rules are checked inside the transaction of every add, remove,
+# transfer, batch and pick, for the box entries it touched only: a low_stock
+# rule compares the component type's total in component_type_stock with its
+# threshold, a box_full rule one box entry's quantity with threshold x
+# max_per_box. Opening or resolving an Alert commits with the stock change
+# itself. Notifications are queued after the commit and delivered to the
+# configured sink by one background thread, so a slow sink never holds up a
+# request. Rules are cached, and their changes bump alert_rules_version.
+ALERT_KINDS = ('low_stock', 'box_full')
+ALERT_STATUSES = ('active', 'resolved')
+ALERT_QUEUE_SIZE = 10000  # notifications beyond this are dropped and counted
+ALERT_WEBHOOK_TIMEOUT = 5  # seconds
+
+CachedAlertRule = namedtuple('CachedAlertRule', ['id', 'kind', 'component_type_id', 'category', 'threshold'])
+
+ALERT_SORTS = {
+    'id': Alert.id,
+    'triggered_at': Alert.triggered_at,
+}
+
+def get_alert_rules():
+    """Return every alert rule, from the alert rule cache"""
+    alert_rule_cache.sync_version(lambda: load_catalog_version('alert_rules_version'))
+    return alert_rule_cache.get(('alert_rules',), lambda: tuple(
+        CachedAlertRule(rule.id, rule.kind, rule.component_type_id, rule.category, rule.threshold)
+        for rule in AlertRule.query.order_by(AlertRule.id)
+    ))
+
+def alert_breached(rule, value):
+    return value < rule.threshold if rule.kind == 'low_stock' else value >= rule.threshold
+
+def evaluate_alerts(pairs):
+    """Open or resolve the alerts of the rules covering the touched (box_id, component_type_id) pairs.
+
+    Must run in the transaction that changed the stock, after the change.
+    """
+    rules = get_alert_rules()
+    if not rules:
+        return
+    component_types = get_component_types_by_id({component_type_id for _, component_type_id in pairs})
+    checks = set()
+    for box_id, component_type_id in pairs:
+        component_type = component_types.get(component_type_id)
+        if component_type is None:
+            continue
+        for rule in rules:
+            if rule.component_type_id == component_type_id or (
+                    rule.category is not None and rule.category == component_type.category):
+                checks.add((rule, component_type, box_id if rule.kind == 'box_full' else None))
+    if not checks:
+        return
+
+    component_type_ids = {component_type.id for _, component_type, _ in checks}
+    entries = {(box_id, component_type.id) for _, component_type, box_id in checks if box_id is not None}
+    totals = dict(db.session.query(ComponentTypeStock.component_type_id, ComponentTypeStock.quantity).filter(
+        ComponentTypeStock.component_type_id.in_(component_type_ids)
+    ).all())
+    quantities = {
+        (box_id, component_type_id): quantity
+        for box_id, component_type_id, quantity in db.session.query(
+            BoxComponent.box_id, BoxComponent.component_type_id, BoxComponent.quantity
+        ).filter(db.tuple_(BoxComponent.box_id, BoxComponent.component_type_id).in_(entries))
+    } if entries else {}
+    active = {
+        (alert.rule_id, alert.component_type_id, alert.box_id): alert
+        for alert in Alert.query.filter(
+            Alert.status == 'active', Alert.component_type_id.in_(component_type_ids),
+            Alert.rule_id.in_({rule.id for rule, _, _ in checks})
+        )
+    }
+
+    now = datetime.utcnow()
+    changed = []
+    for rule, component_type, box_id in checks:
+        if box_id is None:
+            value = float(totals.get(component_type.id, 0))
+        else:
+            value = quantities.get((box_id, component_type.id), 0) / component_type.max_per_box
+        alert = active.get((rule.id, component_type.id, box_id))
+        if alert is None and alert_breached(rule, value):
+            alert = Alert(rule_id=rule.id, component_type_id=component_type.id, box_id=box_id,
+                          status='active', value=value, triggered_at=now)
+            db.session.add(alert)
+            changed.append(('triggered', rule, component_type, alert))
+        elif alert is not None and not alert_breached(rule, value):
+            alert.status = 'resolved'
+            alert.value = value
+            alert.resolved_at = now
+            changed.append(('resolved', rule, component_type, alert))
+    if changed:
+        # Assigns the ids of new alerts for the notifications
+        db.session.flush()
+        db.session.info.setdefault('alert_notifications', []).extend(
+            format_alert_notification(event_type, rule, component_type, alert)
+            for event_type, rule, component_type, alert in changed
+        )
+
+def format_alert_notification(event_type, rule, component_type, alert):
+    return {
+        'event': event_type,
+        'alert_id': alert.id,
+        'rule_id': rule.id,
+        'kind': rule.kind,
+        'threshold': rule.threshold,
+        'component_type_id': component_type.id,
+        'component_type': component_type.name,
+        'category': component_type.category,
+        'box_id': alert.box_id,
+        'value': alert.value,
+        'at': (alert.resolved_at or alert.triggered_at).isoformat(),
+    }
+
+def open_existing_alerts(rule):
+    """Record an active alert for everything a new rule already finds breached, without notifications"""
+    now = datetime.utcnow()
+    if rule.component_type_id is not None:
+        in_scope = ComponentType.id == rule.component_type_id
+    else:
+        in_scope = ComponentType.category == rule.category
+    if rule.kind == 'low_stock':
+        total = db.func.coalesce(ComponentTypeStock.quantity, 0)
+        breached = db.select(
+            db.literal(rule.id), ComponentType.id, db.null(), db.literal('active'), total, db.literal(now)
+        ).select_from(ComponentType).outerjoin(ComponentTypeStock).where(in_scope, total < rule.threshold)
+    else:
+        fill_ratio = db.cast(BoxComponent.quantity, db.Float) / ComponentType.max_per_box
+        breached = db.select(
+            db.literal(rule.id), ComponentType.id, BoxComponent.box_id, db.literal('active'), fill_ratio, db.literal(now)
+        ).select_from(BoxComponent).join(ComponentType).where(in_scope, fill_ratio >= rule.threshold)
+    db.session.execute(db.insert(Alert).from_select(
+        ['rule_id', 'component_type_id', 'box_id', 'status', 'value', 'triggered_at'], breached
+    ))
+
+def parse_alert_rule(payload):
+    """Validate a rule from JSON, returning an unsaved AlertRule or raising ValueError"""
+    kind = payload.get('kind')
+    if kind not in ALERT_KINDS:
+        raise ValueError(f"Kind must be one of: {', '.join(ALERT_KINDS)}")
+    component_type_id = payload.get('component_type_id')
+    category = payload.get('category')
+    if (component_type_id is None) == (category is None):
+        raise ValueError('Give either component_type_id or category')
+    if component_type_id is not None:
+        try:
+            component_type_id = int(component_type_id)
+        except (TypeError, ValueError):
+            raise ValueError('component_type_id must be an integer')
+        if get_component_type(component_type_id) is None:
+            raise ValueError(f'Component type {component_type_id} not found')
+    try:
+        threshold = float(payload.get('threshold'))
+    except (TypeError, ValueError):
+        raise ValueError('threshold must be a number')
+    if kind == 'low_stock' and threshold < 1:
+        raise ValueError('A low_stock threshold is a quantity of at least 1')
+    if kind == 'box_full' and not 0 < threshold <= 1:
+        raise ValueError('A box_full threshold is a fill ratio above 0 and at most 1')
+    return AlertRule(kind=kind, component_type_id=component_type_id, category=category, threshold=threshold)
+
+class LogAlertSink:
+    """Write each notification to the application log"""
+
+    def send(self, notification):
+        app.logger.warning('Stock alert %s: %s', notification['event'], json.dumps(notification))
+
+class FileAlertSink:
+    """Append each notification to a JSON Lines file"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, notification):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(notification) + '\n')
+
+class WebhookAlertSink:
+    """POST each notification as JSON to a URL"""
+
+    def __init__(self, url, timeout=ALERT_WEBHOOK_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, notification):
+        request = urllib.request.Request(self.url, data=json.dumps(notification).encode(),
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+# ALERT_SINK is 'log', 'file:PATH' or 'webhook:URL'; register more kinds here
+ALERT_SINKS = {
+    'log': LogAlertSink,
+    'file': FileAlertSink,
+    'webhook': WebhookAlertSink,
+}
+
+def make_alert_sink(spec):
+    kind, _, target = spec.partition(':')
+    if kind not in ALERT_SINKS:
+        raise ValueError(f"Unknown ALERT_SINK {spec!r}; expected one of: {', '.join(ALERT_SINKS)}")
+    return ALERT_SINKS[kind](target) if target else ALERT_SINKS[kind]()
+
+class AlertNotifier:
+    """Queue of committed alert notifications, delivered to a sink by one background thread"""
+
+    def __init__(self, queue_size):
+        self.sink = None  # made from ALERT_SINK on first use unless set
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self._queue = queue.Queue(queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, notifications):
+        self._start()
+        for notification in notifications:
+            try:
+                self._queue.put_nowait(notification)
+            except queue.Full:
+                self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            if self.sink is None:
+                self.sink = make_alert_sink(app.config['ALERT_SINK'])
+            self._thread = threading.Thread(target=self._run, name='alert-notifier', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            notification = self._queue.get()
+            try:
+                self.sink.send(notification)
+                self.sent += 1
+            except Exception:
+                self.failed += 1
+                app.logger.exception('Delivering alert %s failed', notification.get('alert_id'))
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """Wait until every queued notification was handled"""
+        self._queue.join()
+
+    def stats(self):
+        return {'sent': self.sent, 'failed': self.failed, 'dropped': self.dropped, 'queued': self._queue.qsize()}
+
+alert_notifier = AlertNotifier(ALERT_QUEUE_SIZE)
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _send_alert_notifications(session):
+    notifications = session.info.pop('alert_notifications', None)
+    if notifications:
+        alert_notifier.submit(notifications)
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_alert_notifications(session):
+    session.info.pop('alert_notifications', None)
+
+def serialize_alert_rule(rule):
+    return {
+        'id': rule.id,
+        'kind': rule.kind,
+        'component_type_id': rule.component_type_id,
+        'category': rule.category,
+        'threshold': rule.threshold,
+    }
+
+@app.route('/api/alert_rules')
+@read_only
+def api_alert_rules():
+    return jsonify({'rules': [serialize_alert_rule(rule) for rule in get_alert_rules()]})
+
+@app.route('/api/alert_rules', methods=['POST'])
+def api_add_alert_rule():
+    try:
+        rule = parse_alert_rule(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    db.session.add(rule)
+    db.session.flush()
+    open_existing_alerts(rule)
+    db.session.commit()
+    active = Alert.query.filter_by(rule_id=rule.id, status='active').count()
+    return jsonify({'success': True, 'rule': serialize_alert_rule(rule), 'active_alerts': active})
+
+@app.route('/api/alert_rules/<int:rule_id>', methods=['DELETE'])
+def api_delete_alert_rule(rule_id):
+    rule = db.session.get(AlertRule, rule_id) or abort(404)
+    Alert.query.filter_by(rule_id=rule_id).delete()
+    db.session.delete(rule)
+    db.session.commit()
+    return jsonify({'success': True, 'message': f'Deleted alert rule {rule_id} and its alerts'})
+
+@app.route('/api/alerts')
+@read_only
+def api_alerts():
+    query = db.session.query(Alert, AlertRule.kind, AlertRule.threshold).join(AlertRule)
+    status = request.args.get('status', 'active')
+    if status not in ALERT_STATUSES:
+        return jsonify({'success': False, 'message': f"Status must be one of: {', '.join(ALERT_STATUSES)}"}), 400
+    query = query.filter(Alert.status == status)
+    for arg in ('box_id', 'component_type_id', 'rule_id'):
+        value = request.args.get(arg, type=int)
+        if value is not None:
+            query = query.filter(getattr(Alert, arg) == value)
+    try:
+        page = paginate(query, ALERT_SORTS, Alert.id, 'triggered_at')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    result = []
+    for alert, kind, threshold in page['items']:
+        result.append({
+            'id': alert.id,
+            'rule_id': alert.rule_id,
+            'kind': kind,
+            'threshold': threshold,
+            'component_type_id': alert.component_type_id,
+            'box_id': alert.box_id,
+            'status': alert.status,
+            'value': alert.value,
+            'triggered_at': alert.triggered_at.isoformat(),
+            'resolved_at': alert.resolved_at.isoformat() if alert.resolved_at else None
+        })
+    return jsonify({'items': result, 'notifications': alert_notifier.stats(),
+                    'next': page['next_cursor'], 'prev': page['prev_cursor']})
+
+# Inventory export
+# Exports stream one row per box entry straight from a database cursor, so
+# memory stays flat however large the inventory is. The whole export is a
+# single SELECT, which SQLite runs against one read snapshot even while
+# writers commit.
+EXPORT_FIELDS = [
+    'box_id', 'box_name', 'component_type_id', 'component_type_name',
+    'category', 'quantity', 'max_per_box', 'last_updated'
+]
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_CHUNK_ROWS = 1000
+
+def export_statement(box_id=None, category=None, since=None):
+    """Build the export SELECT over BoxComponent x Box x ComponentType, in (box, component type) order"""
+    statement = db.select(
+        Box.id.label('box_id'),
+        Box.name.label('box_name'),
+        ComponentType.id.label('component_type_id'),
+        ComponentType.name.label('component_type_name'),
+        ComponentType.category,
+        BoxComponent.quantity,
+        ComponentType.max_per_box,
+        BoxComponent.last_updated
+    ).select_from(BoxComponent).join(Box).join(ComponentType).order_by(
+        BoxComponent.box_id, BoxComponent.component_type_id
+    )
+    if box_id is not None:
+        statement = statement.where(BoxComponent.box_id == box_id)
+    if category is not None:
+        statement = statement.where(ComponentType.category == category)
+    if since is not None:
+        statement = statement.where(BoxComponent.last_updated >= since)
+    return statement
+
+def _export_values(row):
+    """Return the row as a tuple in EXPORT_FIELDS order, with last_updated as an ISO string"""
+    last_updated = row[-1]
+    return (*row[:-1], last_updated.isoformat() if last_updated is not None else None)
+
+def _csv_chunks(partitions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(EXPORT_FIELDS)
+    for rows in partitions:
+        writer.writerows(map(_export_values, rows))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def _jsonl_chunks(partitions):
+    for rows in partitions:
+        yield ''.join(json.dumps(dict(zip(EXPORT_FIELDS, _export_values(row)))) + '\n' for row in rows)
+
+def generate_export(export_format, compress=False, **filters):
+    """Return an iterator over the inventory export as encoded chunks, gzip-compressed if compress is set.
+
+    The rows are read through a connection of their own, on the read engine
+    when there is one, so the iterator keeps working after the request's app
+    context has ended.
+    """
+    engine = db.engines.get('read', db.engine)
+    return _export_chunks(engine, export_statement(**filters), export_format, compress)
+
+def _export_chunks(engine, statement, export_format, compress):
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 writes a gzip header
+    with engine.connect() as connection:
+        result = connection.execution_options(yield_per=EXPORT_CHUNK_ROWS).execute(statement)
+        chunks = _csv_chunks(result.partitions()) if export_format == 'csv' else _jsonl_chunks(result.partitions())
+        for chunk in chunks:
+            data = chunk.encode()
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                yield data
+    if compressor:
+        yield compressor.flush()
+
+def parse_export_filters(args):
+    """Read the box_id/category/since filters from request-style args, raising ValueError if one is malformed"""
+    since = args.get('since')
+    box_id = args.get('box_id')
+    return {
+        'box_id': int(box_id) if box_id else None,
+        'category': args.get('category') or None,
+        'since': datetime.fromisoformat(since) if since else None,
+    }
+
+@app.route('/export/inventory.<export_format>')
+def export_inventory(export_format):
+    if export_format not in EXPORT_FORMATS:
+        abort(404)
+    try:
+        filters = parse_export_filters(request.args)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'box_id must be an integer and since an ISO 8601 timestamp'}), 400
+    compress = request.args.get('gzip') == '1'
+
+    filename = f'inventory.{export_format}' + ('.gz' if compress else '')
+    if compress:
+        mimetype = 'application/gzip'
+    else:
+        mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return Response(
+        generate_export(export_format, compress, **filters),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@app.route('/api/stock_summary')
+@read_only
+def api_stock_summary():
+    query = stock_summary_query()
+    category = request.args.get('category')
+    if category is not None:
+        query = query.filter(db.func.coalesce(ComponentType.category, '') == category)
+    try:
+        page = paginate(query, STOCK_SUMMARY_SORTS, ComponentType.id, 'name')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    box_count = db.session.query(Box).count()
+    result = []
+    for component_type, quantity, holding_boxes in page['items']:
+        result.append({
+            'id': component_type.id,
+            'name': component_type.name,
+            'category': component_type.category,
+            'max_per_box': component_type.max_per_box,
+            'quantity': quantity,
+            'box_count': holding_boxes,
+            'free_capacity': component_type.max_per_box * box_count - quantity
+        })
+    return jsonify({'items': result, 'box_count': box_count, 'next': page['next_cursor'], 'prev': page['prev_cursor']})
+
+@app.route('/api/cache_stats')
+def api_cache_stats():
+    return jsonify({'catalog': catalog_cache.stats(), 'alert_rules': alert_rule_cache.stats(),
+                    'scan_tags': scan_tag_cache.stats(), 'box_cards': box_card_cache.stats()})
+
+# Stock analytics
+# /api/analytics/* answers aggregate questions (stock, capacity and fill ratio
+# by category or box) from an in-memory, column-oriented copy of box_component
+# rather than ORM objects. Entries live in two arrays sorted by box and
+# component type, 12 bytes each, and the totals per component type, box and
+# category are adjusted as each entry changes, so a query costs O(boxes) or
+# O(categories) instead of O(entries). The copy is loaded on first use and
+# brought up to date at most once per ANALYTICS_REFRESH_INTERVAL by re-reading
+# the entries touched by newer stock movements. The ledger is followed rather
+# than last_updated because emptied entries are deleted, leaving no timestamp.
+ANALYTICS_REFRESH_INTERVAL = 1.0  # seconds
+ANALYTICS_RELOAD_THRESHOLD = 20000  # more touched entries than this reload the whole snapshot
+ANALYTICS_LOAD_BATCH = 10000
+FILL_RATIO_BUCKETS = 10
+ANALYTICS_BOX_SORTS = ('fill_ratio', 'quantity', 'capacity', 'entries', 'id')
+
+def _zeros(typecode, size):
+    return array(typecode, bytes(array(typecode).itemsize * size))
+
+def _grow(column, size):
+    """Pad an id-indexed column with zeros up to size"""
+    if len(column) < size:
+        column.frombytes(bytes(column.itemsize * (size - len(column))))
+
+def _fill_bucket(quantity, max_per_box):
+    return min(quantity * FILL_RATIO_BUCKETS // max_per_box, FILL_RATIO_BUCKETS - 1)
+
+def _ratio(quantity, capacity):
+    return round(quantity / capacity, 4) if capacity else None
+
+class StockSnapshot:
+    """Columnar copy of box_component with running totals per component type, box and category"""
+
+    def __init__(self, refresh_interval, reload_threshold):
+        self.refresh_interval = refresh_interval
+        self.reload_threshold = reload_threshold
+        self.loads = 0
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._catalog_version = None
+        self._movement_id = None
+        self._clear()
+
+    def _clear(self):
+        # Entries keyed by box_id << 32 | component_type_id; emptied entries
+        # keep their slot with quantity 0 until the next full load
+        self._keys = array('q')
+        self._quantities = array('i')
+        # Columns indexed by component type id; max_per_box 0 marks an unused id
+        self._type_categories = array('i')
+        self._type_max = array('i')
+        self._type_quantities = array('q')
+        self._type_boxes = array('i')
+        # Columns indexed by box id
+        self._box_ids = array('i')
+        self._box_quantities = array('q')
+        self._box_capacities = array('q')
+        self._box_entries = array('i')
+        # Columns indexed by category code
+        self._categories = []
+        self._category_codes = {}
+        self._category_types = array('i')
+        self._category_stocked = array('i')
+        self._category_quantities = array('q')
+        self._category_capacities = array('q')
+        self._category_entries = array('i')
+        self._category_fill = []
+
+    def invalidate(self):
+        """Refresh on the next query instead of waiting out the interval"""
+        self._checked_at = None
+
+    def refresh(self):
+        """Bring the snapshot up to date, at most once per refresh_interval"""
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.refresh_interval:
+                return
+            self._checked_at = now
+            catalog_version, movement_id = get_versions()
+            if self._movement_id is None or (catalog_version != self._catalog_version and not self._sync_catalog()):
+                self._load(movement_id)
+            elif movement_id != self._movement_id:
+                self._catch_up(movement_id)
+            self._catalog_version = catalog_version
+
+    def _category_code(self, category):
+        code = self._category_codes.get(category)
+        if code is None:
+            code = self._category_codes[category] = len(self._categories)
+            self._categories.append(category)
+            for column in (self._category_types, self._category_stocked, self._category_quantities,
+                           self._category_capacities, self._category_entries):
+                column.append(0)
+            self._category_fill.append(_zeros('q', FILL_RATIO_BUCKETS))
+        return code
+
+    def _sync_catalog(self):
+        """Pick up new boxes and component types; returns False if an existing type changed"""
+        types = db.session.query(ComponentType.id, ComponentType.category, ComponentType.max_per_box).all()
+        self._box_ids = array('i', (box_id for box_id, in db.session.query(Box.id).order_by(Box.id)))
+        type_size = max((component_type_id for component_type_id, _, _ in types), default=0) + 1
+        box_size = (self._box_ids[-1] if self._box_ids else 0) + 1
+        for column in (self._type_categories, self._type_max, self._type_quantities, self._type_boxes):
+            _grow(column, type_size)
+        for column in (self._box_quantities, self._box_capacities, self._box_entries):
+            _grow(column, box_size)
+        for component_type_id, category, max_per_box in types:
+            code = self._category_code(category)
+            if not self._type_max[component_type_id]:
+                self._type_categories[component_type_id] = code
+                self._type_max[component_type_id] = max_per_box
+                self._category_types[code] += 1
+            elif (self._type_categories[component_type_id], self._type_max[component_type_id]) != (code, max_per_box):
+                return False
+        return True
+
+    def _load(self, movement_id):
+        """Rebuild everything from box_component as of movement_id"""
+        self._clear()
+        self._sync_catalog()
+        # A Core statement on the session's connection skips the ORM's per-row processing
+        rows = db.session.connection().execute(
+            db.select(BoxComponent.box_id.op('<<')(32).op('|')(BoxComponent.component_type_id), BoxComponent.quantity)
+            .where(BoxComponent.quantity > 0)
+            .order_by(BoxComponent.box_id, BoxComponent.component_type_id)
+            .execution_options(yield_per=ANALYTICS_LOAD_BATCH)
+        )
+        for partition in rows.partitions():
+            keys, quantities = zip(*partition)
+            self._keys.extend(keys)
+            self._quantities.extend(quantities)
+        self._total()
+        self._movement_id = movement_id
+        self.loads += 1
+
+    def _total(self):
+        """Compute every running total from the entries in one pass; the same sums _count() maintains"""
+        type_categories, type_max = self._type_categories, self._type_max
+        type_quantities, type_boxes = self._type_quantities, self._type_boxes
+        box_quantities, box_capacities, box_entries = self._box_quantities, self._box_capacities, self._box_entries
+        category_fill = self._category_fill
+        buckets = FILL_RATIO_BUCKETS
+        for key, quantity in zip(self._keys, self._quantities):
+            component_type_id = key & 0xFFFFFFFF
+            box_id = key >> 32
+            max_per_box = type_max[component_type_id]
+            type_quantities[component_type_id] += quantity
+            type_boxes[component_type_id] += 1
+            box_quantities[box_id] += quantity
+            box_capacities[box_id] += max_per_box
+            box_entries[box_id] += 1
+            category_fill[type_categories[component_type_id]][min(quantity * buckets // max_per_box, buckets - 1)] += 1
+        for code, max_per_box, quantity, boxes in zip(type_categories, type_max, type_quantities, type_boxes):
+            if boxes:
+                self._category_stocked[code] += 1
+                self._category_quantities[code] += quantity
+                self._category_capacities[code] += boxes * max_per_box
+                self._category_entries[code] += boxes
+
+    def _catch_up(self, movement_id):
+        """Re-read the entries touched by the movements after the last refresh"""
+        rows = db.session.query(
+            StockMovement.box_id, StockMovement.component_type_id, db.func.coalesce(BoxComponent.quantity, 0)
+        ).outerjoin(BoxComponent, db.and_(
+            BoxComponent.box_id == StockMovement.box_id,
+            BoxComponent.component_type_id == StockMovement.component_type_id
+        )).filter(
+            StockMovement.id > self._movement_id, StockMovement.id <= movement_id
+        ).distinct().limit(self.reload_threshold + 1).all()
+        if len(rows) > self.reload_threshold:
+            self._load(movement_id)
+            return
+        added = []
+        for box_id, component_type_id, quantity in rows:
+            key = box_id << 32 | component_type_id
+            index = bisect.bisect_left(self._keys, key)
+            if index < len(self._keys) and self._keys[index] == key:
+                self._count(box_id, component_type_id, self._quantities[index], quantity)
+                self._quantities[index] = quantity
+            elif quantity:
+                self._count(box_id, component_type_id, 0, quantity)
+                added.append((key, quantity))
+        if added:
+            self._merge(sorted(added))
+        self._movement_id = movement_id
+        self.refreshes += 1
+
+    def _merge(self, added):
+        """Insert new entries in key order with one pass of slice copies"""
+        keys = array('q')
+        quantities = array('i')
+        start = 0
+        for key, quantity in added:
+            index = bisect.bisect_left(self._keys, key, start)
+            keys.extend(self._keys[start:index])
+            quantities.extend(self._quantities[start:index])
+            keys.append(key)
+            quantities.append(quantity)
+            start = index
+        keys.extend(self._keys[start:])
+        quantities.extend(self._quantities[start:])
+        self._keys, self._quantities = keys, quantities
+
+    def _count(self, box_id, component_type_id, old, new):
+        """Move the running totals from an entry's old quantity to its new one"""
+        if old == new:
+            return
+        code = self._type_categories[component_type_id]
+        max_per_box = self._type_max[component_type_id]
+        delta = new - old
+        self._type_quantities[component_type_id] += delta
+        self._box_quantities[box_id] += delta
+        self._category_quantities[code] += delta
+        fill = self._category_fill[code]
+        if old:
+            fill[_fill_bucket(old, max_per_box)] -= 1
+        if new:
+            fill[_fill_bucket(new, max_per_box)] += 1
+        held = (new > 0) - (old > 0)
+        if held:
+            self._type_boxes[component_type_id] += held
+            self._box_entries[box_id] += held
+            self._box_capacities[box_id] += held * max_per_box
+            self._category_entries[code] += held
+            self._category_capacities[code] += held * max_per_box
+            if self._type_boxes[component_type_id] == (1 if held > 0 else 0):
+                self._category_stocked[code] += held
+
+    def memory_bytes(self):
+        columns = [self._keys, self._quantities, self._type_categories, self._type_max, self._type_quantities,
+                   self._type_boxes, self._box_ids, self._box_quantities, self._box_capacities, self._box_entries]
+        return sum(column.itemsize * len(column) for column in columns)
+
+    def summary(self):
+        with self._lock:
+            quantity = sum(self._category_quantities)
+            capacity = sum(self._category_capacities)
+            return {
+                'boxes': len(self._box_ids),
+                'component_types': sum(self._category_types),
+                'entries': sum(self._category_entries),
+                'quantity': quantity,
+                'capacity': capacity,
+                'fill_ratio': _ratio(quantity, capacity),
+                'snapshot': {
+                    'movement_id': self._movement_id,
+                    'catalog_version': self._catalog_version,
+                    'memory_bytes': self.memory_bytes(),
+                    'loads': self.loads,
+                    'refreshes': self.refreshes,
+                },
+            }
+
+    def categories(self, min_quantity=1):
+        """Per-category totals; short counts the types holding fewer than min_quantity in all boxes"""
+        with self._lock:
+            if min_quantity <= 1:
+                short = [types - stocked for types, stocked in zip(self._category_types, self._category_stocked)]
+            else:
+                short = [0] * len(self._categories)
+                for code, max_per_box, quantity in zip(self._type_categories, self._type_max, self._type_quantities):
+                    if max_per_box and quantity < min_quantity:
+                        short[code] += 1
+            return [
+                {
+                    'category': category,
+                    'component_types': self._category_types[code],
+                    'short': short[code],
+                    'entries': self._category_entries[code],
+                    'quantity': self._category_quantities[code],
+                    'capacity': self._category_capacities[code],
+                    'fill_ratio': _ratio(self._category_quantities[code], self._category_capacities[code]),
+                }
+                for code, category in sorted(enumerate(self._categories), key=lambda item: item[1] or '')
+                if self._category_types[code]
+            ]
+
+    def boxes(self, sort='fill_ratio', descending=False, limit=50, offset=0):
+        """One page of per-box totals; capacity is the max_per_box sum of the types a box holds"""
+        with self._lock:
+            rows = [
+                (box_id, self._box_entries[box_id], self._box_quantities[box_id], self._box_capacities[box_id])
+                for box_id in self._box_ids
+            ]
+        sort_key = {
+            'fill_ratio': lambda row: (row[2] / row[3] if row[3] else 0, row[0]),
+            'quantity': lambda row: (row[2], row[0]),
+            'capacity': lambda row: (row[3], row[0]),
+            'entries': lambda row: (row[1], row[0]),
+            'id': lambda row: row[0],
+        }[sort]
+        rows.sort(key=sort_key, reverse=descending)
+        return len(rows), [
+            {'box_id': box_id, 'entries': entries, 'quantity': quantity, 'capacity': capacity,
+             'fill_ratio': _ratio(quantity, capacity)}
+            for box_id, entries, quantity, capacity in rows[offset:offset + limit]
+        ]
+
+    def box(self, box_id):
+        """Per-category totals and fill ratio histogram of one box, from its slice of the entries"""
+        with self._lock:
+            start = bisect.bisect_left(self._keys, box_id << 32)
+            end = bisect.bisect_left(self._keys, (box_id + 1) << 32, start)
+            totals = {}
+            histogram = [0] * FILL_RATIO_BUCKETS
+            for key, quantity in zip(self._keys[start:end], self._quantities[start:end]):
+                if not quantity:
+                    continue
+                component_type_id = key & 0xFFFFFFFF
+                max_per_box = self._type_max[component_type_id]
+                category_totals = totals.setdefault(self._categories[self._type_categories[component_type_id]], [0, 0, 0])
+                category_totals[0] += 1
+                category_totals[1] += quantity
+                category_totals[2] += max_per_box
+                histogram[_fill_bucket(quantity, max_per_box)] += 1
+            quantity = self._box_quantities[box_id] if box_id < len(self._box_quantities) else 0
+            capacity = self._box_capacities[box_id] if box_id < len(self._box_capacities) else 0
+        return {
+            'box_id': box_id,
+            'entries': sum(entries for entries, _, _ in totals.values()),
+            'quantity': quantity,
+            'capacity': capacity,
+            'fill_ratio': _ratio(quantity, capacity),
+            'categories': [
+                {'category': category, 'entries': entries, 'quantity': category_quantity,
+                 'capacity': category_capacity, 'fill_ratio': _ratio(category_quantity, category_capacity)}
+                for category, (entries, category_quantity, category_capacity)
+                in sorted(totals.items(), key=lambda item: item[0] or '')
+            ],
+            'histogram': histogram,
+        }
+
+    def fill_ratio(self, category=None):
+        """Histograms of entry fill ratios (of one category, or all) and, for all categories, of box fill ratios"""
+        with self._lock:
+            if category is None:
+                entries = [sum(counts) for counts in zip(*self._category_fill)] or [0] * FILL_RATIO_BUCKETS
+                boxes = [0] * FILL_RATIO_BUCKETS
+                for box_id in self._box_ids:
+                    if self._box_capacities[box_id]:
+                        boxes[_fill_bucket(self._box_quantities[box_id], self._box_capacities[box_id])] += 1
+                return entries, boxes
+            code = self._category_codes.get(category)
+            return (list(self._category_fill[code]) if code is not None else [0] * FILL_RATIO_BUCKETS), None
+
+stock_snapshot = StockSnapshot(ANALYTICS_REFRESH_INTERVAL, ANALYTICS_RELOAD_THRESHOLD)
+
+def fill_ratio_buckets(counts):
+    return [
+        {'from': index / FILL_RATIO_BUCKETS, 'to': (index + 1) / FILL_RATIO_BUCKETS, 'count': count}
+        for index, count in enumerate(counts)
+    ]
+
+@app.route('/api/analytics/summary')
+@read_only
+def api_analytics_summary():
+    stock_snapshot.refresh()
+    return jsonify(stock_snapshot.summary())
+
+@app.route('/api/analytics/categories')
+@read_only
+def api_analytics_categories():
+    min_quantity = max(request.args.get('min_quantity', 1, type=int), 1)
+    stock_snapshot.refresh()
+    return jsonify({'min_quantity': min_quantity, 'categories': stock_snapshot.categories(min_quantity)})
+
+@app.route('/api/analytics/boxes')
+@read_only
+def api_analytics_boxes():
+    sort = request.args.get('sort', 'fill_ratio')
+    if sort not in ANALYTICS_BOX_SORTS:
+        return jsonify({'success': False, 'message': f'Cannot sort by {sort!r}'}), 400
+    descending = request.args.get('order', 'asc') == 'desc'
+    limit = min(max(request.args.get('limit', PER_PAGE, type=int), 1), MAX_PER_PAGE)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    stock_snapshot.refresh()
+    total, rows = stock_snapshot.boxes(sort, descending, limit, offset)
+    boxes = get_boxes_by_id([row['box_id'] for row in rows])
+    for row in rows:
+        row['name'] = boxes[row['box_id']].name
+    return jsonify({'total': total, 'limit': limit, 'offset': offset, 'boxes': rows})
+
+@app.route('/api/analytics/boxes/<int:box_id>')
+@read_only
+def api_analytics_box(box_id):
+    box = get_boxes_by_id([box_id]).get(box_id)
+    if box is None:
+        return jsonify({'success': False, 'message': 'Box not found'}), 404
+    stock_snapshot.refresh()
+    result = stock_snapshot.box(box_id)
+    result['name'] = box.name
+    result['histogram'] = fill_ratio_buckets(result['histogram'])
+    return jsonify(result)
+
+@app.route('/api/analytics/fill_ratio')
+@read_only
+def api_analytics_fill_ratio():
+    category = request.args.get('category')
+    stock_snapshot.refresh()
+    entries, boxes = stock_snapshot.fill_ratio(category)
+    result = {'category': category, 'entries': fill_ratio_buckets(entries)}
+    if boxes is not None:
+        result['boxes'] = fill_ratio_buckets(boxes)
+    return jsonify(result)
+
+# Background jobs
+# Imports, exports, reseeding and reports can take far longer than a proxy
+# will wait, so /api/jobs queues them in the job table instead and
+# scripts/job_worker.py runs them in a pool of worker processes, one job per
+# process at a time. A worker claims the oldest queued job with a single
+# UPDATE, so two workers never run the same job. While a job runs, a
+# heartbeat thread in its worker writes the handler's progress to the job row
+# and picks up cancellation requests; the handler sees them at its next
+# progress() or check() call. Jobs whose worker stops sending heartbeats are
+# marked failed. The job table lives in a database of its own, so progress
+# updates never wait for a long inventory transaction.
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+JOB_FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+JOB_MAX_QUEUED = 100  # submissions beyond this many queued jobs are refused
+JOB_POLL_INTERVAL = 1.0  # seconds an idle worker waits before looking for work again
+JOB_HEARTBEAT_INTERVAL = 1.0  # seconds between progress writes of a running job
+JOB_STALE_AFTER = 30.0  # seconds without a heartbeat before a running job counts as failed
+JOB_PROGRESS_ROWS = 10000  # rows between progress reports of import jobs
+
+JOB_SORTS = {
+    'id': Job.id,
+    'created_at': Job.created_at,
+}
+
+# kind -> handler(params, job) returning a JSON-serialisable result
+JOB_HANDLERS = {}
+
+class JobCancelled(Exception):
+    """Raised inside a job handler once cancellation of its job was requested"""
+
+def job_handler(kind):
+    """Register a function as the handler of a job kind"""
+    def decorator(handler):
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return decorator
+
+class JobContext:
+    """Passed to a job handler: reports its progress and tells it when the job was cancelled"""
+
+    def __init__(self, job_id, heartbeat_interval=JOB_HEARTBEAT_INTERVAL):
+        self.id = job_id
+        self.heartbeat_interval = heartbeat_interval
+        self.fraction = None
+        self.message = None
+        self.outputs = []
+        self._cancelled = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, name=f'job-{job_id}-heartbeat', daemon=True)
+
+    def progress(self, fraction=None, message=None):
+        """Record how far the job is (0 to 1) and what it is doing, then check for cancellation"""
+        if fraction is not None:
+            self.fraction = min(max(fraction, 0.0), 1.0)
+        if message is not None:
+            self.message = message
+        self.check()
+
+    def check(self):
+        if self._cancelled.is_set():
+            raise JobCancelled()
+
+    def output_path(self, name):
+        """Path for a file the job produces, served by /api/jobs/<id>/download when named in the result"""
+        os.makedirs(app.config['JOB_DIR'], exist_ok=True)
+        path = os.path.join(app.config['JOB_DIR'], f'job-{self.id}-{name}')
+        self.outputs.append(path)
+        return path
+
+    def discard_outputs(self):
+        """Remove the partial files of a job that did not succeed"""
+        for path in self.outputs:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _heartbeat(self):
+        with app.app_context():
+            while not self._stopped.wait(self.heartbeat_interval):
+                try:
+                    self._beat()
+                except OperationalError:
+                    app.logger.exception('Heartbeat of job %s failed', self.id)
+                finally:
+                    db.session.remove()
+
+    def _beat(self):
+        values = {'heartbeat_at': datetime.utcnow()}
+        if self.fraction is not None:
+            values['progress'] = self.fraction
+        if self.message is not None:
+            values['message'] = self.message
+        db.session.execute(db.update(Job).where(Job.id == self.id).values(**values))
+        cancel_requested = db.session.query(Job.cancel_requested).filter_by(id=self.id).scalar()
+        db.session.commit()
+        if cancel_requested:
+            self._cancelled.set()
+
+def submit_job(kind, params):
+    """Queue a job, returning it; raises ValueError for an unknown kind, bad import files or a full queue"""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Kind must be one of: {', '.join(sorted(JOB_HANDLERS))}")
+    if not isinstance(params, dict):
+        raise ValueError('params must be an object')
+    if kind == 'import':
+        # Refuse paths outside the import directory before they reach the queue;
+        # the worker resolves them again when the job runs
+        for name in ('component_types', 'boxes', 'box_contents'):
+            resolve_import_path(params.get(name))
+    if db.session.query(Job).filter_by(status='queued').count() >= JOB_MAX_QUEUED:
+        raise ValueError(f'{JOB_MAX_QUEUED} jobs are already queued, try again later')
+    job = Job(kind=kind, params=json.dumps(params))
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+def cancel_job(job_id):
+    """Cancel a queued job at once, or ask a running one to stop; returns False if the job had finished"""
+    now = datetime.utcnow()
+    cancelled = db.session.execute(db.update(Job).where(Job.id == job_id, Job.status == 'queued').values(
+        status='cancelled', finished_at=now
+    )).rowcount
+    if not cancelled:
+        cancelled = db.session.execute(db.update(Job).where(Job.id == job_id, Job.status == 'running').values(
+            cancel_requested=True
+        )).rowcount
+    db.session.commit()
+    return bool(cancelled)
+
+def claim_job(worker):
+    """Fail the jobs of workers that went silent, then take the oldest queued job; returns its id or None"""
+    now = datetime.utcnow()
+    db.session.execute(db.update(Job).where(
+        Job.status == 'running', Job.heartbeat_at < now - timedelta(seconds=JOB_STALE_AFTER)
+    ).values(status='failed', error='The worker running this job stopped', finished_at=now))
+    oldest = db.select(Job.id).where(Job.status == 'queued').order_by(Job.id).limit(1).scalar_subquery()
+    job_id = db.session.execute(db.update(Job).where(Job.id == oldest, Job.status == 'queued').values(
+        status='running', worker=worker, started_at=now, heartbeat_at=now
+    ).returning(Job.id)).scalar()
+    db.session.commit()
+    return job_id
+
+def run_job(job_id):
+    """Run a claimed job to completion and record how it ended"""
+    job = db.session.get(Job, job_id)
+    handler = JOB_HANDLERS.get(job.kind)
+    params = json.loads(job.params)
+    db.session.commit()
+    context = JobContext(job_id)
+    context.start()
+    values = {}
+    try:
+        if handler is None:
+            raise ValueError(f'No handler for jobs of kind {job.kind!r}')
+        values['result'] = json.dumps(handler(params, context))
+        values.update(status='succeeded', progress=1.0)
+    except JobCancelled:
+        db.session.rollback()
+        values['status'] = 'cancelled'
+    except ValueError as e:
+        db.session.rollback()
+        values.update(status='failed', error=str(e))
+    except Exception as e:
+        db.session.rollback()
+        app.logger.exception('Job %s (%s) failed', job_id, job.kind)
+        values.update(status='failed', error=str(e) or type(e).__name__)
+    finally:
+        context.stop()
+    if values['status'] != 'succeeded':
+        context.discard_outputs()
+    values.update(message=context.message, finished_at=datetime.utcnow())
+    db.session.execute(db.update(Job).where(Job.id == job_id).values(**values))
+    db.session.commit()
+
+def run_job_worker(worker, poll_interval=JOB_POLL_INTERVAL, until_idle=False):
+    """Claim and run jobs one at a time, forever or, with until_idle, until the queue is empty"""
+    while True:
+        try:
+            job_id = claim_job(worker)
+        finally:
+            db.session.remove()
+        if job_id is None:
+            if until_idle:
+                return
+            time.sleep(poll_interval)
+            continue
+        try:
+            run_job(job_id)
+        finally:
+            db.session.remove()
+
+@job_handler('export')
+def run_export_job(params, job):
+    """Write the inventory export to a file; params are format, gzip and the export filters"""
+    export_format = params.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    compress = bool(params.get('gzip'))
+    filters = parse_export_filters(params)
+    total = db.session.execute(db.select(db.func.count()).select_from(export_statement(**filters).subquery())).scalar()
+    filename = f'inventory.{export_format}' + ('.gz' if compress else '')
+    path = job.output_path(filename)
+    size = 0
+    with open(path, 'wb') as f:
+        # Chunks hold up to EXPORT_CHUNK_ROWS rows each
+        for index, chunk in enumerate(generate_export(export_format, compress, **filters)):
+            f.write(chunk)
+            size += len(chunk)
+            job.progress(index * EXPORT_CHUNK_ROWS / total if total else None, f'{size} bytes written')
+    return {'file': path, 'filename': filename, 'rows': total, 'bytes': size}
+
+def resolve_import_path(name):
+    """Return the real path of a file in JOB_IMPORT_DIR, raising ValueError for anything outside it"""
+    if name is None:
+        return None
+    if not isinstance(name, str) or not name:
+        raise ValueError('Import files must be given as names relative to the import directory')
+    import_dir = os.path.realpath(app.config['JOB_IMPORT_DIR'])
+    path = os.path.realpath(os.path.join(import_dir, name))
+    if os.path.commonpath([import_dir, path]) != import_dir or path == import_dir:
+        raise ValueError(f'{name!r} is not a file in the import directory')
+    if not os.path.isfile(path):
+        raise ValueError(f'{name!r} was not found in the import directory')
+    return path
+
+@job_handler('import')
+def run_import_job(params, job):
+    """Import CSV or JSON Lines files from JOB_IMPORT_DIR, as scripts/import_inventory.py does"""
+    # scripts/ modules import this one, so they are only loaded inside a worker
+    from scripts.import_inventory import read_rows
+
+    counts = Counter()
+
+    def counted(kind, rows):
+        for row in rows:
+            counts[kind] += 1
+            if counts[kind] % JOB_PROGRESS_ROWS == 0:
+                job.progress(message=f'{sum(counts.values())} rows read')
+            yield row
+
+    mode = params.get('mode', 'insert')
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"mode must be one of: {', '.join(IMPORT_MODES)}")
+    # Paths come from the client, so only files under the import directory are opened
+    paths = {kind: resolve_import_path(params.get(kind)) for kind in ('component_types', 'boxes', 'box_contents')}
+    stats = bulk_import(db.session, *(counted(kind, read_rows(path)) for kind, path in paths.items()), mode=mode)
+    return {kind: {'rows': rows, 'seconds': round(seconds, 3)} for kind, (rows, seconds) in stats.items()}
+
+@job_handler('reseed')
+def run_reseed_job(params, job):
+    """Wipe the inventory and load the sample data, as scripts/init_sample_data.py does"""
+    from scripts.init_sample_data import init_sample_data
+
+    job.progress(0.0, 'Reseeding sample data')
+    init_sample_data(db.session, check=job.check)
+    return {'boxes': Box.query.count(), 'component_types': ComponentType.query.count(),
+            'entries': BoxComponent.query.count()}
+
+@job_handler('stock_report')
+def run_stock_report_job(params, job):
+    """Summarise stock by category and list the fullest and emptiest boxes, from the analytics snapshot"""
+    limit = min(max(int(params.get('boxes', 20)), 1), MAX_PER_PAGE)
+    job.progress(0.0, 'Loading the stock snapshot')
+    stock_snapshot.refresh()
+    job.progress(0.9, 'Summarising')
+    return {
+        'summary': stock_snapshot.summary(),
+        'categories': stock_snapshot.categories(int(params.get('min_quantity', 1))),
+        'fullest_boxes': stock_snapshot.boxes('fill_ratio', True, limit)[1],
+        'emptiest_boxes': stock_snapshot.boxes('fill_ratio', False, limit)[1],
+    }
+
+def serialize_job(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'error': job.error,
+        'cancel_requested': job.cancel_requested,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'status_url': url_for('api_job', job_id=job.id),
+    }
+
+@app.route('/api/jobs', methods=['POST'])
+def api_submit_job():
+    payload = request.get_json(silent=True) or {}
+    try:
+        job = submit_job(payload.get('kind'), payload.get('params', {}))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    response = jsonify({'success': True, 'job': serialize_job(job)})
+    response.status_code = 202
+    response.headers['Location'] = url_for('api_job', job_id=job.id)
+    return response
+
+@app.route('/api/jobs')
+def api_jobs():
+    query = db.session.query(Job)
+    status = request.args.get('status')
+    if status is not None:
+        query = query.filter(Job.status == status)
+    kind = request.args.get('kind')
+    if kind is not None:
+        query = query.filter(Job.kind == kind)
+    try:
+        page = paginate(query, JOB_SORTS, Job.id, 'id')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'items': [serialize_job(job) for job in page['items']],
+                    'next': page['next_cursor'], 'prev': page['prev_cursor']})
+
+@app.route('/api/jobs/<int:job_id>')
+def api_job(job_id):
+    job = db.session.get(Job, job_id) or abort(404)
+    return jsonify(serialize_job(job))
+
+@app.route('/api/jobs/<int:job_id>/result')
+def api_job_result(job_id):
+    job = db.session.get(Job, job_id) or abort(404)
+    if job.status != 'succeeded':
+        return jsonify({'success': False, 'status': job.status, 'error': job.error,
+                        'message': f'Job {job_id} is {job.status}'}), 409
+    result = json.loads(job.result)
+    if isinstance(result, dict) and 'file' in result:
+        result = dict(result, file=url_for('api_job_download', job_id=job_id))
+    return jsonify({'success': True, 'result': result})
+
+@app.route('/api/jobs/<int:job_id>/download')
+def api_job_download(job_id):
+    job = db.session.get(Job, job_id) or abort(404)
+    result = json.loads(job.result) if job.status == 'succeeded' else None
+    if not isinstance(result, dict) or 'file' not in result or not os.path.exists(result['file']):
+        abort(404)
+    return send_file(result['file'], as_attachment=True, download_name=result['filename'])
+
+@app.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+def api_cancel_job(job_id):
+    db.session.get(Job, job_id) or abort(404)
+    if not cancel_job(job_id):
+        return jsonify({'success': False, 'message': f'Job {job_id} has already finished'}), 409
+    return jsonify({'success': True, 'job': serialize_job(db.session.get(Job, job_id))})
+
+# Multi-site inventory
+# Each site in INVENTORY_SITES keeps its boxes, stock and ledger in a database
+# of its own, reached through the 'site:<name>' bind inside site_context().
+# The component type catalog is managed at the home site and copied to the
+# other sites, since capacity checks there need max_per_box. Cross-site reads
+# query every site at once on site_executor and merge the results; a site
+# that fails or times out is reported under 'errors' instead of failing the
+# whole request.
+SITE_FANOUT_WORKERS = 8
+SITE_FANOUT_TIMEOUT = 10.0  # seconds
+SITE_SEARCH_TYPES = 100  # best-ranked component types whose holders are looked up at every site
+SITE_TRANSFER_RECOVERY_AGE = 60.0  # seconds a transfer may stay 'sent' before recovery settles it
+SITE_TRANSFER_FIELDS = ('id', 'from_site', 'from_box_id', 'to_site', 'to_box_id', 'component_type_id', 'quantity')
+
+site_executor = ThreadPoolExecutor(max_workers=SITE_FANOUT_WORKERS, thread_name_prefix='site')
+
+# Home catalog version last copied to each site by this process
+_replicated_catalog_versions = {}
+_replicate_catalog_lock = threading.Lock()
+
+def all_sites():
+    """Return the home site followed by the configured sites"""
+    return [app.config['HOME_SITE'], *app.config['INVENTORY_SITES']]
+
+@contextmanager
+def site_context(site, read_only=False):
+    """Run the block with a db.session of its own that uses the site's database.
+
+    The block keeps the current app context, and g with it; only a thread
+    without one, such as a fan_out() worker, gets a fresh app context. The
+    session is removed when the block ends, committed or not.
+    """
+    if site not in all_sites():
+        raise ValueError(f'Unknown site {site!r}')
+    with ExitStack() as stack:
+        if not has_app_context():
+            stack.enter_context(app.app_context())
+        token = _site_scope.set(object())
+        try:
+            if site != app.config['HOME_SITE']:
+                db.session.info['site'] = site
+            db.session.info['read_only'] = read_only
+            yield
+        finally:
+            db.session.remove()
+            _site_scope.reset(token)
+
+def fan_out(function, sites=None):
+    """Call function(site) for every site in parallel, each inside its read-only site_context.
+
+    Returns ({site: result}, {site: error message}) for the sites that
+    answered and the ones that raised or did not answer within
+    SITE_FANOUT_TIMEOUT.
+    """
+    def run(site):
+        with site_context(site, read_only=True):
+            return function(site)
+
+    futures = {site: site_executor.submit(run, site) for site in sites or all_sites()}
+    deadline = time.monotonic() + SITE_FANOUT_TIMEOUT
+    results, errors = {}, {}
+    for site, future in futures.items():
+        try:
+            results[site] = future.result(timeout=max(deadline - time.monotonic(), 0))
+        except TimeoutError:
+            errors[site] = f'No answer within {SITE_FANOUT_TIMEOUT:g}s'
+        except Exception as e:
+            # Any failure is confined to its site, a bug in function included
+            errors[site] = str(getattr(e, 'orig', e)) or type(e).__name__
+            app.logger.warning('Site %s failed: %s', site, errors[site], exc_info=not isinstance(e, SQLAlchemyError))
+    return results, errors
+
+def replicate_catalog(site, force=False):
+    """Copy the home site's component types to a site, if they changed since the last copy.
+
+    Rows are upserted by id, so ids agree across sites. Returns the number of
+    component types copied.
+    """
+    if site == app.config['HOME_SITE']:
+        return 0
+    with _replicate_catalog_lock:
+        with site_context(app.config['HOME_SITE'], read_only=True):
+            version = load_catalog_version()
+            if not force and _replicated_catalog_versions.get(site) == version:
+                return 0
+            rows = [row._asdict() for row in db.session.execute(db.select(
+                ComponentType.id, ComponentType.name, ComponentType.description,
+                ComponentType.max_per_box, ComponentType.category
+            ))]
+
+        with site_context(site):
+            statement = sqlite_insert(ComponentType)
+            statement = statement.on_conflict_do_update(index_elements=['id'], set_={
+                column: statement.excluded[column] for column in ('name', 'description', 'max_per_box', 'category')
+            })
+            for batch in batches(rows, IMPORT_BATCH_SIZE):
+                db.session.execute(statement, batch)
+            populate_search_index(db.session.connection())
+            mark_catalog_changed(db.session)
+            db.session.commit()
+        _replicated_catalog_versions[site] = version
+        return len(rows)
+
+def site_summary(site):
+    boxes = db.session.query(db.func.count(Box.id)).scalar()
+    quantity, entries = db.session.query(
+        db.func.coalesce(db.func.sum(ComponentTypeStock.quantity), 0),
+        db.func.coalesce(db.func.sum(ComponentTypeStock.box_count), 0)
+    ).one()
+    return {'boxes': boxes, 'entries': entries, 'quantity': quantity}
+
+def site_holders(component_type_ids, limit):
+    """Return up to limit (box_id, box name, component_type_id, quantity) rows of this site's boxes
+    holding the given component types, best-ranked type (first in the list) first"""
+    rank = db.case({component_type_id: position for position, component_type_id in enumerate(component_type_ids)},
+                   value=BoxComponent.component_type_id)
+    return db.session.query(
+        BoxComponent.box_id, Box.name, BoxComponent.component_type_id, BoxComponent.quantity
+    ).join(Box, Box.id == BoxComponent.box_id).filter(
+        BoxComponent.component_type_id.in_(component_type_ids), BoxComponent.quantity > 0
+    ).order_by(rank, BoxComponent.quantity.desc(), BoxComponent.box_id).limit(limit).all()
+
+def site_stock(after, limit, component_type_ids=None):
+    """Return this site's first limit (component_type_id, quantity, box_count) rows after an id"""
+    query = db.session.query(
+        ComponentTypeStock.component_type_id, ComponentTypeStock.quantity, ComponentTypeStock.box_count
+    ).filter(ComponentTypeStock.component_type_id > after, ComponentTypeStock.box_count > 0)
+    if component_type_ids is not None:
+        query = query.filter(ComponentTypeStock.component_type_id.in_(component_type_ids))
+    return query.order_by(ComponentTypeStock.component_type_id).limit(limit).all()
+
+def transfer_between_sites(from_site, from_box_id, to_site, to_box_id, component_type_id, quantity):
+    """Move stock from a box at one site to a box at another; returns (transfer id, status).
+
+    The two databases commit separately, so the move is a small saga under one
+    SiteTransfer id: the source takes the stock out and records the transfer
+    as 'sent', the destination puts it in and records it as 'received' (at
+    most once, the id being its primary key), then the source marks it
+    'completed', or puts the stock back and marks it 'reverted' when the
+    destination had no room. A transfer left 'sent' by a crash or a busy
+    database is settled later by recover_site_transfers().
+    Raises ValueError if the source box holds too little.
+    """
+    for site in (from_site, to_site):
+        replicate_catalog(site)
+    transfer = {'id': uuid.uuid4().hex, 'from_site': from_site, 'from_box_id': from_box_id, 'to_site': to_site,
+                'to_box_id': to_box_id, 'component_type_id': component_type_id, 'quantity': quantity}
+
+    with site_context(from_site):
+        def send():
+            if not remove_stock(from_box_id, component_type_id, quantity, reason='site_out'):
+                db.session.rollback()
+                return False
+            db.session.add(SiteTransfer(status='sent', **transfer))
+            if from_site == app.config['HOME_SITE']:
+                evaluate_alerts([(from_box_id, component_type_id)])
+            db.session.commit()
+            return True
+
+        if not run_transaction(send):
+            raise ValueError('Insufficient quantity in source box')
+
+    try:
+        return transfer['id'], settle_site_transfer(transfer)
+    except OperationalError as e:
+        app.logger.warning('Site transfer %s left in transit: %s', transfer['id'], e)
+        return transfer['id'], 'sent'
+
+def deliver_site_transfer(transfer):
+    """Put a sent transfer's stock into its destination box, once; returns False if the box has no room"""
+    to_site = transfer['to_site']
+    with site_context(to_site):
+        def receive():
+            if db.session.get(SiteTransfer, transfer['id']) is not None:
+                return True
+            if not add_stock(transfer['to_box_id'], transfer['component_type_id'], transfer['quantity'],
+                             reason='site_in'):
+                db.session.rollback()
+                return False
+            db.session.add(SiteTransfer(status='received', **transfer))
+            if to_site == app.config['HOME_SITE']:
+                evaluate_alerts([(transfer['to_box_id'], transfer['component_type_id'])])
+            db.session.commit()
+            return True
+
+        try:
+            return run_transaction(receive)
+        except IntegrityError:
+            # Delivered concurrently under the same id
+            db.session.rollback()
+            return True
+
+def settle_site_transfer(transfer):
+    """Deliver a sent transfer, then complete it at its source, or revert it there if it was refused.
+
+    Returns the transfer's status at the source afterwards; it stays 'sent'
+    if the refused stock no longer fits back into the source box.
+    """
+    delivered = deliver_site_transfer(transfer)
+    from_site = transfer['from_site']
+    with site_context(from_site):
+        def finish():
+            status = 'completed' if delivered else 'reverted'
+            updated = db.session.execute(db.update(SiteTransfer).where(
+                SiteTransfer.id == transfer['id'], SiteTransfer.status == 'sent'
+            ).values(status=status, updated_at=datetime.utcnow())).rowcount
+            if not updated:
+                # Settled by someone else in the meantime
+                db.session.rollback()
+                return db.session.query(SiteTransfer.status).filter_by(id=transfer['id']).scalar()
+            if not delivered:
+                if not add_stock(transfer['from_box_id'], transfer['component_type_id'], transfer['quantity'],
+                                 reason='site_revert'):
+                    db.session.rollback()
+                    return 'sent'
+                if from_site == app.config['HOME_SITE']:
+                    evaluate_alerts([(transfer['from_box_id'], transfer['component_type_id'])])
+            db.session.commit()
+            return status
+
+        return run_transaction(finish)
+
+def recover_site_transfers(older_than=SITE_TRANSFER_RECOVERY_AGE):
+    """Settle the transfers left 'sent' for more than older_than seconds; returns {status: count}"""
+    cutoff = datetime.utcnow() - timedelta(seconds=older_than)
+    settled = Counter()
+    for site in all_sites():
+        with site_context(site):
+            stuck = [
+                {field: getattr(transfer, field) for field in SITE_TRANSFER_FIELDS}
+                for transfer in db.session.query(SiteTransfer).filter(
+                    SiteTransfer.from_site == site, SiteTransfer.status == 'sent', SiteTransfer.updated_at < cutoff
+                )
+            ]
+        for transfer in stuck:
+            settled[settle_site_transfer(transfer)] += 1
+    return dict(settled)
+
+@job_handler('recover_site_transfers')
+def run_recover_site_transfers_job(params, job):
+    """Settle cross-site transfers stuck in transit; params are older_than in seconds"""
+    return recover_site_transfers(float(params.get('older_than', SITE_TRANSFER_RECOVERY_AGE)))
+
+def parse_site_transfer(payload):
+    """Validate a cross-site transfer request, raising ValueError with a message for the client"""
+    sites = all_sites()
+    from_site, to_site = payload.get('from_site'), payload.get('to_site')
+    for site in (from_site, to_site):
+        if site not in sites:
+            raise ValueError(f'Unknown site {site!r}, expected one of: {", ".join(sites)}')
+    if from_site == to_site:
+        raise ValueError('from_site and to_site must differ, use /api/transfer_component within a site')
+    try:
+        transfer = {field: int(payload[field]) for field in ('from_box_id', 'to_box_id', 'component_type_id', 'quantity')}
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('from_box_id, to_box_id, component_type_id and quantity must be integers')
+    if transfer['quantity'] <= 0:
+        raise ValueError('Quantity must be positive')
+    if get_component_type(transfer['component_type_id']) is None:
+        raise ValueError(f'Component type {transfer["component_type_id"]} not found')
+    for site, box_id in ((from_site, transfer['from_box_id']), (to_site, transfer['to_box_id'])):
+        with site_context(site, read_only=True):
+            if db.session.get(Box, box_id) is None:
+                raise ValueError(f'Box {box_id} not found at site {site!r}')
+    return dict(transfer, from_site=from_site, to_site=to_site)
+
+@app.route('/api/sites')
+def api_sites():
+    results, errors = fan_out(site_summary)
+    return jsonify({
+        'home': app.config['HOME_SITE'],
+        'sites': [dict(results[site], name=site) for site in all_sites() if site in results],
+        'errors': errors
+    })
+
+@app.route('/api/sites/search')
+@read_only
+def api_sites_search():
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', PER_PAGE, type=int), 1), MAX_PER_PAGE)
+    match = build_search_match(query)
+    if match is None:
+        return jsonify({'query': query, 'results': [], 'errors': {}})
+
+    matches = search_matches(match)
+    ranked = db.session.query(ComponentType.id, ComponentType.name).join(
+        matches, matches.c.id == ComponentType.id
+    ).order_by(matches.c.rank, ComponentType.id).limit(SITE_SEARCH_TYPES).all()
+    if not ranked:
+        return jsonify({'query': query, 'results': [], 'errors': {}})
+    component_type_ids = [component_type_id for component_type_id, _ in ranked]
+    names = dict(ranked)
+    position = {component_type_id: i for i, component_type_id in enumerate(component_type_ids)}
+
+    # Each site returns its own best rows, so the overall best are among them
+    results, errors = fan_out(lambda site: site_holders(component_type_ids, limit))
+    holders = sorted(
+        (position[component_type_id], -quantity, site, box_name, box_id, component_type_id)
+        for site, rows in results.items()
+        for box_id, box_name, component_type_id, quantity in rows
+    )[:limit]
+    return jsonify({
+        'query': query,
+        'results': [{
+            'site': site, 'box_id': box_id, 'box_name': box_name, 'component_type_id': component_type_id,
+            'component_name': names[component_type_id], 'quantity': -negative_quantity
+        } for _, negative_quantity, site, box_name, box_id, component_type_id in holders],
+        'errors': errors
+    })
+
+@app.route('/api/sites/stock')
+@read_only
+def api_sites_stock():
+    """Stock totals per component type across all sites, in id order, with each site's share"""
+    per_page = min(max(request.args.get('per_page', PER_PAGE, type=int), 1), MAX_PER_PAGE)
+    after = 0
+    if request.args.get('after'):
+        try:
+            _, after = decode_cursor(request.args['after'], ComponentTypeStock.component_type_id)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+    component_type_ids = None
+    category = request.args.get('category')
+    if category is not None:
+        component_type_ids = [component_type_id for component_type_id, in db.session.query(ComponentType.id).filter(
+            db.func.coalesce(ComponentType.category, '') == category
+        )]
+
+    # Each site returns its first per_page ids, so the first per_page of their
+    # union are complete: no site can hold one of them beyond its own page
+    results, errors = fan_out(lambda site: site_stock(after, per_page, component_type_ids))
+    totals = {}
+    for site, rows in results.items():
+        for component_type_id, quantity, box_count in rows:
+            total = totals.setdefault(component_type_id, {'quantity': 0, 'box_count': 0, 'sites': {}})
+            total['quantity'] += quantity
+            total['box_count'] += box_count
+            total['sites'][site] = quantity
+    page = sorted(totals)[:per_page]
+    component_types = get_component_types_by_id(page)
+    items = [dict(totals[component_type_id], id=component_type_id,
+                  name=component_types[component_type_id].name,
+                  category=component_types[component_type_id].category,
+                  max_per_box=component_types[component_type_id].max_per_box)
+             for component_type_id in page if component_type_id in component_types]
+    next_cursor = encode_cursor(page[-1], page[-1]) if len(page) == per_page else None
+    return jsonify({'items': items, 'next': next_cursor, 'errors': errors})
+
+@app.route('/api/sites/transfer', methods=['POST'])
+def api_site_transfer():
+    try:
+        transfer = parse_site_transfer(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    try:
+        transfer_id, status = transfer_between_sites(**transfer)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 409
+
+    component_type = get_component_type(transfer['component_type_id'])
+    if status == 'completed':
+        return jsonify({'success': True, 'transfer_id': transfer_id, 'status': status,
+                        'message': f'Transferred {transfer["quantity"]} {component_type.name}(s) '
+                                   f'from {transfer["from_site"]} to {transfer["to_site"]}'})
+    if status == 'reverted':
+        return jsonify({'success': False, 'transfer_id': transfer_id, 'status': status,
+                        'message': f'Transfer would exceed capacity at {transfer["to_site"]}, '
+                                   f'the stock was returned to the source box'}), 409
+    return jsonify({'success': True, 'transfer_id': transfer_id, 'status': status,
+                    'message': 'Transfer is in transit and will be settled by recovery'}), 202
+
+@app.route('/api/sites/sync_catalog', methods=['POST'])
+def api_sync_site_catalog():
+    copied = {site: replicate_catalog(site, force=True) for site in app.config['INVENTORY_SITES']}
+    return jsonify({'success': True, 'component_types': copied})
+
+# Scan ingestion
+# Barcode and RFID scanners report (tag, box, delta) scans, often in bursts of
+# the same part into the same box. Tags are resolved through an in-memory
+# index cached like the catalog, scans are summed per box entry for
+# SCAN_COALESCE_WINDOW, and each window is applied in one transaction.
+SCAN_COALESCE_WINDOW = 0.05  # seconds
+SCAN_MAX_PENDING = 5000  # box entries pending before the window is committed early
+SCAN_MAX_ERRORS = 20  # rejections reported per upload
+SCAN_LOOKUP_BATCH = 1000  # box entries read per query when planning a window
+SCAN_READ_AHEAD = 10000  # uploaded lines read ahead of the ingester
+SCAN_TAG_SORTS = {'tag': ScanTag.tag, 'created_at': ScanTag.created_at}
+
+def get_scan_tags():
+    """Return {tag: ('box' or 'component_type', id)} for every scan tag"""
+    scan_tag_cache.sync_version(lambda: load_catalog_version('scan_tags_version'))
+    return scan_tag_cache.get(('scan_tags',), lambda: {
+        tag: ('box', box_id) if box_id is not None else ('component_type', component_type_id)
+        for tag, box_id, component_type_id in db.session.query(
+            ScanTag.tag, ScanTag.box_id, ScanTag.component_type_id
+        )
+    })
+
+def parse_scan(line):
+    """Parse one scan, 'tag,box,delta' or {"tag": ..., "box": ..., "delta": ...}, into (tag, box, delta)"""
+    line = line.strip()
+    if line.startswith('{'):
+        try:
+            scan = json.loads(line)
+            return str(scan['tag']), str(scan['box']), int(scan['delta'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Expected {"tag": ..., "box": ..., "delta": ...}')
+    fields = line.split(',')
+    if len(fields) != 3:
+        raise ValueError('Expected tag,box,delta')
+    try:
+        return fields[0].strip(), fields[1].strip(), int(fields[2])
+    except ValueError:
+        raise ValueError('delta must be an integer')
+
+def apply_stock_deltas(deltas, reason):
+    """Apply net changes {(box_id, component_type_id): delta} in bulk; returns the set of refused keys.
+
+    A change is refused, leaving its entry as it was, if it would take the
+    entry below zero or above max_per_box. Entries are read and then written
+    with the values computed from them, so this must run under SQLite's write
+    lock, in run_transaction(..., locked=True). The writes are a few
+    executemany statements however many entries changed.
+    """
+    keys = [key for key, delta in deltas.items() if delta]
+    max_per_box = dict(db.session.query(ComponentType.id, ComponentType.max_per_box).filter(
+        ComponentType.id.in_({component_type_id for _, component_type_id in keys})
+    ))
+    current = {}
+    for batch in batches(keys, SCAN_LOOKUP_BATCH):
+        current.update(((box_id, component_type_id), quantity) for box_id, component_type_id, quantity in
+                       db.session.query(BoxComponent.box_id, BoxComponent.component_type_id, BoxComponent.quantity)
+                       .filter(db.tuple_(BoxComponent.box_id, BoxComponent.component_type_id).in_(batch)))
+
+    now = datetime.utcnow()
+    refused = set()
+    upserts, deletes, movements = [], [], []
+    for box_id, component_type_id in keys:
+        delta = deltas[(box_id, component_type_id)]
+        quantity = current.get((box_id, component_type_id), 0) + delta
+        if not 0 <= quantity <= max_per_box.get(component_type_id, -1):
+            refused.add((box_id, component_type_id))
+            continue
+        if quantity:
+            upserts.append({'box_id': box_id, 'component_type_id': component_type_id,
+                            'quantity': quantity, 'last_updated': now})
+        else:
+            deletes.append({'entry_box_id': box_id, 'entry_component_type_id': component_type_id})
+        movements.append({'box_id': box_id, 'component_type_id': component_type_id, 'delta': delta,
+                          'reason': reason, 'created_at': now})
+
+    table = BoxComponent.__table__
+    if upserts:
+        statement = sqlite_insert(table)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['box_id', 'component_type_id'],
+            set_={'quantity': statement.excluded.quantity, 'last_updated': statement.excluded.last_updated}
+        ), upserts)
+    if deletes:
+        db.session.execute(table.delete().where(
+            table.c.box_id == db.bindparam('entry_box_id'),
+            table.c.component_type_id == db.bindparam('entry_component_type_id')
+        ), deletes)
+    if movements:
+        db.session.execute(StockMovement.__table__.insert(), movements)
+        count_stock_movements(db.session, len(movements))
+        db.session.info['stock_moved'] = True
+    return refused
+
+class ScanIngester:
+    """Sum scans per (box_id, component_type_id) and apply each window's net changes as one commit.
+
+    Capacity and availability are checked on each entry's net change, so a
+    window that would overfill a box or take out more than it holds is
+    rejected for that entry alone and the rest still apply.
+    Scans are only committed by flush(); callers flush when due() or when
+    their stream ends.
+    """
+
+    def __init__(self, window=SCAN_COALESCE_WINDOW, max_pending=SCAN_MAX_PENDING, max_errors=SCAN_MAX_ERRORS):
+        self.window = window
+        self.max_pending = max_pending
+        self.max_errors = max_errors
+        self.stats = Counter(scans=0, applied=0, rejected=0, commits=0)
+        self.errors = []
+        self._pending = Counter()
+        self._pending_scans = Counter()
+        self._first_pending_at = None
+        self._refresh()
+
+    def _refresh(self):
+        self._tags = get_scan_tags()
+        self._box_ids = {box.id for box in get_all_boxes()}
+
+    def _resolve_box(self, box):
+        target = self._tags.get(box)
+        if target is not None and target[0] == 'box':
+            return target[1]
+        if box.isdigit() and int(box) in self._box_ids:
+            return int(box)
+        raise ValueError(f'Unknown box {box!r}')
+
+    def reject(self, message, scans=1):
+        self.stats['rejected'] += scans
+        if len(self.errors) < self.max_errors:
+            self.errors.append(message)
+
+    def feed(self, tag, box, delta):
+        """Queue one scan, box being a box tag or id; raises ValueError if it cannot be resolved"""
+        self.stats['scans'] += 1
+        target = self._tags.get(tag)
+        if target is None or target[0] != 'component_type':
+            raise ValueError(f'Unknown component tag {tag!r}')
+        if delta == 0:
+            raise ValueError('delta must not be zero')
+        key = (self._resolve_box(box), target[1])
+        if self._first_pending_at is None:
+            self._first_pending_at = time.monotonic()
+        self._pending[key] += delta
+        self._pending_scans[key] += 1
+
+    def feed_line(self, line, label=''):
+        """Parse and queue one scan, recording it as rejected if it is malformed or unknown"""
+        try:
+            scan = parse_scan(line)
+        except ValueError as e:
+            self.stats['scans'] += 1
+            self.reject(f'{label}{e}')
+            return
+        try:
+            self.feed(*scan)
+        except ValueError as e:
+            self.reject(f'{label}{e}')
+
+    def due(self):
+        return self._first_pending_at is not None and (
+            len(self._pending) >= self.max_pending or time.monotonic() - self._first_pending_at >= self.window
+        )
+
+    def time_left(self):
+        """Seconds until the pending window is due, or None when nothing is pending"""
+        if self._first_pending_at is None:
+            return None
+        return max(self._first_pending_at + self.window - time.monotonic(), 0)
+
+    def flush(self):
+        """Apply the pending net changes in one transaction"""
+        pending, scans = self._pending, self._pending_scans
+        self._pending, self._pending_scans, self._first_pending_at = Counter(), Counter(), None
+        if pending:
+            def apply():
+                refused = apply_stock_deltas(pending, reason='scan')
+                evaluate_alerts([key for key, delta in pending.items() if delta and key not in refused])
+                db.session.commit()
+                return refused
+
+            refused = run_transaction(apply, locked=True)
+            self.stats['commits'] += 1
+            for key, count in scans.items():
+                if key not in refused:
+                    self.stats['applied'] += count
+                    continue
+                box_id, component_type_id = key
+                problem = 'would exceed capacity' if pending[key] > 0 else 'is more than the box holds'
+                self.reject(f'Box {box_id}, component type {component_type_id}: '
+                            f'net change {pending[key]:+d} {problem}', scans=count)
+        self._refresh()
+
+def serialize_scan_tag(scan_tag):
+    return {
+        'id': scan_tag.id,
+        'tag': scan_tag.tag,
+        'box_id': scan_tag.box_id,
+        'component_type_id': scan_tag.component_type_id,
+    }
+
+def parse_scan_tag(payload):
+    """Validate a tag from JSON, returning an unsaved ScanTag or raising ValueError"""
+    tag = str(payload.get('tag') or '').strip()
+    if not tag or len(tag) > 64 or ',' in tag:
+        raise ValueError('tag must be 1 to 64 characters without commas')
+    box_id = payload.get('box_id')
+    component_type_id = payload.get('component_type_id')
+    if (box_id is None) == (component_type_id is None):
+        raise ValueError('Give either box_id or component_type_id')
+    try:
+        box_id = None if box_id is None else int(box_id)
+        component_type_id = None if component_type_id is None else int(component_type_id)
+    except (TypeError, ValueError):
+        raise ValueError('box_id and component_type_id must be integers')
+    if box_id is not None and get_box(box_id) is None:
+        raise ValueError(f'Box {box_id} not found')
+    if component_type_id is not None and get_component_type(component_type_id) is None:
+        raise ValueError(f'Component type {component_type_id} not found')
+    return ScanTag(tag=tag, box_id=box_id, component_type_id=component_type_id)
+
+@app.route('/api/scan_tags')
+@read_only
+def api_scan_tags():
+    query = db.session.query(ScanTag)
+    for arg in ('box_id', 'component_type_id'):
+        value = request.args.get(arg, type=int)
+        if value is not None:
+            query = query.filter(getattr(ScanTag, arg) == value)
+    try:
+        page = paginate(query, SCAN_TAG_SORTS, ScanTag.id, 'tag')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'items': [serialize_scan_tag(scan_tag) for scan_tag in page['items']],
+                    'next': page['next_cursor'], 'prev': page['prev_cursor']})
+
+@app.route('/api/scan_tags', methods=['POST'])
+def api_add_scan_tag():
+    try:
+        scan_tag = parse_scan_tag(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    db.session.add(scan_tag)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Tag {scan_tag.tag!r} is already in use'}), 409
+    return jsonify({'success': True, 'scan_tag': serialize_scan_tag(scan_tag)})
+
+@app.route('/api/scan_tags/<int:scan_tag_id>', methods=['DELETE'])
+def api_delete_scan_tag(scan_tag_id):
+    scan_tag = db.session.get(ScanTag, scan_tag_id) or abort(404)
+    db.session.delete(scan_tag)
+    db.session.commit()
+    return jsonify({'success': True, 'message': f'Deleted tag {scan_tag.tag!r}'})
+
+def read_scan_lines(stream, lines, stopped):
+    """Put each line of stream on the lines queue, then None, or the error that ended the read.
+
+    Runs on a thread of its own, so the request thread can wait for a line
+    with a timeout. Gives up when stopped is set, as nobody is taking lines.
+    """
+    end = None
+    try:
+        for line in stream:
+            while not stopped.is_set():
+                try:
+                    lines.put(line, timeout=SCAN_COALESCE_WINDOW)
+                    break
+                except queue.Full:
+                    pass
+            if stopped.is_set():
+                return
+    except Exception as e:
+        end = e
+    lines.put(end)
+
+@app.route('/api/scans', methods=['POST'])
+def api_scans():
+    """Apply scans uploaded one per line, as they arrive; a chunked upload can stream for as long as it likes.
+
+    A window is committed once it has passed, whether or not another line has
+    arrived, and the rest when the upload ends.
+    """
+    ingester = ScanIngester()
+    lines = queue.Queue(SCAN_READ_AHEAD)
+    stopped = threading.Event()
+    threading.Thread(target=read_scan_lines, args=(request.stream, lines, stopped),
+                     name='scan-reader', daemon=True).start()
+    try:
+        number = 0
+        while True:
+            try:
+                line = lines.get(timeout=ingester.time_left())
+            except queue.Empty:
+                # The scanner went quiet with a window pending
+                ingester.flush()
+                continue
+            if line is None:
+                break
+            if isinstance(line, Exception):
+                raise line
+            number += 1
+            line = line.decode('utf-8', 'replace')
+            if not line.strip():
+                continue
+            ingester.feed_line(line, label=f'Line {number}: ')
+            if ingester.due():
+                ingester.flush()
+    finally:
+        stopped.set()
+    ingester.flush()
+    return jsonify(dict(ingester.stats, success=not ingester.stats['rejected'], errors=ingester.errors))
+
+# Request profiling
+# With PROFILING on, each request collects its SQL statements and template
+# render time in g.profile and reports them in a Server-Timing header, and
+# per-endpoint totals are kept for /metrics in the Prometheus text format. The
+# same SQL run PROFILE_DUPLICATE_THRESHOLD or more times in one request is
+# logged as a likely N+1. Nothing here is hooked up unless PROFILING is on.
+PROFILE_DUPLICATE_THRESHOLD = 5
+METRIC_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class RequestMetrics:
+    """Thread-safe per-endpoint request counters and latency histograms"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.requests = Counter()        # (endpoint, method, status) -> requests
+        self.durations = {}              # endpoint -> bucket counts, then sum and count
+        self.sql_statements = Counter()  # endpoint -> statements
+        self.sql_seconds = Counter()     # endpoint -> seconds spent in statements
+        self.render_seconds = Counter()  # endpoint -> seconds spent rendering templates
+        self.duplicate_queries = Counter()  # endpoint -> requests with a repeated query
+
+    def observe(self, endpoint, method, status, seconds, profile, duplicates):
+        with self._lock:
+            self.requests[endpoint, method, status] += 1
+            histogram = self.durations.setdefault(endpoint, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+            self.sql_statements[endpoint] += profile['sql_count']
+            self.sql_seconds[endpoint] += profile['sql_seconds']
+            self.render_seconds[endpoint] += profile['render_seconds']
+            self.duplicate_queries[endpoint] += bool(duplicates)
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def family(name, kind, description, samples, suffix=''):
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            add_samples(name + suffix, samples)
+
+        def add_samples(name, samples):
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{label}"' for key, label in labels)
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+        with self._lock:
+            family('inventory_requests_total', 'counter', 'Requests handled.', [
+                ((('endpoint', endpoint), ('method', method), ('status', status)), count)
+                for (endpoint, method, status), count in sorted(self.requests.items())
+            ])
+            durations = sorted(self.durations.items())
+            family('inventory_request_duration_seconds', 'histogram', 'Time to handle a request.', [
+                ((('endpoint', endpoint), ('le', bound)), count)
+                for endpoint, histogram in durations
+                for bound, count in zip(self.buckets + ('+Inf',), histogram[:-2] + histogram[-1:])
+            ], suffix='_bucket')
+            add_samples('inventory_request_duration_seconds_sum',
+                        [((('endpoint', endpoint),), histogram[-2]) for endpoint, histogram in durations])
+            add_samples('inventory_request_duration_seconds_count',
+                        [((('endpoint', endpoint),), histogram[-1]) for endpoint, histogram in durations])
+            for name, description, values in [
+                ('inventory_sql_statements_total', 'SQL statements executed.', self.sql_statements),
+                ('inventory_sql_seconds_total', 'Time spent executing SQL statements.', self.sql_seconds),
+                ('inventory_template_render_seconds_total', 'Time spent rendering templates.', self.render_seconds),
+                ('inventory_duplicate_query_requests_total', 'Requests that repeated one query '
+                 f'{PROFILE_DUPLICATE_THRESHOLD} or more times.', self.duplicate_queries),
+            ]:
+                family(name, 'counter', description,
+                       [((('endpoint', endpoint),), value) for endpoint, value in sorted(values.items())])
+        cache = catalog_cache.stats()
+        for name in ('hits', 'misses', 'evictions', 'invalidations'):
+            family(f'inventory_catalog_cache_{name}_total', 'counter', f'Catalog cache {name}.', [((), cache[name])])
+        family('inventory_catalog_cache_entries', 'gauge', 'Entries in the catalog cache.', [((), cache['size'])])
+        return '\n'.join(lines) + '\n'
+
+request_metrics = RequestMetrics(METRIC_DURATION_BUCKETS)
+# Cumulative cProfile statistics of the sampled requests, by endpoint
+endpoint_profiles = {}
+endpoint_profiles_lock = threading.Lock()
+
+def _request_profile():
+    return g.get('profile') if has_app_context() else None
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _request_profile()
+    if profile is not None:
+        conn.info.setdefault('profile_query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _request_profile()
+    starts = conn.info.get('profile_query_start')
+    if profile is not None and starts:
+        profile['sql_seconds'] += time.perf_counter() - starts.pop()
+        profile['sql_count'] += 1
+        profile['statements'][statement] += 1
+
+def _before_render_template(sender, template, context, **extra):
+    profile = _request_profile()
+    if profile is not None:
+        profile['render_start'] = time.perf_counter()
+
+def _template_rendered(sender, template, context, **extra):
+    profile = _request_profile()
+    if profile is not None and 'render_start' in profile:
+        profile['render_seconds'] += time.perf_counter() - profile.pop('render_start')
+
+def _start_request_profile():
+    g.profile = {'start': time.perf_counter(), 'sql_count': 0, 'sql_seconds': 0.0,
+                 'render_seconds': 0.0, 'statements': Counter()}
+    if app.config['PROFILE_SAMPLE_RATE'] and random.random() < app.config['PROFILE_SAMPLE_RATE']:
+        import cProfile  # only loaded once sampling is on, to keep startup short
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another request in this process is already being profiled
+            return
+        g.profiler = profiler
+
+def _finish_request_profile(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        save_endpoint_profile(request.endpoint or 'unmatched', profiler)
+
+    seconds = time.perf_counter() - profile['start']
+    endpoint = request.endpoint or 'unmatched'
+    duplicates = {statement: count for statement, count in profile['statements'].items()
+                  if count >= PROFILE_DUPLICATE_THRESHOLD}
+    for statement, count in duplicates.items():
+        app.logger.warning('%s %s ran the same query %d times: %s',
+                           request.method, request.path, count, ' '.join(statement.split())[:200])
+    request_metrics.observe(endpoint, request.method, response.status_code, seconds, profile, duplicates)
+
+    timings = [
+        f'app;dur={seconds * 1000:.2f}',
+        f'sql;dur={profile["sql_seconds"] * 1000:.2f};desc="{profile["sql_count"]} statements"',
+        f'render;dur={profile["render_seconds"] * 1000:.2f}',
+    ]
+    if duplicates:
+        timings.append(f'dup;desc="{max(duplicates.values())} repeated queries"')
+    response.headers.add('Server-Timing', ', '.join(timings))
+    return response
+
+def save_endpoint_profile(endpoint, profiler):
+    """Merge a sampled request into its endpoint's .prof file under PROFILE_DIR"""
+    import pstats
+    with endpoint_profiles_lock:
+        stats = endpoint_profiles.get(endpoint)
+        if stats is None:
+            stats = endpoint_profiles[endpoint] = pstats.Stats(profiler)
+        else:
+            stats.add(profiler)
+        os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+        stats.dump_stats(os.path.join(app.config['PROFILE_DIR'], f'{endpoint}.prof'))
+
+def profile_engine(engine):
+    """Time the SQL statements of an engine; called as each engine is created when PROFILING is on"""
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+def enable_profiling():
+    """Install the request and template hooks; called by create_app() when PROFILING is on"""
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
+    app.before_request(_start_request_profile)
+    app.after_request(_finish_request_profile)
+
+@app.route('/metrics')
+def metrics():
+    if not app.config['PROFILING']:
+        abort(404)
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def site_engines():
+    return {site: db.engines[f'site:{site}'] for site in app.config['INVENTORY_SITES']}
+
+def migrate_database():
+    """Apply pending schema migrations to the inventory, job and site databases"""
+    return migrate(db.engine, db.engines['jobs'], site_engines())
+
+def schema_is_up_to_date():
+    return schema_is_current(db.engine, db.engines['jobs'], site_engines())
+
+def init_db():
+    """Bring the schema up to date and add sample data to an empty database, for tests and benchmarks"""
+    migrate_database()
+    
+    # Check if data already exists
+    if ComponentType.query.first():
+        return
+    
+    # Add sample component types based on the Raspberry Pi kit
+    sample_components = [
+        ('Raspberry Pi Pico', 'Main microcontroller board', 1, 'Controllers'),
+        ('IR Tracking Sensor', 'Infrared tracking sensor module', 2, 'Sensors'),
+        ('IR Remote Module', 'Infrared remote control module', 1, 'Controllers'),
+        ('Infrared Remote Control', 'Remote control device', 1, 'Controllers'),
+        ('LED', 'Light emitting diode', 10, 'Electronics'),
+        ('RGB LED', 'Multi-color LED', 5, 'Electronics'),
+        ('Button', 'Push button switch', 5, 'Electronics'),
         ('Buzzer', 'Sound buzzer module', 2, 'Electronics'),
         ('PIR Sensor', 'Passive infrared motion sensor', 1, 'Sensors'),
         ('Light Sensor', 'Photoresistor light sensor', 2, 'Sensors'),
@@ -346,15 +4153,6 @@ def init_db():
         ('Male-male Long Line', 'Long jumper wires', 10, 'Cables')
     ]
     
-    for name, desc, max_qty, category in sample_components:
-        component = ComponentType(
-            name=name,
-            description=desc,
-            max_per_box=max_qty,
-            category=category
-        )
-        db.session.add(component)
-    
     # Add sample boxes
     sample_boxes = [
         ('Raspberry Pi Kit A', 'Primary development kit'),
@@ -362,13 +4160,19 @@ def init_db():
         ('Sensor Collection', 'Specialized sensor toolkit')
     ]
     
-    for name, desc in sample_boxes:
-        box = Box(name=name, description=desc)
-        db.session.add(box)
-    
-    db.session.commit()
+    bulk_import(
+        db.session,
+        component_types=[
+            {'name': name, 'description': desc, 'max_per_box': max_qty, 'category': category}
+            for name, desc, max_qty, category in sample_components
+        ],
+        boxes=[{'name': name, 'description': desc} for name, desc in sample_boxes]
+    )
 
 if __name__ == '__main__':
+    create_app()
+    # The schema is only checked here, never created: that is scripts/migrate.py's job
     with app.app_context():
-        init_db()
+        if not schema_is_up_to_date():
+            raise SystemExit('The database schema is out of date, run python scripts/migrate.py first')
     app.run(debug=True)
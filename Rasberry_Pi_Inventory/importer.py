@@ -0,0 +1,237 @@
+"""
+Bulk import of component types, boxes and box contents
+Plain SQLAlchemy on a Session, with no Flask imports, so that
+scripts/init_sample_data.py and scripts/import_inventory.py load only this
+module and models.py; app.py passes db.session for its import jobs.
+"""
+
+from datetime import datetime
+import time
+
+from sqlalchemy import and_, column, delete, func, insert, literal, select, table, text, true
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+
+from models import (Box, BoxComponent, ComponentType, StockMovement, checkpoint_stock_if_due, mark_catalog_changed,
+                    populate_search_index)
+
+# Component types, boxes and box contents are loaded with executemany in
+# batches of IMPORT_BATCH_SIZE, all inside one transaction. Box contents name
+# their box and component type, which are resolved through in-memory maps
+# rather than a query per row.
+IMPORT_BATCH_SIZE = 10000
+IMPORT_MODES = ('insert', 'upsert')
+MAX_IMPORT_ERRORS = 20
+
+IMPORT_CONTENTS_DDL = (
+    'CREATE TEMP TABLE import_box_content ('
+    'box_id INTEGER NOT NULL, component_type_id INTEGER NOT NULL, quantity INTEGER NOT NULL, '
+    'PRIMARY KEY (box_id, component_type_id))'
+)
+import_box_content = table(
+    'import_box_content', column('box_id'), column('component_type_id'), column('quantity')
+)
+
+def batches(rows, batch_size):
+    """Yield lists of up to batch_size rows, for executemany"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _import_int(row, field, minimum):
+    try:
+        value = int(row[field])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f'{field} must be an integer') from None
+    if value < minimum:
+        raise ValueError(f'{field} must be at least {minimum}')
+    return value
+
+def _import_name(row, field='name'):
+    name = (row.get(field) or '').strip()
+    if not name:
+        raise ValueError(f'{field} is required')
+    return name
+
+def _validated(kind, rows, convert, errors):
+    """Yield convert(row) for each row, collecting 'kind row N: message' errors instead of stopping"""
+    for number, row in enumerate(rows, start=1):
+        try:
+            yield convert(row)
+        except ValueError as e:
+            if len(errors) < MAX_IMPORT_ERRORS:
+                errors.append(f'{kind} row {number}: {e}')
+
+def _component_type_values(row):
+    return {
+        'name': _import_name(row),
+        'description': row.get('description') or '',
+        'max_per_box': _import_int(row, 'max_per_box', 1),
+        'category': row.get('category') or '',
+    }
+
+def _box_values(row):
+    return {'name': _import_name(row), 'description': row.get('description') or ''}
+
+def _insert_statement(model, mode, update_columns, index_elements):
+    statement = sqlite_insert(model.__table__)
+    if mode == 'upsert':
+        statement = statement.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={column: statement.excluded[column] for column in update_columns}
+        )
+    return statement
+
+def bulk_import(session, component_types=(), boxes=(), box_contents=(), mode='insert', batch_size=IMPORT_BATCH_SIZE):
+    """Load component types, boxes and box contents from iterables of dicts in a single transaction.
+
+    component_types rows have name, description, max_per_box and category;
+    boxes rows have name and description; box_contents rows name their box
+    and component_type and give a quantity. In 'insert' mode existing names
+    or entries are an error; in 'upsert' mode they are updated, and a box
+    entry with quantity 0 is removed. Stock changes are recorded in the
+    ledger with reason 'import'. The import is committed on session, and a
+    stock checkpoint is taken afterwards if it brought one due.
+
+    Returns {kind: (rows, seconds)}. Raises ValueError, leaving the database
+    unchanged, if any row is invalid, a quantity exceeds max_per_box or an
+    insert collides with existing data.
+    """
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"Mode must be one of: {', '.join(IMPORT_MODES)}")
+    errors = []
+    stats = {}
+    try:
+        start = time.perf_counter()
+        count = 0
+        statement = _insert_statement(ComponentType, mode, ['description', 'max_per_box', 'category'], ['name'])
+        for batch in batches(_validated('component_types', component_types, _component_type_values, errors), batch_size):
+            session.execute(statement, batch)
+            count += len(batch)
+        stats['component_types'] = (count, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        count = 0
+        statement = _insert_statement(Box, mode, ['description'], ['name'])
+        for batch in batches(_validated('boxes', boxes, _box_values, errors), batch_size):
+            session.execute(statement, batch)
+            count += len(batch)
+        stats['boxes'] = (count, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        count = _import_box_contents(session, box_contents, mode, batch_size, errors)
+        stats['box_contents'] = (count, time.perf_counter() - start)
+
+        if mode == 'upsert' and stats['component_types'][0] and not errors:
+            # An upsert may have lowered max_per_box below stock this import did not replace
+            over_capacity = session.execute(
+                select(Box.name, ComponentType.name, BoxComponent.quantity).select_from(BoxComponent)
+                .join(Box).join(ComponentType).where(BoxComponent.quantity > ComponentType.max_per_box)
+                .limit(MAX_IMPORT_ERRORS)
+            )
+            for box_name, component_type_name, quantity in over_capacity:
+                errors.append(f'box {box_name!r} holds {quantity} {component_type_name!r}, more than its max_per_box')
+        if errors:
+            raise ValueError('\n'.join(errors))
+        if stats['component_types'][0] or stats['boxes'][0]:
+            mark_catalog_changed(session)
+        # Core inserts bypass the mapper events in app.py that maintain the
+        # search index, so it is rebuilt before the import commits
+        connection = session.connection()
+        populate_search_index(connection)
+        engine = connection.engine
+        session.commit()
+    except IntegrityError as e:
+        session.rollback()
+        raise ValueError(f'Import conflicts with existing data (use upsert mode to update it): {e.orig}') from e
+    except Exception:
+        session.rollback()
+        raise
+    if stats['box_contents'][0]:
+        # Scripts have no background checkpointer, and an import can write
+        # more movements than a whole checkpoint interval
+        with engine.begin() as connection:
+            checkpoint_stock_if_due(connection)
+    return stats
+
+def _import_box_contents(session, rows, mode, batch_size, errors):
+    """Stage box contents in a temp table, then validate and apply them with set-based statements"""
+    box_ids = dict(session.execute(select(Box.name, Box.id)).all())
+    component_types = {
+        name: (component_type_id, max_per_box)
+        for name, component_type_id, max_per_box in session.execute(
+            select(ComponentType.name, ComponentType.id, ComponentType.max_per_box)
+        )
+    }
+    seen = set()
+
+    def convert(row):
+        box_name = _import_name(row, 'box')
+        component_type_name = _import_name(row, 'component_type')
+        quantity = _import_int(row, 'quantity', 0)
+        if box_name not in box_ids:
+            raise ValueError(f'unknown box {box_name!r}')
+        if component_type_name not in component_types:
+            raise ValueError(f'unknown component type {component_type_name!r}')
+        component_type_id, max_per_box = component_types[component_type_name]
+        if quantity > max_per_box:
+            raise ValueError(f'quantity {quantity} exceeds max_per_box {max_per_box} for {component_type_name!r}')
+        key = (box_ids[box_name], component_type_id)
+        if key in seen:
+            raise ValueError(f'{component_type_name!r} is listed twice for box {box_name!r}')
+        seen.add(key)
+        return {'box_id': key[0], 'component_type_id': key[1], 'quantity': quantity}
+
+    session.execute(text('DROP TABLE IF EXISTS temp.import_box_content'))
+    session.execute(text(IMPORT_CONTENTS_DDL))
+    count = 0
+    for batch in batches(_validated('box_contents', rows, convert, errors), batch_size):
+        session.execute(import_box_content.insert(), batch)
+        count += len(batch)
+    if not errors:
+        _apply_box_contents(session, mode)
+    session.execute(text('DROP TABLE temp.import_box_content'))
+    return count
+
+def _apply_box_contents(session, mode):
+    """Record the ledger movements for the staged contents and write them to BoxComponent"""
+    current = func.coalesce(BoxComponent.quantity, 0)
+    now = datetime.utcnow()
+    session.execute(insert(StockMovement).from_select(
+        ['box_id', 'component_type_id', 'delta', 'reason', 'created_at'],
+        select(
+            import_box_content.c.box_id,
+            import_box_content.c.component_type_id,
+            import_box_content.c.quantity - current,
+            literal('import'),
+            literal(now)
+        ).select_from(import_box_content).outerjoin(BoxComponent, and_(
+            BoxComponent.box_id == import_box_content.c.box_id,
+            BoxComponent.component_type_id == import_box_content.c.component_type_id
+        )).where(import_box_content.c.quantity != current)
+    ))
+    staged = select(
+        import_box_content.c.box_id,
+        import_box_content.c.component_type_id,
+        import_box_content.c.quantity,
+        literal(now)
+    )
+    columns = ['box_id', 'component_type_id', 'quantity', 'last_updated']
+    if mode == 'insert':
+        statement = sqlite_insert(BoxComponent).from_select(columns, staged.where(import_box_content.c.quantity > 0))
+    else:
+        # SQLite needs a WHERE on the SELECT to parse the ON CONFLICT clause after it
+        statement = sqlite_insert(BoxComponent).from_select(columns, staged.where(true()))
+        statement = statement.on_conflict_do_update(
+            index_elements=['box_id', 'component_type_id'],
+            set_={'quantity': statement.excluded.quantity, 'last_updated': statement.excluded.last_updated},
+            where=BoxComponent.quantity != statement.excluded.quantity
+        )
+        session.execute(statement)
+        statement = delete(BoxComponent).where(BoxComponent.quantity == 0)
+    session.execute(statement)
@@ -0,0 +1,641 @@
+"""
+Database models and schema migrations of the inventory
+Plain SQLAlchemy with no Flask imports, so scripts that only need the tables
+(scripts/migrate.py, cron jobs) start without loading the web app; app.py
+hands Base to Flask-SQLAlchemy as its model class.
+"""
+
+from array import array
+from collections import Counter
+from datetime import datetime
+from itertools import groupby
+import os
+
+from sqlalchemy import (Boolean, CheckConstraint, Column, DateTime, Float, ForeignKey, Index, Integer, LargeBinary,
+                        MetaData, String, Text, UniqueConstraint, delete, event, func, insert, literal, make_url,
+                        select, text, update)
+from sqlalchemy.orm import declarative_base, relationship
+
+# Relative SQLite paths are resolved against the instance folder, as Flask-SQLAlchemy does
+DEFAULT_DATABASE_URL = 'sqlite:///toolkit_inventory.db'
+INSTANCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+
+def is_sqlite_file(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+def default_job_database_uri(uri):
+    """Put the job table in a file next to the inventory database, e.g. inventory-jobs.db"""
+    if not is_sqlite_file(uri):
+        return 'sqlite:///jobs.db'
+    url = make_url(uri)
+    root, extension = os.path.splitext(url.database)
+    return url.set(database=f'{root}-jobs{extension}').render_as_string(hide_password=False)
+
+def parse_sites(spec):
+    """Parse INVENTORY_SITES, e.g. 'lab-a=sqlite:///lab-a.db,lab-b=sqlite:////data/lab-b.db', into {name: url}"""
+    sites = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        name, separator, url = item.partition('=')
+        if not separator or not name.strip() or not url.strip():
+            raise ValueError(f'Invalid site {item!r}, expected NAME=DATABASE_URL')
+        sites[name.strip()] = url.strip()
+    return sites
+
+def resolve_database_uri(uri, instance_path=INSTANCE_PATH):
+    """Make a relative SQLite path absolute under instance_path, leaving other URLs alone"""
+    url = make_url(uri)
+    if not is_sqlite_file(uri) or url.database.startswith('file:') or os.path.isabs(url.database):
+        return uri
+    os.makedirs(instance_path, exist_ok=True)
+    return url.set(database=os.path.join(instance_path, url.database)).render_as_string(hide_password=False)
+
+Base = declarative_base()
+# The job table lives in the 'jobs' database (bind) of its own
+JobBase = declarative_base(metadata=MetaData(info={'bind_key': 'jobs'}))
+
+# Database Models
+class Box(Base):
+    __tablename__ = 'box'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False, unique=True)
+    description = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    components = relationship('BoxComponent', backref='box', lazy=True, cascade='all, delete-orphan')
+
+class ComponentType(Base):
+    __tablename__ = 'component_type'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False, unique=True)
+    description = Column(Text)
+    max_per_box = Column(Integer, nullable=False, default=1, index=True)
+    category = Column(String(50))
+
+    __table_args__ = (
+        CheckConstraint('max_per_box > 0', name='ck_component_type_max_per_box_positive'),
+        Index('ix_component_type_category', func.coalesce(category, '')),
+    )
+
+class BoxComponent(Base):
+    __tablename__ = 'box_component'
+    id = Column(Integer, primary_key=True)
+    box_id = Column(Integer, ForeignKey('box.id'), nullable=False)
+    component_type_id = Column(Integer, ForeignKey('component_type.id'), nullable=False, index=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    last_updated = Column(DateTime, default=datetime.utcnow)
+    
+    component_type = relationship('ComponentType', backref='box_components')
+    
+    __table_args__ = (
+        UniqueConstraint('box_id', 'component_type_id'),
+        CheckConstraint('quantity >= 0', name='ck_box_component_quantity_non_negative'),
+        Index('ix_box_component_box_quantity', 'box_id', 'quantity'),
+        Index('ix_box_component_box_last_updated', 'box_id', 'last_updated'),
+        Index('ix_box_component_quantity', 'quantity'),
+        Index('ix_box_component_last_updated', 'last_updated'),
+    )
+
+class StockMovement(Base):
+    """Append-only record of every change to a box's stock; BoxComponent is its running total"""
+    __tablename__ = 'stock_movement'
+    id = Column(Integer, primary_key=True)
+    box_id = Column(Integer, ForeignKey('box.id'), nullable=False)
+    component_type_id = Column(Integer, ForeignKey('component_type.id'), nullable=False)
+    delta = Column(Integer, nullable=False)
+    reason = Column(String(20), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        CheckConstraint('delta != 0', name='ck_stock_movement_delta_non_zero'),
+        Index('ix_stock_movement_box_id', 'box_id', 'id'),
+        Index('ix_stock_movement_created_at', 'created_at'),
+    )
+
+class StockCheckpoint(Base):
+    """Snapshot of every box's stock after the movement last_movement_id"""
+    __tablename__ = 'stock_checkpoint'
+    id = Column(Integer, primary_key=True)
+    last_movement_id = Column(Integer, nullable=False, unique=True)
+    entry_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class StockCheckpointBox(Base):
+    """One box's entries in a checkpoint, as parallel arrays of component type ids and quantities"""
+    __tablename__ = 'stock_checkpoint_box'
+    checkpoint_id = Column(Integer, ForeignKey('stock_checkpoint.id'), primary_key=True)
+    box_id = Column(Integer, primary_key=True)
+    component_type_ids = Column(LargeBinary, nullable=False)
+    quantities = Column(LargeBinary, nullable=False)
+
+class ComponentTypeStock(Base):
+    """Running stock totals per component type, maintained by triggers on box_component"""
+    __tablename__ = 'component_type_stock'
+    component_type_id = Column(Integer, ForeignKey('component_type.id'), primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    box_count = Column(Integer, nullable=False, default=0)
+
+class AlertRule(Base):
+    """Threshold on a component type's total stock (low_stock) or on a box entry's fill ratio (box_full)"""
+    __tablename__ = 'alert_rule'
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(20), nullable=False)
+    # A rule covers one component type or every type in a category
+    component_type_id = Column(Integer, ForeignKey('component_type.id'), index=True)
+    category = Column(String(50), index=True)
+    threshold = Column(Float, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        CheckConstraint('(component_type_id IS NULL) != (category IS NULL)', name='ck_alert_rule_scope'),
+    )
+
+class Alert(Base):
+    """A breach of a rule by a component type (low_stock) or box entry (box_full), active until it clears"""
+    __tablename__ = 'alert'
+    id = Column(Integer, primary_key=True)
+    rule_id = Column(Integer, ForeignKey('alert_rule.id'), nullable=False)
+    component_type_id = Column(Integer, ForeignKey('component_type.id'), nullable=False)
+    box_id = Column(Integer, ForeignKey('box.id'))
+    status = Column(String(10), nullable=False, default='active')
+    value = Column(Float, nullable=False)
+    triggered_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    resolved_at = Column(DateTime)
+
+    __table_args__ = (
+        # One active alert per rule and subject, found by component type on every stock change
+        Index('ux_alert_active', component_type_id, rule_id, func.coalesce(box_id, 0),
+              unique=True, sqlite_where=text("status = 'active'")),
+        Index('ix_alert_status_triggered_at', status, triggered_at),
+        Index('ix_alert_rule_id', rule_id),
+    )
+
+class Job(JobBase):
+    """A queued or finished background job, stored in the 'jobs' database"""
+    __tablename__ = 'job'
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(30), nullable=False)
+    status = Column(String(10), nullable=False, default='queued')
+    params = Column(Text, nullable=False, default='{}')  # JSON
+    progress = Column(Float)  # 0 to 1, None while unknown
+    message = Column(String(200))
+    result = Column(Text)  # JSON, once succeeded
+    error = Column(Text)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    worker = Column(String(100))
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        # Workers claim the oldest queued job
+        Index('ix_job_status_id', status, id),
+    )
+
+class SiteTransfer(Base):
+    """One leg of a transfer between two site databases: 'sent' at the source, 'received' at the destination"""
+    __tablename__ = 'site_transfer'
+    id = Column(String(32), primary_key=True)
+    from_site = Column(String(50), nullable=False)
+    from_box_id = Column(Integer, nullable=False)
+    to_site = Column(String(50), nullable=False)
+    to_box_id = Column(Integer, nullable=False)
+    component_type_id = Column(Integer, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    # sent -> completed or reverted at the source; received at the destination
+    status = Column(String(10), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Recovery looks for transfers left in 'sent'
+        Index('ix_site_transfer_status_updated_at', status, updated_at),
+    )
+
+class ScanTag(Base):
+    """Barcode or RFID tag stuck on a box or identifying a component type, for scan ingestion"""
+    __tablename__ = 'scan_tag'
+    id = Column(Integer, primary_key=True)
+    tag = Column(String(64), unique=True, nullable=False)
+    box_id = Column(Integer, ForeignKey('box.id'), index=True)
+    component_type_id = Column(Integer, ForeignKey('component_type.id'), index=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        CheckConstraint('(box_id IS NULL) != (component_type_id IS NULL)', name='ck_scan_tag_target'),
+    )
+
+class CatalogVersion(Base):
+    """Single row of counters bumped by the commits that change a cached table.
+
+    version covers boxes and component types, alert_rules_version alert rules
+    and scan_tags_version scan tags.
+    """
+    __tablename__ = 'catalog_version'
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    alert_rules_version = Column(Integer, nullable=False, default=0, server_default=text('0'))
+    scan_tags_version = Column(Integer, nullable=False, default=0, server_default=text('0'))
+
+CATALOG_COUNTERS = ('version', 'alert_rules_version', 'scan_tags_version')
+
+@event.listens_for(CatalogVersion.__table__, 'after_create')
+def _create_catalog_version(target, connection, **kw):
+    connection.execute(target.insert().values(id=1, version=0))
+
+def mark_catalog_changed(session, counters=('version',)):
+    """Bump catalog_version counters in the session's transaction; app.py clears the matching caches once it commits"""
+    table = CatalogVersion.__table__
+    session.connection().execute(table.update().values({counter: table.c[counter] + 1 for counter in counters}))
+    session.info.setdefault('catalog_changed', set()).update(counters)
+
+# Full-text search index
+# component_type_fts mirrors the searchable ComponentType columns in an FTS5
+# table. app.py keeps it in sync with mapper events; bulk Query.delete() calls
+# bypass those, so run populate_search_index() after them.
+SEARCH_INDEX_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS component_type_fts USING fts5("
+    "name, description, category, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS component_type_fts_vocab USING fts5vocab(component_type_fts, 'row')",
+]
+
+@event.listens_for(ComponentType.__table__, 'after_create')
+def _create_search_index(target, connection, **kw):
+    for statement in SEARCH_INDEX_DDL:
+        connection.execute(text(statement))
+
+@event.listens_for(ComponentType.__table__, 'after_drop')
+def _drop_search_index(target, connection, **kw):
+    connection.execute(text('DROP TABLE IF EXISTS component_type_fts_vocab'))
+    connection.execute(text('DROP TABLE IF EXISTS component_type_fts'))
+
+def populate_search_index(connection):
+    """Repopulate component_type_fts from the component_type table"""
+    connection.execute(text('DELETE FROM component_type_fts'))
+    connection.execute(text(
+        "INSERT INTO component_type_fts(rowid, name, description, category) "
+        "SELECT id, name, coalesce(description, ''), coalesce(category, '') FROM component_type"
+    ))
+    connection.execute(text("INSERT INTO component_type_fts(component_type_fts) VALUES ('optimize')"))
+
+# Stock summary
+# component_type_stock holds the total quantity and the number of boxes holding
+# each component type. SQLite triggers on box_component keep it current in the
+# same transaction as every write, including the Core upserts of add_stock and
+# the set-based bulk import, which mapper events would not see.
+STOCK_SUMMARY_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS box_component_stock_insert AFTER INSERT ON box_component BEGIN "
+    "INSERT INTO component_type_stock(component_type_id, quantity, box_count) "
+    "VALUES (new.component_type_id, new.quantity, new.quantity > 0) "
+    "ON CONFLICT(component_type_id) DO UPDATE SET quantity = quantity + excluded.quantity, "
+    "box_count = box_count + excluded.box_count; END",
+    "CREATE TRIGGER IF NOT EXISTS box_component_stock_update AFTER UPDATE OF quantity ON box_component "
+    "WHEN old.component_type_id = new.component_type_id BEGIN "
+    "UPDATE component_type_stock SET quantity = quantity + new.quantity - old.quantity, "
+    "box_count = box_count + (new.quantity > 0) - (old.quantity > 0) "
+    "WHERE component_type_id = new.component_type_id; END",
+    "CREATE TRIGGER IF NOT EXISTS box_component_stock_delete AFTER DELETE ON box_component BEGIN "
+    "UPDATE component_type_stock SET quantity = quantity - old.quantity, box_count = box_count - (old.quantity > 0) "
+    "WHERE component_type_id = old.component_type_id; END",
+    # An entry moved to another component type counts as a delete plus an insert
+    "CREATE TRIGGER IF NOT EXISTS box_component_stock_retype AFTER UPDATE OF component_type_id ON box_component "
+    "WHEN old.component_type_id != new.component_type_id BEGIN "
+    "UPDATE component_type_stock SET quantity = quantity - old.quantity, box_count = box_count - (old.quantity > 0) "
+    "WHERE component_type_id = old.component_type_id; "
+    "INSERT INTO component_type_stock(component_type_id, quantity, box_count) "
+    "VALUES (new.component_type_id, new.quantity, new.quantity > 0) "
+    "ON CONFLICT(component_type_id) DO UPDATE SET quantity = quantity + excluded.quantity, "
+    "box_count = box_count + excluded.box_count; END",
+]
+
+@event.listens_for(BoxComponent.__table__, 'after_create')
+def _create_stock_summary_triggers(target, connection, **kw):
+    for statement in STOCK_SUMMARY_DDL:
+        connection.execute(text(statement))
+
+def populate_stock_summary(connection):
+    """Recompute component_type_stock from box_component"""
+    connection.execute(delete(ComponentTypeStock))
+    connection.execute(insert(ComponentTypeStock).from_select(
+        ['component_type_id', 'quantity', 'box_count'],
+        select(
+            BoxComponent.component_type_id,
+            func.sum(BoxComponent.quantity),
+            func.count().filter(BoxComponent.quantity > 0)
+        ).group_by(BoxComponent.component_type_id)
+    ))
+
+# Ledger order
+# Movement times are taken in Python before the write lock, so a writer can
+# append a movement stamped earlier than one committed just before it. This
+# trigger raises such a time to its predecessor's, keeping created_at in id
+# order, so the movements up to a moment are always a prefix of the ids.
+STOCK_LEDGER_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS stock_movement_in_order AFTER INSERT ON stock_movement "
+    "WHEN new.created_at < (SELECT created_at FROM stock_movement WHERE id < new.id ORDER BY id DESC LIMIT 1) "
+    "BEGIN UPDATE stock_movement SET created_at = "
+    "(SELECT created_at FROM stock_movement WHERE id < new.id ORDER BY id DESC LIMIT 1) WHERE id = new.id; END",
+]
+
+@event.listens_for(StockMovement.__table__, 'after_create')
+def _create_stock_ledger_triggers(target, connection, **kw):
+    for statement in STOCK_LEDGER_DDL:
+        connection.execute(text(statement))
+
+def open_stock_ledger(connection):
+    """Open the ledger with one movement per existing stock entry if it has never been written"""
+    if connection.execute(select(StockMovement.id).limit(1)).first():
+        return
+    connection.execute(insert(StockMovement).from_select(
+        ['box_id', 'component_type_id', 'delta', 'reason', 'created_at'],
+        select(
+            BoxComponent.box_id,
+            BoxComponent.component_type_id,
+            BoxComponent.quantity,
+            literal('opening'),
+            literal(datetime.utcnow())
+        ).where(BoxComponent.quantity > 0).order_by(BoxComponent.id)
+    ))
+
+# Stock checkpoints
+# A checkpoint snapshots box_component as of one movement, one row per box
+# holding its component type ids and quantities as arrays, so past stock is
+# read back from a few blobs plus the movements between the checkpoint and the
+# requested moment. Checkpoints are taken every STOCK_CHECKPOINT_INTERVAL
+# movements, or every entry_count / 2 once the inventory is larger, which keeps
+# them at most 16 bytes of arrays per movement. Commits count the movements
+# they wrote in session.info, so the app can tell when one is due without a
+# query.
+STOCK_CHECKPOINT_INTERVAL = 2000
+CHECKPOINT_TYPECODE = 'i'
+
+def count_stock_movements(session, count):
+    """Note that count movements were written in the session's transaction, for the checkpointer"""
+    movements = session.info.setdefault('stock_movements', Counter())
+    movements[session.connection().engine] += count
+
+def checkpoint_interval(entry_count):
+    """Movements between checkpoints of an inventory with entry_count box entries"""
+    return max(STOCK_CHECKPOINT_INTERVAL, entry_count // 2)
+
+def unpack_checkpoint_box(component_type_ids, quantities):
+    """Return the component type ids and quantities of one stock_checkpoint_box row as parallel arrays"""
+    return array(CHECKPOINT_TYPECODE, component_type_ids), array(CHECKPOINT_TYPECODE, quantities)
+
+def checkpoint_stock_if_due(connection):
+    """Snapshot box_component if a checkpoint interval has passed since the last one; returns the next interval.
+
+    Takes the write lock first, so no movement can land between reading the
+    newest movement id and copying the stock it corresponds to. Commits
+    through the caller's engine.begin() block.
+    """
+    connection.exec_driver_sql('BEGIN IMMEDIATE')
+    last = connection.execute(
+        select(StockCheckpoint.last_movement_id, StockCheckpoint.entry_count)
+        .order_by(StockCheckpoint.last_movement_id.desc()).limit(1)
+    ).first()
+    interval = checkpoint_interval(last.entry_count if last else 0)
+    last_movement_id = connection.execute(select(func.max(StockMovement.id))).scalar() or 0
+    if last_movement_id - (last.last_movement_id if last else 0) < interval:
+        return interval
+
+    entries = connection.execute(
+        select(BoxComponent.box_id, BoxComponent.component_type_id, BoxComponent.quantity)
+        .where(BoxComponent.quantity != 0).order_by(BoxComponent.box_id, BoxComponent.component_type_id)
+    )
+    return checkpoint_interval(write_stock_checkpoint(connection, last_movement_id, entries))
+
+def write_stock_checkpoint(connection, last_movement_id, entries):
+    """Store a checkpoint from (box_id, component_type_id, quantity) rows sorted by box; returns its entry count"""
+    checkpoint_id = connection.execute(insert(StockCheckpoint).values(
+        last_movement_id=last_movement_id, entry_count=0, created_at=datetime.utcnow()
+    )).inserted_primary_key[0]
+    boxes = []
+    entry_count = 0
+    for box_id, box_entries in groupby(entries, key=lambda entry: entry[0]):
+        component_type_ids = array(CHECKPOINT_TYPECODE)
+        quantities = array(CHECKPOINT_TYPECODE)
+        for _, component_type_id, quantity in box_entries:
+            component_type_ids.append(component_type_id)
+            quantities.append(quantity)
+        entry_count += len(quantities)
+        boxes.append({'checkpoint_id': checkpoint_id, 'box_id': box_id,
+                      'component_type_ids': component_type_ids.tobytes(), 'quantities': quantities.tobytes()})
+    if boxes:
+        connection.execute(insert(StockCheckpointBox), boxes)
+    connection.execute(update(StockCheckpoint).where(StockCheckpoint.id == checkpoint_id).values(entry_count=entry_count))
+    return entry_count
+
+# Schema migrations
+# The schema is created and upgraded by scripts/migrate.py (or init_db() in
+# tests and benchmarks), never as a side effect of starting the app. Each
+# entry of MIGRATIONS upgrades the database by one version in a transaction of
+# its own, and PRAGMA user_version records how many have been applied.
+# Migrations spell out their DDL rather than creating tables from the models,
+# so what a version does never changes when the models do. Every column,
+# constraint or index change is a new migration appended here, made alongside
+# the model change; never edit one that has shipped.
+def _sqlite_object_exists(connection, kind, name):
+    return connection.execute(text(
+        'SELECT 1 FROM sqlite_master WHERE type = :kind AND name = :name'
+    ), {'kind': kind, 'name': name}).first() is not None
+
+# Version 1 as it shipped. The original app created box, component_type and
+# box_component itself, so every statement skips what already exists; existing
+# tables keep the columns and constraints they were created with.
+SCHEMA_V1_DDL = [
+    "CREATE TABLE IF NOT EXISTS box (id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, description TEXT, "
+    "created_at DATETIME, PRIMARY KEY (id), UNIQUE (name))",
+    "CREATE INDEX IF NOT EXISTS ix_box_created_at ON box (created_at)",
+    "CREATE TABLE IF NOT EXISTS component_type (id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, "
+    "description TEXT, max_per_box INTEGER NOT NULL, category VARCHAR(50), PRIMARY KEY (id), "
+    "CONSTRAINT ck_component_type_max_per_box_positive CHECK (max_per_box > 0), UNIQUE (name))",
+    "CREATE INDEX IF NOT EXISTS ix_component_type_category ON component_type (coalesce(category, ''))",
+    "CREATE INDEX IF NOT EXISTS ix_component_type_max_per_box ON component_type (max_per_box)",
+    "CREATE TABLE IF NOT EXISTS box_component (id INTEGER NOT NULL, box_id INTEGER NOT NULL, "
+    "component_type_id INTEGER NOT NULL, quantity INTEGER NOT NULL, last_updated DATETIME, PRIMARY KEY (id), "
+    "UNIQUE (box_id, component_type_id), "
+    "CONSTRAINT ck_box_component_quantity_non_negative CHECK (quantity >= 0), "
+    "FOREIGN KEY(box_id) REFERENCES box (id), FOREIGN KEY(component_type_id) REFERENCES component_type (id))",
+    "CREATE INDEX IF NOT EXISTS ix_box_component_box_last_updated ON box_component (box_id, last_updated)",
+    "CREATE INDEX IF NOT EXISTS ix_box_component_box_quantity ON box_component (box_id, quantity)",
+    "CREATE INDEX IF NOT EXISTS ix_box_component_component_type_id ON box_component (component_type_id)",
+    "CREATE INDEX IF NOT EXISTS ix_box_component_last_updated ON box_component (last_updated)",
+    "CREATE INDEX IF NOT EXISTS ix_box_component_quantity ON box_component (quantity)",
+    "CREATE TABLE IF NOT EXISTS stock_movement (id INTEGER NOT NULL, box_id INTEGER NOT NULL, "
+    "component_type_id INTEGER NOT NULL, delta INTEGER NOT NULL, reason VARCHAR(20) NOT NULL, "
+    "created_at DATETIME NOT NULL, PRIMARY KEY (id), CONSTRAINT ck_stock_movement_delta_non_zero CHECK (delta != 0), "
+    "FOREIGN KEY(box_id) REFERENCES box (id), FOREIGN KEY(component_type_id) REFERENCES component_type (id))",
+    "CREATE INDEX IF NOT EXISTS ix_stock_movement_box_id ON stock_movement (box_id, id)",
+    "CREATE INDEX IF NOT EXISTS ix_stock_movement_created_at ON stock_movement (created_at)",
+    "CREATE TABLE IF NOT EXISTS stock_checkpoint (id INTEGER NOT NULL, last_movement_id INTEGER NOT NULL, "
+    "entry_count INTEGER NOT NULL, created_at DATETIME NOT NULL, PRIMARY KEY (id), UNIQUE (last_movement_id))",
+    "CREATE TABLE IF NOT EXISTS stock_checkpoint_box (checkpoint_id INTEGER NOT NULL, box_id INTEGER NOT NULL, "
+    "component_type_ids BLOB NOT NULL, quantities BLOB NOT NULL, PRIMARY KEY (checkpoint_id, box_id), "
+    "FOREIGN KEY(checkpoint_id) REFERENCES stock_checkpoint (id))",
+    "CREATE TABLE IF NOT EXISTS component_type_stock (component_type_id INTEGER NOT NULL, "
+    "quantity INTEGER NOT NULL, box_count INTEGER NOT NULL, PRIMARY KEY (component_type_id), "
+    "FOREIGN KEY(component_type_id) REFERENCES component_type (id))",
+    "CREATE TABLE IF NOT EXISTS alert_rule (id INTEGER NOT NULL, kind VARCHAR(20) NOT NULL, "
+    "component_type_id INTEGER, category VARCHAR(50), threshold FLOAT NOT NULL, created_at DATETIME NOT NULL, "
+    "PRIMARY KEY (id), CONSTRAINT ck_alert_rule_scope CHECK ((component_type_id IS NULL) != (category IS NULL)), "
+    "FOREIGN KEY(component_type_id) REFERENCES component_type (id))",
+    "CREATE INDEX IF NOT EXISTS ix_alert_rule_category ON alert_rule (category)",
+    "CREATE INDEX IF NOT EXISTS ix_alert_rule_component_type_id ON alert_rule (component_type_id)",
+    "CREATE TABLE IF NOT EXISTS alert (id INTEGER NOT NULL, rule_id INTEGER NOT NULL, "
+    "component_type_id INTEGER NOT NULL, box_id INTEGER, status VARCHAR(10) NOT NULL, value FLOAT NOT NULL, "
+    "triggered_at DATETIME NOT NULL, resolved_at DATETIME, PRIMARY KEY (id), "
+    "FOREIGN KEY(rule_id) REFERENCES alert_rule (id), FOREIGN KEY(component_type_id) REFERENCES component_type (id), "
+    "FOREIGN KEY(box_id) REFERENCES box (id))",
+    "CREATE INDEX IF NOT EXISTS ix_alert_rule_id ON alert (rule_id)",
+    "CREATE INDEX IF NOT EXISTS ix_alert_status_triggered_at ON alert (status, triggered_at)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_alert_active ON alert (component_type_id, rule_id, coalesce(box_id, 0)) "
+    "WHERE status = 'active'",
+    "CREATE TABLE IF NOT EXISTS catalog_version (id INTEGER NOT NULL, version INTEGER NOT NULL, PRIMARY KEY (id))",
+    "INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)",
+]
+
+def _create_schema(connection):
+    """Version 1: every table, index, trigger and search table, filling in derived data for existing rows"""
+    has_search_index = _sqlite_object_exists(connection, 'table', 'component_type_fts')
+    has_stock_summary = _sqlite_object_exists(connection, 'trigger', 'box_component_stock_insert')
+    for statement in SCHEMA_V1_DDL + SEARCH_INDEX_DDL + STOCK_SUMMARY_DDL + STOCK_LEDGER_DDL:
+        connection.execute(text(statement))
+    if not has_search_index:
+        populate_search_index(connection)
+    if not has_stock_summary:
+        populate_stock_summary(connection)
+    open_stock_ledger(connection)
+
+def _create_site_transfer(connection):
+    """Version 2: the site_transfer table of transfers between site databases"""
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS site_transfer (id VARCHAR(32) NOT NULL, from_site VARCHAR(50) NOT NULL, "
+        "from_box_id INTEGER NOT NULL, to_site VARCHAR(50) NOT NULL, to_box_id INTEGER NOT NULL, "
+        "component_type_id INTEGER NOT NULL, quantity INTEGER NOT NULL, status VARCHAR(10) NOT NULL, "
+        "created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL, PRIMARY KEY (id))"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_site_transfer_status_updated_at ON site_transfer (status, updated_at)"
+    ))
+
+def _create_scan_tag(connection):
+    """Version 3: the scan_tag table mapping barcode and RFID tags to boxes and component types"""
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS scan_tag (id INTEGER NOT NULL, tag VARCHAR(64) NOT NULL, box_id INTEGER, "
+        "component_type_id INTEGER, created_at DATETIME NOT NULL, PRIMARY KEY (id), "
+        "CONSTRAINT ck_scan_tag_target CHECK ((box_id IS NULL) != (component_type_id IS NULL)), UNIQUE (tag), "
+        "FOREIGN KEY(box_id) REFERENCES box (id), FOREIGN KEY(component_type_id) REFERENCES component_type (id))"
+    ))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_scan_tag_box_id ON scan_tag (box_id)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_scan_tag_component_type_id ON scan_tag (component_type_id)"))
+
+def _add_rule_and_tag_versions(connection):
+    """Version 4: catalog_version counters of their own for alert rules and scan tags"""
+    connection.execute(text(
+        "ALTER TABLE catalog_version ADD COLUMN alert_rules_version INTEGER DEFAULT 0 NOT NULL"
+    ))
+    connection.execute(text(
+        "ALTER TABLE catalog_version ADD COLUMN scan_tags_version INTEGER DEFAULT 0 NOT NULL"
+    ))
+
+def _rebuild_table(connection, table, create_statement):
+    """Replace table with the one create_statement makes as {table}_rebuild, keeping its rows, indexes and triggers.
+
+    SQLite's recipe for the changes ALTER TABLE cannot make: copy into a new
+    table, drop the old one and rename. Foreign keys are not enforced (SQLite's
+    default), so the references of other tables carry over by name.
+    """
+    columns = ', '.join(row[1] for row in connection.exec_driver_sql(f'PRAGMA table_info({table})'))
+    dependents = connection.execute(text(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = :table AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+    ), {'table': table}).scalars().all()
+    connection.execute(text(create_statement))
+    connection.execute(text(f'INSERT INTO {table}_rebuild ({columns}) SELECT {columns} FROM {table}'))
+    connection.execute(text(f'DROP TABLE {table}'))
+    connection.execute(text(f'ALTER TABLE {table}_rebuild RENAME TO {table}'))
+    for statement in dependents:
+        connection.execute(text(statement))
+
+def _add_stock_checks(connection):
+    """Version 5: the CHECK constraints on max_per_box and quantity, for tables made before version 1 added them"""
+    for table, constraint, condition, create_statement in [
+        ('component_type', 'ck_component_type_max_per_box_positive', 'max_per_box > 0',
+         "CREATE TABLE component_type_rebuild (id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, "
+         "description TEXT, max_per_box INTEGER NOT NULL, category VARCHAR(50), PRIMARY KEY (id), "
+         "CONSTRAINT ck_component_type_max_per_box_positive CHECK (max_per_box > 0), UNIQUE (name))"),
+        ('box_component', 'ck_box_component_quantity_non_negative', 'quantity >= 0',
+         "CREATE TABLE box_component_rebuild (id INTEGER NOT NULL, box_id INTEGER NOT NULL, "
+         "component_type_id INTEGER NOT NULL, quantity INTEGER NOT NULL, last_updated DATETIME, PRIMARY KEY (id), "
+         "UNIQUE (box_id, component_type_id), "
+         "CONSTRAINT ck_box_component_quantity_non_negative CHECK (quantity >= 0), "
+         "FOREIGN KEY(box_id) REFERENCES box (id), FOREIGN KEY(component_type_id) REFERENCES component_type (id))"),
+    ]:
+        table_sql = connection.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :table"
+        ), {'table': table}).scalar()
+        if constraint in table_sql:
+            continue
+        invalid = connection.execute(text(f'SELECT count(*) FROM {table} WHERE NOT ({condition})')).scalar()
+        if invalid:
+            raise ValueError(f'{invalid} {table} rows break the new constraint {condition}; '
+                             'correct them and migrate again')
+        _rebuild_table(connection, table, create_statement)
+
+MIGRATIONS = [
+    _create_schema,
+    _create_site_transfer,
+    _create_scan_tag,
+    _add_rule_and_tag_versions,
+    _add_stock_checks,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# The job database is versioned separately
+def _create_job_schema(connection):
+    """Version 1: the job table"""
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS job (id INTEGER NOT NULL, kind VARCHAR(30) NOT NULL, "
+        "status VARCHAR(10) NOT NULL, params TEXT NOT NULL, progress FLOAT, message VARCHAR(200), result TEXT, "
+        "error TEXT, cancel_requested BOOLEAN NOT NULL, worker VARCHAR(100), created_at DATETIME NOT NULL, "
+        "started_at DATETIME, heartbeat_at DATETIME, finished_at DATETIME, PRIMARY KEY (id))"
+    ))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_job_status_id ON job (status, id)"))
+
+JOB_MIGRATIONS = [
+    _create_job_schema,
+]
+JOB_SCHEMA_VERSION = len(JOB_MIGRATIONS)
+
+def schema_version(connection):
+    return connection.exec_driver_sql('PRAGMA user_version').scalar()
+
+def apply_migrations(engine, migrations):
+    """Apply the migrations newer than the database's user_version; returns (from, to) versions"""
+    with engine.connect() as connection:
+        current = schema_version(connection)
+    for version in range(current + 1, len(migrations) + 1):
+        with engine.begin() as connection:
+            # Take the write lock first, so two processes cannot both apply a migration
+            connection.exec_driver_sql('BEGIN IMMEDIATE')
+            if schema_version(connection) >= version:
+                continue
+            migrations[version - 1](connection)
+            connection.exec_driver_sql(f'PRAGMA user_version = {version}')
+    return current, max(current, len(migrations))
+
+def migrate(engine, jobs_engine, site_engines=None):
+    """Bring the inventory, job and site databases up to date; returns {database: (from, to) version}"""
+    versions = {'inventory': apply_migrations(engine, MIGRATIONS), 'jobs': apply_migrations(jobs_engine, JOB_MIGRATIONS)}
+    for site, site_engine in (site_engines or {}).items():
+        versions[f'site {site}'] = apply_migrations(site_engine, MIGRATIONS)
+    return versions
+
+def schema_is_current(engine, jobs_engine, site_engines=None):
+    for current_engine, version in [(engine, SCHEMA_VERSION), (jobs_engine, JOB_SCHEMA_VERSION)] + [
+        (site_engine, SCHEMA_VERSION) for site_engine in (site_engines or {}).values()
+    ]:
+        with current_engine.connect() as connection:
+            if schema_version(connection) < version:
+                return False
+    return True
@@ -0,0 +1,91 @@
+"""
+Throughput benchmark for /api/batch against the single-operation endpoints
+Restocks a scratch database one request per operation, then again in batches,
+and reports operations per second for each
+
+Usage: python scripts/benchmark_batch.py [--operations 2000] [--batch-sizes 10 100 1000]
+"""
+
+import sys
+import os
+import argparse
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Point the app at a scratch database before it is imported
+_tmp_dir = tempfile.mkdtemp(prefix='inventory-batchbench-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp_dir, 'batchbench.db')
+
+from app import create_app, db, Box, ComponentType
+app = create_app()
+
+BOX_COUNT = 200
+COMPONENT_TYPE_COUNT = 50
+
+def seed():
+    """Recreate the scratch database with empty boxes and roomy component types"""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add_all(
+            ComponentType(name=f'Bench Component {i}', max_per_box=1000000, category='Electronics')
+            for i in range(COMPONENT_TYPE_COUNT)
+        )
+        db.session.add_all(Box(name=f'Bench Kit {i}') for i in range(BOX_COUNT))
+        db.session.commit()
+
+def make_operations(count):
+    """Build count add operations spread over every (box, component type) pair"""
+    return [
+        {
+            'op': 'add',
+            'box_id': (i % BOX_COUNT) + 1,
+            'component_type_id': (i // BOX_COUNT) % COMPONENT_TYPE_COUNT + 1,
+            'quantity': 1
+        }
+        for i in range(count)
+    ]
+
+def run_single(client, operations):
+    for operation in operations:
+        response = client.post('/api/add_component', json=operation).get_json()
+        if not response['success']:
+            raise RuntimeError(response['message'])
+
+def run_batched(client, operations, batch_size):
+    for start in range(0, len(operations), batch_size):
+        chunk = operations[start:start + batch_size]
+        response = client.post('/api/batch', json={'operations': chunk}).get_json()
+        if not response['success']:
+            raise RuntimeError(response.get('message') or response['results'])
+
+def report(label, operation_count, seconds, baseline=None):
+    rate = operation_count / seconds
+    speedup = f'{rate / baseline:>7.1f}x' if baseline else f"{'-':>8}"
+    print(f"{label:<22} {seconds:>9.2f} {rate:>12.0f} {speedup}")
+    return rate
+
+def benchmark_batch(operation_count, batch_sizes):
+    client = app.test_client()
+    operations = make_operations(operation_count)
+    print(f"{operation_count} add operations over {BOX_COUNT} boxes x {COMPONENT_TYPE_COUNT} component types")
+    print(f"{'mode':<22} {'seconds':>9} {'ops/sec':>12} {'speedup':>8}")
+
+    seed()
+    start = time.perf_counter()
+    run_single(client, operations)
+    baseline = report('single-op requests', operation_count, time.perf_counter() - start)
+
+    for batch_size in batch_sizes:
+        seed()
+        start = time.perf_counter()
+        run_batched(client, operations, batch_size)
+        report(f'batch of {batch_size}', operation_count, time.perf_counter() - start, baseline)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--operations', type=int, default=2000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[10, 100, 1000])
+    args = parser.parse_args()
+    benchmark_batch(args.operations, args.batch_sizes)
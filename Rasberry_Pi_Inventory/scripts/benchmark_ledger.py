@@ -0,0 +1,128 @@
+"""
+Benchmark point-in-time stock queries against a large movement ledger
+Seeds a scratch database with a synthetic ledger and the stock checkpoints the
+app would have taken along it, then times get_stock_as_of() for the whole
+inventory, one box and one box entry at random past moments, checking each
+answer against a full ledger sum
+
+Usage: python scripts/benchmark_ledger.py [--movements 2000000] [--repeat 50]
+"""
+
+import sys
+import os
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Point the app at a scratch database before it is imported
+_tmp_dir = tempfile.mkdtemp(prefix='inventory-ledgerbench-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp_dir, 'ledgerbench.db')
+
+from app import create_app, db, Box, ComponentType, StockCheckpoint, StockMovement, get_stock_as_of, migrate_database
+app = create_app()
+from models import checkpoint_interval, write_stock_checkpoint
+
+BOX_COUNT = 100
+COMPONENT_TYPE_COUNT = 50
+START = datetime(2024, 1, 1)
+CHUNK = 50000
+
+def seed(movement_count):
+    """Write movement_count random movements one second apart, with checkpoints at the app's interval"""
+    migrate_database()
+    db.session.execute(ComponentType.__table__.insert(), [
+        {'id': i, 'name': f'Ledger Component {i}', 'max_per_box': 1000000, 'category': 'Electronics'}
+        for i in range(1, COMPONENT_TYPE_COUNT + 1)
+    ])
+    db.session.execute(Box.__table__.insert(), [
+        {'id': i, 'name': f'Ledger Box {i}'} for i in range(1, BOX_COUNT + 1)
+    ])
+
+    rng = random.Random(movement_count)
+    stock = {}
+    movements = []
+    next_checkpoint = checkpoint_interval(0)
+    for movement_id in range(1, movement_count + 1):
+        key = (rng.randint(1, BOX_COUNT), rng.randint(1, COMPONENT_TYPE_COUNT))
+        current = stock.get(key, 0)
+        delta = -rng.randint(1, current) if current and rng.random() < 0.45 else rng.randint(1, 5)
+        stock[key] = current + delta
+        movements.append({
+            'id': movement_id, 'box_id': key[0], 'component_type_id': key[1], 'delta': delta,
+            'reason': 'add' if delta > 0 else 'remove', 'created_at': START + timedelta(seconds=movement_id)
+        })
+        if len(movements) == CHUNK or movement_id == next_checkpoint:
+            db.session.execute(StockMovement.__table__.insert(), movements)
+            movements = []
+        if movement_id == next_checkpoint:
+            entries = sorted((box_id, type_id, quantity) for (box_id, type_id), quantity in stock.items() if quantity)
+            entry_count = write_stock_checkpoint(db.session.connection(), movement_id, entries)
+            next_checkpoint += checkpoint_interval(entry_count)
+    if movements:
+        db.session.execute(StockMovement.__table__.insert(), movements)
+    db.session.commit()
+    db.session.execute(db.text('ANALYZE'))
+
+def ledger_sum(at, box_id=None, component_type_id=None):
+    """The answer get_stock_as_of must give, summed over the whole ledger"""
+    query = db.session.query(
+        StockMovement.box_id, StockMovement.component_type_id, db.func.sum(StockMovement.delta)
+    ).filter(StockMovement.created_at <= at)
+    if box_id is not None:
+        query = query.filter(StockMovement.box_id == box_id)
+    if component_type_id is not None:
+        query = query.filter(StockMovement.component_type_id == component_type_id)
+    rows = query.group_by(StockMovement.box_id, StockMovement.component_type_id)
+    return {(row_box_id, row_type_id): quantity for row_box_id, row_type_id, quantity in rows if quantity}
+
+def benchmark_ledger(movement_count, repeat):
+    with app.app_context():
+        print(f"Seeding {movement_count} movements...", file=sys.stderr)
+        seed(movement_count)
+        rng = random.Random(0)
+        cases = [
+            ('whole inventory', lambda: {}),
+            ('one box', lambda: {'box_id': rng.randint(1, BOX_COUNT)}),
+            ('one box entry', lambda: {'box_id': rng.randint(1, BOX_COUNT),
+                                       'component_type_id': rng.randint(1, COMPONENT_TYPE_COUNT)}),
+        ]
+
+        checkpoints = db.session.query(StockCheckpoint).count()
+        print(f"{movement_count} movements with {checkpoints} stock checkpoints")
+        print(f"{'query':<16} {'as-of ms':>9} {'p99 ms':>8} {'full sum ms':>12}")
+        mismatches = 0
+        for label, make_filters in cases:
+            timings = []
+            full_timings = []
+            for i in range(repeat):
+                at = START + timedelta(seconds=rng.randint(1, movement_count))
+                filters = make_filters()
+                start = time.perf_counter()
+                stock = get_stock_as_of(at, **filters)
+                timings.append((time.perf_counter() - start) * 1000)
+                # The full sum is slow, so only check a few of the samples
+                if i < 3:
+                    start = time.perf_counter()
+                    expected = ledger_sum(at, **filters)
+                    full_timings.append((time.perf_counter() - start) * 1000)
+                    mismatches += stock != expected
+            timings.sort()
+            p99 = timings[max(int(len(timings) * 0.99) - 1, 0)]
+            print(f"{label:<16} {statistics.median(timings):>9.2f} {p99:>8.2f} {statistics.median(full_timings):>12.2f}")
+
+    if mismatches:
+        print(f"FAIL: {mismatches} as-of results differ from the full ledger sum")
+        return 1
+    print("OK: as-of results match the full ledger sum")
+    return 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--movements', type=int, default=2000000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+    sys.exit(benchmark_ledger(args.movements, args.repeat))
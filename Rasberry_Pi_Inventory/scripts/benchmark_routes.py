@@ -0,0 +1,395 @@
+"""
+Benchmark every route across dataset sizes and compare runs between commits
+Seeds synthetic databases of 1k, 10k, 100k and 1M box entries (kept in
+--data-dir and reused by later runs), then drives each page and API through the
+Flask test client and a real threaded WSGI server. For every route it records
+latency percentiles, SQL statements and rows fetched per request and the peak
+Python memory of one request, and writes them to a JSON file
+
+With --compare, the new results are checked against an earlier file and the
+script exits non-zero when a metric got worse by more than --threshold
+
+Usage: python scripts/benchmark_routes.py [--sizes 1000 10000 100000 1000000] [--repeat 30]
+                                          [--output results.json] [--compare baseline.json]
+                                          [--threshold 0.2] [--data-dir DIR]
+"""
+
+import sys
+import os
+import argparse
+import json
+import logging
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+from datetime import datetime
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+ENTRIES_PER_BOX = 100
+PREFIXES = ['Mini', 'Micro', 'Digital', 'Analog', 'Infrared', 'Ultrasonic', 'Capacitive', 'Smart', 'Dual', 'RGB']
+NOUNS = ['Sensor', 'Module', 'Display', 'Motor', 'Switch', 'Resistor', 'Breadboard', 'Cable', 'Relay', 'Keypad']
+CATEGORIES = ['Sensors', 'Electronics', 'Display', 'Motors', 'Hardware', 'Cables', 'Controllers', 'Communication']
+
+# Metrics checked by --compare; latencies below the floor (ms) are treated as noise
+COMPARED_METRICS = ['test_client.p50_ms', 'test_client.p95_ms', 'wsgi.p50_ms', 'statements', 'rows', 'peak_kb']
+LATENCY_FLOOR_MS = 1.0
+
+# Counters shared by the SQL listeners and the counting cursor
+counters = {'statements': 0, 'rows': 0}
+
+class CountingCursor(sqlite3.Cursor):
+    def fetchone(self):
+        row = super().fetchone()
+        counters['rows'] += row is not None
+        return row
+
+    def fetchmany(self, *args):
+        rows = super().fetchmany(*args)
+        counters['rows'] += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        counters['rows'] += len(rows)
+        return rows
+
+class CountingConnection(sqlite3.Connection):
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+def dataset_shape(size):
+    """Component type, box and box entry counts for a dataset of size box entries"""
+    box_count = max(size // ENTRIES_PER_BOX, 1)
+    return max(1000, size // ENTRIES_PER_BOX), box_count, size
+
+def seed(size):
+    """Fill the (empty) configured database with a deterministic dataset of size box entries"""
+    from app import create_app, db, bulk_import, init_db
+    app = create_app()
+
+    component_type_count, box_count, entry_count = dataset_shape(size)
+    rng = random.Random(size)
+    max_per_box = [rng.randint(2, 50) for _ in range(component_type_count)]
+    names = [f'{rng.choice(PREFIXES)} {rng.choice(NOUNS)} P{i}' for i in range(component_type_count)]
+
+    def contents():
+        per_box, extra = divmod(entry_count, box_count)
+        for box in range(box_count):
+            for component_type in rng.sample(range(component_type_count), per_box + (box < extra)):
+                yield {'box': f'Box {box}', 'component_type': names[component_type],
+                       'quantity': rng.randint(1, max_per_box[component_type])}
+
+    with app.app_context():
+        db.create_all()
+        bulk_import(
+            db.session,
+            component_types=({'name': names[i], 'description': f'Synthetic part number {i}',
+                              'max_per_box': max_per_box[i], 'category': rng.choice(CATEGORIES)}
+                             for i in range(component_type_count)),
+            boxes=({'name': f'Box {i}', 'description': f'Synthetic storage box {i}'} for i in range(box_count)),
+            box_contents=contents()
+        )
+        init_db()
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+        # Fold the WAL back into the file so the dataset can be copied on its own
+        db.session.execute(db.text('PRAGMA wal_checkpoint(TRUNCATE)'))
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+def pick_targets(db, Box, ComponentType, BoxComponent):
+    """Ids for the routes to work on: a box in the middle of the list and entries in it with room to grow"""
+    box_count = db.session.query(Box).count()
+    box_id = db.session.query(Box.id).order_by(Box.id).offset(box_count // 2).limit(1).scalar()
+    entries = db.session.query(BoxComponent.component_type_id).join(ComponentType).filter(
+        BoxComponent.box_id == box_id, BoxComponent.quantity < ComponentType.max_per_box
+    ).order_by(BoxComponent.id).limit(10).all()
+    component_type_ids = [component_type_id for component_type_id, in entries]
+    # A second box that does not hold the first type, to transfer into and back out of
+    holders = db.session.query(BoxComponent.box_id).filter(BoxComponent.component_type_id == component_type_ids[0])
+    other_box_id = db.session.query(Box.id).filter(Box.id != box_id, Box.id.not_in(holders)).order_by(Box.id).limit(1).scalar()
+    return box_id, other_box_id, component_type_ids
+
+def route_requests(box_id, other_box_id, component_type_ids):
+    """Map each route name to a function returning its next (method, path, json, measured) steps
+
+    Mutations come in pairs that undo each other, so the dataset stays the same
+    however many times a route is run; the undoing half is not measured unless it
+    is the same kind of request.
+    """
+    component_type_id = component_type_ids[0]
+    entry = {'box_id': box_id, 'component_type_id': component_type_id, 'quantity': 1}
+    now = datetime.utcnow().isoformat()
+
+    def get(path):
+        return lambda: [('GET', path, None, True)]
+
+    def transfer(from_box_id, to_box_id):
+        return {'from_box_id': from_box_id, 'to_box_id': to_box_id, 'component_type_id': component_type_id, 'quantity': 1}
+
+    def batch(op):
+        return {'operations': [{'op': op, 'box_id': box_id, 'component_type_id': type_id, 'quantity': 1}
+                               for type_id in component_type_ids]}
+
+    return {
+        'index': get('/'),
+        'boxes': get('/boxes'),
+        'view_box': get(f'/box/{box_id}'),
+        'components': get('/components'),
+        'manage_inventory': get(f'/manage_inventory/{box_id}'),
+        'transfer': get('/transfer'),
+        'search': get('/search?q=sensor'),
+        'api_search': get('/api/search?q=sens'),
+        'api_get_box_components': get(f'/api/get_box_components/{box_id}'),
+        'api_stock_as_of_box': get(f'/api/stock_as_of?at={now}&box_id={box_id}'),
+        'api_movements': get(f'/api/movements?box_id={box_id}'),
+        'export_box_csv': get(f'/export/inventory.csv?box_id={box_id}'),
+        'api_analytics_categories': get('/api/analytics/categories?min_quantity=10'),
+        'api_analytics_boxes': get('/api/analytics/boxes?sort=fill_ratio&order=desc'),
+        'api_add_component': lambda: [('POST', '/api/add_component', entry, True),
+                                      ('POST', '/api/remove_component', entry, False)],
+        'api_remove_component': lambda: [('POST', '/api/add_component', entry, False),
+                                         ('POST', '/api/remove_component', entry, True)],
+        'api_transfer_component': lambda: [('POST', '/api/transfer_component', transfer(box_id, other_box_id), True),
+                                           ('POST', '/api/transfer_component', transfer(other_box_id, box_id), True)],
+        'api_batch': lambda: [('POST', '/api/batch', batch('add'), True),
+                              ('POST', '/api/batch', batch('remove'), True)],
+    }
+
+def test_client_sender(app):
+    client = app.test_client()
+
+    def send(method, path, payload):
+        response = client.open(path, method=method, json=payload)
+        response.get_data()
+        return response.status_code, response.get_json(silent=True)
+    return send
+
+def wsgi_sender(base_url):
+    def send(method, path, payload):
+        data = json.dumps(payload).encode() if payload is not None else None
+        req = urllib.request.Request(base_url + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(req) as response:
+            body = response.read()
+            status = response.status
+        return status, json.loads(body) if response.headers.get_content_type() == 'application/json' else None
+    return send
+
+def run_steps(send, steps, record):
+    for method, path, payload, measured in steps:
+        counters['statements'] = counters['rows'] = 0
+        start = time.perf_counter()
+        status, body = send(method, path, payload)
+        elapsed = (time.perf_counter() - start) * 1000
+        if status != 200 or (isinstance(body, dict) and body.get('success') is False):
+            raise RuntimeError(f'{method} {path} failed with {status}: {body}')
+        if measured:
+            record(elapsed)
+
+def percentile(sorted_values, fraction):
+    return sorted_values[max(int(round(len(sorted_values) * fraction)) - 1, 0)]
+
+def time_route(send, make_steps, repeat, warmup):
+    for _ in range(warmup):
+        run_steps(send, make_steps(), lambda elapsed: None)
+    timings = []
+    statements = []
+    rows = []
+
+    def record(elapsed):
+        timings.append(elapsed)
+        statements.append(counters['statements'])
+        rows.append(counters['rows'])
+
+    while len(timings) < repeat:
+        run_steps(send, make_steps(), record)
+    timings.sort()
+    return {
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+    }, max(statements), max(rows)
+
+def peak_memory_kb(send, make_steps, samples=5):
+    """Median Python allocation peak of one measured request, above what was allocated before it"""
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(samples):
+            for method, path, payload, measured in make_steps():
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                run_steps(send, [(method, path, payload, measured)],
+                          lambda elapsed: peaks.append(tracemalloc.get_traced_memory()[1] - before))
+    finally:
+        tracemalloc.stop()
+    peaks.sort()
+    return round(peaks[len(peaks) // 2] / 1024, 1)
+
+def run_size(repeat, warmup, routes):
+    """Benchmark the configured database in this process and return per-route results"""
+    from sqlalchemy import event
+    from werkzeug.serving import make_server
+    from app import create_app, db, Box, ComponentType, BoxComponent
+    app = create_app()
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute',
+                         lambda *args: counters.__setitem__('statements', counters['statements'] + 1))
+            event.listen(engine, 'do_connect', lambda dialect, record, cargs, cparams:
+                         cparams.__setitem__('factory', CountingConnection))
+            engine.dispose()
+        targets = pick_targets(db, Box, ComponentType, BoxComponent)
+        db.session.remove()
+    requests = route_requests(*targets)
+    if routes:
+        requests = {name: requests[name] for name in routes}
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client_send = test_client_sender(app)
+    server_send = wsgi_sender(f'http://127.0.0.1:{server.server_port}')
+
+    results = {}
+    for name, make_steps in requests.items():
+        client_latency, statements, rows = time_route(client_send, make_steps, repeat, warmup)
+        server_latency, _, _ = time_route(server_send, make_steps, repeat, warmup)
+        results[name] = {
+            'test_client': client_latency,
+            'wsgi': server_latency,
+            'statements': statements,
+            'rows': rows,
+            'peak_kb': peak_memory_kb(client_send, make_steps),
+        }
+        print(f"  {name} done", file=sys.stderr)
+    server.shutdown()
+    return results
+
+def prepare_database(size, data_dir):
+    """Seed the cached dataset for size if needed and return a fresh working copy of it"""
+    os.makedirs(data_dir, exist_ok=True)
+    seeded = os.path.join(data_dir, f'routes-{size}.db')
+    if not os.path.exists(seeded):
+        print(f"Seeding {size} box entries into {seeded}...", file=sys.stderr)
+        partial = seeded + '.partial'
+        if os.path.exists(partial):
+            os.remove(partial)
+        subprocess.run([sys.executable, os.path.join(SCRIPT_DIR, 'benchmark_routes.py'), '--seed-size', str(size)],
+                       env=dict(os.environ, DATABASE_URL='sqlite:///' + partial), check=True)
+        os.replace(partial, seeded)
+    working = os.path.join(tempfile.mkdtemp(prefix='inventory-routebench-'), 'routes.db')
+    shutil.copyfile(seeded, working)
+    return working
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=SCRIPT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(size, results):
+    print(f"\n{size} box entries")
+    print(f"{'route':<24} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'wsgi p50':>9} {'stmts':>6} {'rows':>7} {'peak KB':>8}")
+    for name, result in results.items():
+        client = result['test_client']
+        print(f"{name:<24} {client['p50_ms']:>8.2f} {client['p95_ms']:>8.2f} {client['p99_ms']:>8.2f} "
+              f"{result['wsgi']['p50_ms']:>9.2f} {result['statements']:>6} {result['rows']:>7} {result['peak_kb']:>8.1f}")
+
+def metric(result, path):
+    for key in path.split('.'):
+        result = result[key]
+    return result
+
+def compare(baseline, current, threshold):
+    """Return a description of every metric in current that regressed against baseline"""
+    regressions = []
+    for size, routes in current['results'].items():
+        for name, result in routes.items():
+            before = baseline['results'].get(size, {}).get(name)
+            if before is None:
+                continue
+            for path in COMPARED_METRICS:
+                old, new = metric(before, path), metric(result, path)
+                if path.endswith('_ms') and new - old < LATENCY_FLOOR_MS:
+                    continue
+                if new > old * (1 + threshold) and new != old:
+                    change = f'+{(new - old) / old:.0%}' if old else 'new'
+                    regressions.append(f'{size} {name} {path}: {old} -> {new} ({change})')
+    return regressions
+
+def benchmark_routes(sizes, repeat, warmup, routes, data_dir, output, baseline_path, threshold):
+    current = {
+        'commit': git_commit(),
+        'created_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'repeat': repeat,
+        'results': {},
+    }
+    for size in sizes:
+        database = prepare_database(size, data_dir)
+        print(f"Benchmarking {size} box entries...", file=sys.stderr)
+        command = [sys.executable, os.path.join(SCRIPT_DIR, 'benchmark_routes.py'), '--run-size',
+                   '--repeat', str(repeat), '--warmup', str(warmup)]
+        if routes:
+            command += ['--routes', *routes]
+        output_text = subprocess.run(command, env=dict(os.environ, DATABASE_URL='sqlite:///' + database),
+                                     stdout=subprocess.PIPE, text=True, check=True).stdout
+        shutil.rmtree(os.path.dirname(database))
+        results = json.loads(output_text.strip().splitlines()[-1])
+        current['results'][str(size)] = results
+        print_results(size, results)
+
+    with open(output, 'w') as f:
+        json.dump(current, f, indent=2)
+    print(f"\nWrote {output}")
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, threshold)
+        print(f"Compared with {baseline_path} (commit {baseline.get('commit')}), threshold {threshold:.0%}")
+        if regressions:
+            print(f"FAIL: {len(regressions)} regressions")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("OK: no regressions")
+    return 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='box entries per dataset')
+    parser.add_argument('--repeat', type=int, default=30, help='measured requests per route and server')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--routes', nargs='+', help='only benchmark these routes')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'inventory-routebench'),
+                        help='where seeded datasets are kept between runs')
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--compare', metavar='BASELINE', help='results file from an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative slowdown (default 0.2)')
+    parser.add_argument('--seed-size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--run-size', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.seed_size:
+        seed(args.seed_size)
+    elif args.run_size:
+        print(json.dumps(run_size(args.repeat, args.warmup, args.routes)))
+    else:
+        sys.exit(benchmark_routes(args.sizes, args.repeat, args.warmup, args.routes, args.data_dir,
+                                  args.output, args.compare, args.threshold))
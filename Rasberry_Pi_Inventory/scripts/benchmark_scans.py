@@ -0,0 +1,110 @@
+"""
+Benchmark scan ingestion throughput
+Uploads a stream of random scans to POST /api/scans on a scratch database and
+reports scans per second and commits, next to the same scans sent one
+/api/add_component or /api/remove_component request at a time, then checks
+that stock stayed within capacity and matches the ledger
+
+Exits non-zero when the upload rate is below --target
+
+Usage: python scripts/benchmark_scans.py [--scans 50000] [--component-types 500] [--boxes 50]
+                                         [--single 1000] [--target 2000]
+"""
+
+import sys
+import os
+import argparse
+import random
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='inventory-scans-'), 'scans.db')
+
+from app import create_app, db, init_db, Box, BoxComponent, ComponentType, ScanTag, StockMovement
+app = create_app()
+
+MAX_PER_BOX = 40
+
+def seed(component_type_count, box_count):
+    """Add tagged component types and boxes; returns their tags"""
+    with app.app_context():
+        init_db()
+        component_types = [ComponentType(name=f'Scan Part {i}', max_per_box=MAX_PER_BOX, category='Scan')
+                           for i in range(component_type_count)]
+        boxes = [Box(name=f'Scan Box {i}') for i in range(box_count)]
+        db.session.add_all(component_types + boxes)
+        db.session.flush()
+        db.session.add_all([ScanTag(tag=f'P{c.id:05d}', component_type_id=c.id) for c in component_types] +
+                           [ScanTag(tag=f'B{b.id:04d}', box_id=b.id) for b in boxes])
+        db.session.commit()
+        return ([(f'P{c.id:05d}', c.id) for c in component_types], [(f'B{b.id:04d}', b.id) for b in boxes])
+
+def make_scans(count, part_tags, box_tags, rng):
+    """Bursts of the same part scanned into or out of the same box, as a person with a scanner produces"""
+    scans = []
+    while len(scans) < count:
+        part, box = rng.choice(part_tags), rng.choice(box_tags)
+        delta = 1 if rng.random() < 0.7 else -1
+        scans.extend([(part, box, delta)] * rng.randint(1, 8))
+    return scans[:count]
+
+def upload(client, scans):
+    body = ''.join(f'{part[0]},{box[0]},{delta}\n' for part, box, delta in scans).encode()
+    start = time.perf_counter()
+    result = client.post('/api/scans', data=body, content_type='text/plain').get_json()
+    return time.perf_counter() - start, result
+
+def one_at_a_time(client, scans):
+    start = time.perf_counter()
+    for part, box, delta in scans:
+        client.post('/api/add_component' if delta > 0 else '/api/remove_component',
+                    json={'box_id': box[1], 'component_type_id': part[1], 'quantity': 1})
+    return time.perf_counter() - start
+
+def check_stock():
+    with app.app_context():
+        over = db.session.query(BoxComponent).filter(
+            (BoxComponent.quantity > MAX_PER_BOX) | (BoxComponent.quantity < 0)
+        ).count()
+        stock = db.session.query(db.func.coalesce(db.func.sum(BoxComponent.quantity), 0)).scalar()
+        ledger = db.session.query(db.func.coalesce(db.func.sum(StockMovement.delta), 0)).scalar()
+    return over, stock, ledger
+
+def benchmark(scan_count, component_type_count, box_count, single_count, target, seed_value):
+    rng = random.Random(seed_value)
+    part_tags, box_tags = seed(component_type_count, box_count)
+    client = app.test_client()
+
+    scans = make_scans(scan_count, part_tags, box_tags, rng)
+    elapsed, result = upload(client, scans)
+    rate = scan_count / elapsed
+    print(f"{'path':<20} {'scans':>8} {'seconds':>8} {'scans/sec':>10} {'commits':>8} {'rejected':>9}")
+    print(f"{'/api/scans':<20} {scan_count:>8} {elapsed:>8.2f} {rate:>10.0f} "
+          f"{result['commits']:>8} {result['rejected']:>9}")
+    if single_count:
+        single = make_scans(single_count, part_tags, box_tags, rng)
+        single_elapsed = one_at_a_time(client, single)
+        print(f"{'one request each':<20} {single_count:>8} {single_elapsed:>8.2f} "
+              f"{single_count / single_elapsed:>10.0f} {single_count:>8} {'':>9}")
+
+    over, stock, ledger = check_stock()
+    if over or stock != ledger:
+        print(f"FAIL: {over} entries out of bounds, stock {stock} vs ledger {ledger}")
+        return 1
+    if rate < target:
+        print(f"FAIL: {rate:.0f} scans/sec is below the {target} target")
+        return 1
+    print(f"OK: {rate:.0f} scans/sec, stock within capacity and equal to the ledger")
+    return 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scans', type=int, default=50000)
+    parser.add_argument('--component-types', type=int, default=500)
+    parser.add_argument('--boxes', type=int, default=50)
+    parser.add_argument('--single', type=int, default=1000, help='scans to send one request at a time (0 to skip)')
+    parser.add_argument('--target', type=float, default=2000, help='minimum scans/sec for /api/scans')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    sys.exit(benchmark(args.scans, args.component_types, args.boxes, args.single, args.target, args.seed))
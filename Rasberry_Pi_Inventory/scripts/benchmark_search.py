@@ -0,0 +1,111 @@
+"""
+Benchmark the FTS5 component search against the previous LIKE '%q%' search
+Seeds scratch databases of increasing size and times the first results page of
+both query paths for a mix of common, rare, prefix and misspelled terms
+
+Usage: python scripts/benchmark_search.py [--sizes 10000 100000 1000000] [--repeat 5]
+"""
+
+import sys
+import os
+import argparse
+import random
+import statistics
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Point the app at a scratch database before it is imported
+_tmp_dir = tempfile.mkdtemp(prefix='inventory-searchbench-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp_dir, 'searchbench.db')
+
+from app import create_app, db, Box, ComponentType, BoxComponent, build_search_match, search_matches, rebuild_search_index
+app = create_app()
+
+PAGE_SIZE = 50
+COMPONENTS_PER_BOX = 100
+
+PREFIXES = ['Mini', 'Micro', 'Digital', 'Analog', 'Infrared', 'Ultrasonic', 'Capacitive', 'Smart', 'Dual', 'RGB']
+NOUNS = ['Sensor', 'Module', 'Display', 'Motor', 'Switch', 'Resistor', 'Breadboard', 'Cable', 'Relay', 'Keypad']
+CATEGORIES = ['Sensors', 'Electronics', 'Display', 'Motors', 'Hardware', 'Cables', 'Controllers', 'Communication']
+
+# (label, query) pairs; the rare code is filled in once the dataset size is known
+QUERIES = [
+    ('common word', 'sensor'),
+    ('two words', 'infrared sensor'),
+    ('prefix', 'ultra'),
+    ('misspelled', 'breadbord'),
+]
+
+def seed(size):
+    """Fill the scratch database with size component types, each stocked in one box"""
+    db.drop_all()
+    db.create_all()
+    rng = random.Random(size)
+
+    db.session.execute(ComponentType.__table__.insert(), [
+        {
+            'id': i,
+            'name': f'{rng.choice(PREFIXES)} {rng.choice(NOUNS)} X{i}',
+            'description': f'{rng.choice(PREFIXES)} {rng.choice(NOUNS).lower()} part number {i}',
+            'max_per_box': rng.randint(1, 20),
+            'category': rng.choice(CATEGORIES),
+        }
+        for i in range(1, size + 1)
+    ])
+    box_count = max(size // COMPONENTS_PER_BOX, 1)
+    db.session.execute(Box.__table__.insert(), [
+        {'id': i, 'name': f'Bench Box {i}'} for i in range(1, box_count + 1)
+    ])
+    db.session.execute(BoxComponent.__table__.insert(), [
+        {'box_id': (i % box_count) + 1, 'component_type_id': i, 'quantity': 1}
+        for i in range(1, size + 1)
+    ])
+    db.session.commit()
+    rebuild_search_index()
+
+def like_search(query):
+    """The search as it was before FTS5: a substring match on the name over the three-way join"""
+    return db.session.query(BoxComponent, ComponentType, Box).join(ComponentType).join(Box).filter(
+        ComponentType.name.contains(query)
+    ).order_by(ComponentType.name, BoxComponent.id).limit(PAGE_SIZE).all()
+
+def fts_search(query):
+    """The current search: FTS5 match ranked by BM25 over the same join"""
+    match = build_search_match(query)
+    if match is None:
+        return []
+    matches = search_matches(match)
+    return db.session.query(BoxComponent, ComponentType, Box).join(ComponentType).join(Box).join(
+        matches, matches.c.id == ComponentType.id
+    ).order_by(matches.c.rank, BoxComponent.id).limit(PAGE_SIZE).all()
+
+def time_query(func, query, repeat):
+    """Return (median milliseconds, row count) over repeat runs"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = func(query)
+        timings.append((time.perf_counter() - start) * 1000)
+        db.session.expunge_all()
+    return statistics.median(timings), len(rows)
+
+def benchmark_search(sizes, repeat):
+    print(f"{'rows':>9}  {'query':<28} {'LIKE ms':>9} {'FTS5 ms':>9} {'speedup':>8}  {'LIKE/FTS rows':>13}")
+    with app.app_context():
+        for size in sizes:
+            print(f"Seeding {size} component types...", file=sys.stderr)
+            seed(size)
+            queries = QUERIES + [('rare code', f'X{size // 2}')]
+            for label, query in queries:
+                like_ms, like_rows = time_query(like_search, query, repeat)
+                fts_ms, fts_rows = time_query(fts_search, query, repeat)
+                speedup = like_ms / fts_ms if fts_ms else float('inf')
+                print(f"{size:>9}  {label + ': ' + query:<28} {like_ms:>9.2f} {fts_ms:>9.2f} {speedup:>7.1f}x  {like_rows:>6}/{fts_rows:<6}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    benchmark_search(args.sizes, args.repeat)
@@ -0,0 +1,87 @@
+"""
+Query-count regression check for the list pages
+Seeds two throwaway databases of different sizes and fails if the number of SQL
+statements a page runs grows with the number of boxes or box entries
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Point the app at a scratch database before it is imported
+_tmp_dir = tempfile.mkdtemp(prefix='inventory-querycheck-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp_dir, 'querycheck.db')
+
+from sqlalchemy import event
+from app import create_app, db, Box, ComponentType, BoxComponent, box_card_cache
+app = create_app()
+
+PAGES = ['/', '/boxes', '/components']
+
+def seed(box_count, types_per_box):
+    """Replace the scratch database contents with box_count boxes of types_per_box entries each"""
+    db.drop_all()
+    db.create_all()
+
+    component_types = [
+        ComponentType(name=f'Component {i}', max_per_box=100, category='Electronics')
+        for i in range(types_per_box)
+    ]
+    db.session.add_all(component_types)
+    boxes = [Box(name=f'Box {i}', description='Query check box') for i in range(box_count)]
+    db.session.add_all(boxes)
+    db.session.flush()
+
+    for box in boxes:
+        for component_type in component_types:
+            db.session.add(BoxComponent(box_id=box.id, component_type_id=component_type.id, quantity=1))
+    db.session.commit()
+    db.session.remove()
+    # The recreated boxes reuse ids and versions, so cards rendered for the last seed would match
+    box_card_cache.clear()
+
+def count_statements(client, url):
+    """Return the number of SQL statements executed while serving url"""
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    # Read-only pages run on the 'read' engine, so listen on every engine
+    with app.app_context():
+        engines = list(db.engines.values())
+
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', on_execute)
+    try:
+        response = client.get(url)
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', on_execute)
+
+    if response.status_code != 200:
+        raise RuntimeError(f'{url} returned HTTP {response.status_code}')
+    return len(statements)
+
+def check_query_counts():
+    """Compare per-page statement counts between a small and a large dataset"""
+    client = app.test_client()
+    counts = {}
+
+    for label, box_count, types_per_box in [('small', 2, 3), ('large', 40, 12)]:
+        with app.app_context():
+            seed(box_count, types_per_box)
+        counts[label] = {url: count_statements(client, url) for url in PAGES}
+        print(f"{label:>5} ({box_count} boxes x {types_per_box} types): {counts[label]}")
+
+    failures = [url for url in PAGES if counts['large'][url] > counts['small'][url]]
+    if failures:
+        print(f"\nFAIL: statement count grows with row count on {', '.join(failures)}")
+        return 1
+
+    print("\nOK: statement counts are independent of row count")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(check_query_counts())
@@ -0,0 +1,43 @@
+"""
+Export the inventory as CSV or JSON Lines
+Streams the same rows as /export/inventory.csv and /export/inventory.jsonl to a
+file or stdout, for scheduled jobs that run next to the database
+
+Usage: python scripts/export_inventory.py [--format csv|jsonl] [--output FILE] [--gzip]
+                                          [--box-id ID] [--category NAME] [--since ISO_TIMESTAMP]
+"""
+
+import sys
+import os
+import argparse
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, EXPORT_FORMATS, generate_export, parse_export_filters
+app = create_app()
+
+def export_inventory(export_format, output, compress, filters):
+    with app.app_context():
+        chunks = generate_export(export_format, compress, **filters)
+        if output == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+        else:
+            with open(output, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    parser.add_argument('--output', default='-', help='file to write, or - for stdout (default)')
+    parser.add_argument('--gzip', action='store_true', help='gzip-compress the output')
+    parser.add_argument('--box-id', help='only export this box')
+    parser.add_argument('--category', help='only export component types in this category')
+    parser.add_argument('--since', help='only export entries updated at or after this time')
+    args = parser.parse_args()
+    try:
+        filters = parse_export_filters({'box_id': args.box_id, 'category': args.category, 'since': args.since})
+    except ValueError:
+        parser.error('--box-id must be an integer and --since an ISO 8601 timestamp')
+    export_inventory(args.format, args.output, args.gzip, filters)
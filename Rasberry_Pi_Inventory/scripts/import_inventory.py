@@ -0,0 +1,147 @@
+"""
+Bulk import of component types, boxes and box contents from CSV or JSON Lines
+`load` reads any of the three files and applies them in one transaction through
+bulk_import() in importer.py, reporting rows per second; `generate` writes a
+synthetic dataset of a chosen size to benchmark it with. Neither loads the web app
+
+Files are CSV or JSON Lines by extension (.csv, .jsonl, optionally .gz) with
+these columns:
+  component types: name, description, max_per_box, category
+  boxes:           name, description
+  box contents:    box, component_type, quantity
+
+Usage: python scripts/import_inventory.py load [--component-types FILE] [--boxes FILE]
+                                               [--box-contents FILE] [--mode insert|upsert]
+                                               [--database-url URL]
+       python scripts/import_inventory.py generate OUTPUT_DIR [--component-types 50000]
+                                                   [--boxes 1000] [--box-contents 500000]
+"""
+
+import sys
+import os
+import argparse
+import csv
+import gzip
+import json
+import random
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from importer import IMPORT_BATCH_SIZE, IMPORT_MODES, bulk_import
+from models import DEFAULT_DATABASE_URL, resolve_database_uri
+
+PREFIXES = ['Mini', 'Micro', 'Digital', 'Analog', 'Infrared', 'Ultrasonic', 'Capacitive', 'Smart', 'Dual', 'RGB']
+NOUNS = ['Sensor', 'Module', 'Display', 'Motor', 'Switch', 'Resistor', 'Breadboard', 'Cable', 'Relay', 'Keypad']
+CATEGORIES = ['Sensors', 'Electronics', 'Display', 'Motors', 'Hardware', 'Cables', 'Controllers', 'Communication']
+
+def open_text(path, mode='r'):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+def read_rows(path):
+    """Yield one dict per row of a CSV or JSON Lines file"""
+    if path is None:
+        return
+    is_jsonl = path.removesuffix('.gz').endswith('.jsonl')
+    with open_text(path) as f:
+        if is_jsonl:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+def write_rows(path, fields, rows):
+    is_jsonl = path.removesuffix('.gz').endswith('.jsonl')
+    with open_text(path, 'w') as f:
+        if is_jsonl:
+            for row in rows:
+                f.write(json.dumps(dict(zip(fields, row))) + '\n')
+        else:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(fields)
+            writer.writerows(rows)
+
+def load(database_url, component_types, boxes, box_contents, mode, batch_size):
+    engine = create_engine(resolve_database_uri(database_url))
+    start = time.perf_counter()
+    try:
+        with Session(engine) as session:
+            stats = bulk_import(session, read_rows(component_types), read_rows(boxes), read_rows(box_contents),
+                                mode=mode, batch_size=batch_size)
+    except ValueError as e:
+        print(f"Import failed, nothing was changed:\n{e}", file=sys.stderr)
+        return 1
+    finally:
+        engine.dispose()
+    elapsed = time.perf_counter() - start
+
+    print(f"{'file':<16} {'rows':>9} {'seconds':>9} {'rows/sec':>10}")
+    for kind, (rows, seconds) in stats.items():
+        rate = rows / seconds if seconds else 0
+        print(f"{kind:<16} {rows:>9} {seconds:>9.2f} {rate:>10.0f}")
+    total = sum(rows for rows, _ in stats.values())
+    print(f"{'total':<16} {total:>9} {elapsed:>9.2f} {total / elapsed:>10.0f}  (including commit and search index rebuild)")
+    return 0
+
+def generate(output_dir, component_type_count, box_count, box_content_count, extension, seed):
+    """Write component_types, boxes and box_contents files of the requested sizes"""
+    if box_content_count > component_type_count * box_count:
+        raise SystemExit('--box-contents cannot exceed --component-types x --boxes')
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(seed)
+
+    max_per_box = [rng.randint(1, 50) for _ in range(component_type_count)]
+    write_rows(os.path.join(output_dir, f'component_types.{extension}'),
+               ['name', 'description', 'max_per_box', 'category'], (
+        (f'{rng.choice(PREFIXES)} {rng.choice(NOUNS)} P{i}', f'Synthetic part number {i}',
+         max_per_box[i], rng.choice(CATEGORIES))
+        for i in range(component_type_count)
+    ))
+    write_rows(os.path.join(output_dir, f'boxes.{extension}'), ['name', 'description'], (
+        (f'Box {i}', f'Synthetic storage box {i}') for i in range(box_count)
+    ))
+
+    # Read the names back rather than replaying the generator's random choices
+    names = [row['name'] for row in read_rows(os.path.join(output_dir, f'component_types.{extension}'))]
+
+    def contents():
+        # Spread entries evenly over the boxes, each box holding distinct component types
+        per_box, extra = divmod(box_content_count, box_count)
+        for box in range(box_count):
+            for component_type in rng.sample(range(component_type_count), per_box + (box < extra)):
+                yield f'Box {box}', names[component_type], rng.randint(0, max_per_box[component_type])
+
+    write_rows(os.path.join(output_dir, f'box_contents.{extension}'), ['box', 'component_type', 'quantity'], contents())
+    print(f"Wrote {component_type_count} component types, {box_count} boxes and "
+          f"{box_content_count} box contents to {output_dir}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    load_parser = commands.add_parser('load', help='import files into the database')
+    load_parser.add_argument('--component-types')
+    load_parser.add_argument('--boxes')
+    load_parser.add_argument('--box-contents')
+    load_parser.add_argument('--mode', choices=IMPORT_MODES, default='insert')
+    load_parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+    load_parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL))
+
+    generate_parser = commands.add_parser('generate', help='write a synthetic dataset')
+    generate_parser.add_argument('output_dir')
+    generate_parser.add_argument('--component-types', type=int, default=50000)
+    generate_parser.add_argument('--boxes', type=int, default=1000)
+    generate_parser.add_argument('--box-contents', type=int, default=500000)
+    generate_parser.add_argument('--format', choices=['csv', 'jsonl', 'csv.gz', 'jsonl.gz'], default='csv')
+    generate_parser.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == 'load':
+        sys.exit(load(args.database_url, args.component_types, args.boxes, args.box_contents, args.mode,
+                      args.batch_size))
+    generate(args.output_dir, args.component_types, args.boxes, args.box_contents, args.format, args.seed)
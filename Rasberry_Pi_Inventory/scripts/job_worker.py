@@ -0,0 +1,55 @@
+"""
+Run background jobs queued through /api/jobs
+Starts a pool of worker processes, each claiming and running one job at a
+time, so at most --processes jobs run at once however many are queued
+
+Usage: python scripts/job_worker.py [--processes N] [--poll-interval 1.0] [--until-idle]
+"""
+
+import sys
+import os
+import argparse
+import multiprocessing
+import socket
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db, schema_is_up_to_date, JOB_POLL_INTERVAL, run_job_worker
+app = create_app()
+
+def work(index, poll_interval, until_idle):
+    with app.app_context():
+        # Connections must not be shared with the parent process
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+        run_job_worker(f'{socket.gethostname()}:{os.getpid()}:{index}', poll_interval, until_idle)
+
+def run_workers(processes, poll_interval, until_idle):
+    with app.app_context():
+        if not schema_is_up_to_date():
+            raise SystemExit('The database schema is out of date, run python scripts/migrate.py first')
+    workers = [
+        multiprocessing.Process(target=work, args=(i, poll_interval, until_idle), name=f'job-worker-{i}')
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+            worker.join()
+    return max(worker.exitcode or 0 for worker in workers)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--processes', type=int, default=app.config['JOB_WORKERS'],
+                        help='jobs to run at once (default JOB_WORKERS)')
+    parser.add_argument('--poll-interval', type=float, default=JOB_POLL_INTERVAL,
+                        help='seconds an idle worker waits before checking the queue again')
+    parser.add_argument('--until-idle', action='store_true', help='exit once the queue is empty')
+    args = parser.parse_args()
+    if args.processes < 1:
+        parser.error('--processes must be at least 1')
+    sys.exit(run_workers(args.processes, args.poll_interval, args.until_idle))
@@ -0,0 +1,154 @@
+"""
+Mixed read/write load test for the SQLite engine configuration
+Runs the same traffic against a threaded WSGI server twice: once with SQLite's
+stock settings (rollback journal, synchronous=FULL, no read engine) and once
+with the tuned defaults from app.py, then reports requests/sec and latency
+percentiles for each
+
+Usage: python scripts/load_test.py [--threads 16] [--duration 10] [--write-ratio 0.2]
+"""
+
+import sys
+import os
+import argparse
+import json
+import logging
+import random
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+# Environment overrides for each engine profile; 'tuned' uses the app defaults
+PROFILES = {
+    'stock': {
+        'SQLITE_JOURNAL_MODE': 'DELETE',
+        'SQLITE_SYNCHRONOUS': 'FULL',
+        'SQLITE_CACHE_SIZE': '-2000',
+        'SQLITE_MMAP_SIZE': '0',
+        'SQLITE_TEMP_STORE': 'DEFAULT',
+        'SQLITE_READ_ENGINE': '0',
+    },
+    'tuned': {},
+}
+
+BOX_COUNT = 50
+COMPONENT_TYPE_COUNT = 40
+
+def seed(app, db, Box, ComponentType, BoxComponent, init_db):
+    with app.app_context():
+        init_db()
+        component_types = ComponentType.query.all()
+        for i in range(BOX_COUNT):
+            db.session.add(Box(name=f'Load Kit {i}'))
+        db.session.flush()
+        for box in Box.query.all():
+            for component_type in component_types[:COMPONENT_TYPE_COUNT // 2]:
+                db.session.add(BoxComponent(box_id=box.id, component_type_id=component_type.id, quantity=1))
+        db.session.commit()
+        return [box.id for box in Box.query.all()], [component_type.id for component_type in component_types]
+
+def request(base_url, path, payload=None):
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(base_url + path, data=data, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req) as response:
+        body = response.read()
+    if payload is not None:
+        message = json.loads(body)
+        if not message.get('success') and 'locked' in message.get('message', ''):
+            raise RuntimeError(message['message'])
+
+def client(base_url, box_ids, component_type_ids, write_ratio, deadline, seed_value, latencies, errors, lock):
+    rng = random.Random(seed_value)
+    local_latencies = []
+    local_errors = 0
+    while time.perf_counter() < deadline:
+        box_id = rng.choice(box_ids)
+        if rng.random() < write_ratio:
+            path = rng.choice(['/api/add_component', '/api/remove_component'])
+            payload = {'box_id': box_id, 'component_type_id': rng.choice(component_type_ids), 'quantity': 1}
+        else:
+            path = rng.choice(['/', '/boxes', f'/box/{box_id}', f'/api/get_box_components/{box_id}', '/api/search?q=sensor'])
+            payload = None
+        start = time.perf_counter()
+        try:
+            request(base_url, path, payload)
+        except (urllib.error.URLError, RuntimeError):
+            local_errors += 1
+        local_latencies.append((time.perf_counter() - start) * 1000)
+    with lock:
+        latencies.extend(local_latencies)
+        errors.append(local_errors)
+
+def run_profile(threads, duration, write_ratio):
+    """Run the load in this process, with the profile already applied to the environment"""
+    tmp_dir = tempfile.mkdtemp(prefix='inventory-load-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp_dir, 'load.db')
+
+    from werkzeug.serving import make_server
+    from app import create_app, db, Box, ComponentType, BoxComponent, init_db
+    app = create_app()
+
+    box_ids, component_type_ids = seed(app, db, Box, ComponentType, BoxComponent, init_db)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    workers = [
+        threading.Thread(target=client, args=(base_url, box_ids, component_type_ids, write_ratio,
+                                              deadline, i, latencies, errors, lock))
+        for i in range(threads)
+    ]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50': statistics.median(latencies),
+        'p99': latencies[int(len(latencies) * 0.99) - 1],
+        'errors': sum(errors),
+    }
+
+def load_test(threads, duration, write_ratio):
+    print(f"{threads} threads, {duration}s per profile, {write_ratio:.0%} writes")
+    print(f"{'profile':<8} {'requests':>9} {'req/sec':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, overrides in PROFILES.items():
+        env = dict(os.environ, **overrides)
+        output = subprocess.run(
+            [sys.executable, os.path.join(SCRIPT_DIR, 'load_test.py'), '--run-profile',
+             '--threads', str(threads), '--duration', str(duration), '--write-ratio', str(write_ratio)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{name:<8} {result['requests']:>9} {result['rps']:>9.1f} {result['p50']:>8.1f} "
+              f"{result['p99']:>8.1f} {result['errors']:>7}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--run-profile', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run_profile:
+        print(json.dumps(run_profile(args.threads, args.duration, args.write_ratio)))
+    else:
+        load_test(args.threads, args.duration, args.write_ratio)
@@ -0,0 +1,49 @@
+"""
+Create or upgrade the inventory, job and site database schemas
+Applies the migrations in models.py that the databases have not seen yet,
+including the database of every site in INVENTORY_SITES.
+Run it after installing or upgrading, before starting the app or workers;
+it only loads SQLAlchemy and models.py, not the web app
+
+Usage: python scripts/migrate.py [--database-url URL] [--jobs-database-url URL] [--sites NAME=URL,...]
+"""
+
+import sys
+import os
+import argparse
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+
+from models import DEFAULT_DATABASE_URL, default_job_database_uri, migrate, parse_sites, resolve_database_uri
+
+def run_migrations(database_url, jobs_database_url, sites):
+    urls = {'inventory': database_url, 'jobs': jobs_database_url, **{f'site {name}': url for name, url in sites.items()}}
+    engines = {name: create_engine(resolve_database_uri(url)) for name, url in urls.items()}
+    try:
+        versions = migrate(engines['inventory'], engines['jobs'],
+                           {name: engines[f'site {name}'] for name in sites})
+    finally:
+        for engine in engines.values():
+            engine.dispose()
+    for name, (old, new) in versions.items():
+        state = f'upgraded from version {old} to {new}' if new != old else f'already at version {new}'
+        print(f'{name:<16} {urls[name]}: {state}')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL))
+    parser.add_argument('--jobs-database-url', default=os.environ.get('JOB_DATABASE_URL'),
+                        help='default: next to the inventory database with a -jobs suffix')
+    parser.add_argument('--sites', default=os.environ.get('INVENTORY_SITES', ''),
+                        help='site databases as NAME=URL,... (default INVENTORY_SITES)')
+    args = parser.parse_args()
+    try:
+        sites = parse_sites(args.sites)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        run_migrations(args.database_url, args.jobs_database_url or default_job_database_uri(args.database_url), sites)
+    except ValueError as e:
+        # A migration found data it cannot carry over; nothing of that migration was applied
+        sys.exit(f'Migration failed: {e}')
@@ -0,0 +1,65 @@
+"""
+Receive scans pushed over UDP by barcode and RFID scanners
+Each datagram carries one or more scans, one per line, in the formats
+accepted by POST /api/scans; they are coalesced and committed the same way,
+and a pending window is also committed once the scanners go quiet
+
+Usage: python scripts/scan_listener.py [--host 0.0.0.0] [--port 5055] [--window 0.05]
+                                       [--report-interval 10]
+"""
+
+import sys
+import os
+import argparse
+import socket
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, schema_is_up_to_date, SCAN_COALESCE_WINDOW, ScanIngester
+app = create_app()
+
+def listen(host, port, window, report_interval):
+    with app.app_context():
+        if not schema_is_up_to_date():
+            raise SystemExit('The database schema is out of date, run python scripts/migrate.py first')
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((host, port))
+        sock.settimeout(window)
+        print(f"Listening for scans on udp://{host}:{port}")
+
+        ingester = ScanIngester(window=window)
+        next_report = time.monotonic() + report_interval
+        reported_scans = 0
+        while True:
+            try:
+                data, (address, _) = sock.recvfrom(65535)
+                for line in data.decode('utf-8', 'replace').splitlines():
+                    if line.strip():
+                        ingester.feed_line(line, label=f'{address}: ')
+            except socket.timeout:
+                pass
+            if ingester.due():
+                ingester.flush()
+            for error in ingester.errors:
+                print(error, file=sys.stderr)
+            ingester.errors.clear()
+            if time.monotonic() >= next_report:
+                stats = ingester.stats
+                if stats['scans'] != reported_scans:
+                    print(f"{stats['scans']} scans, {stats['applied']} applied, {stats['rejected']} rejected "
+                          f"in {stats['commits']} commits")
+                    reported_scans = stats['scans']
+                next_report = time.monotonic() + report_interval
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--window', type=float, default=SCAN_COALESCE_WINDOW,
+                        help='seconds of scans to coalesce into one commit')
+    parser.add_argument('--report-interval', type=float, default=10, help='seconds between summary lines')
+    args = parser.parse_args()
+    try:
+        listen(args.host, args.port, args.window, args.report_interval)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,162 @@
+"""
+Concurrency stress test for the inventory mutation endpoints
+Serves the app from a threaded WSGI server on a scratch database, hammers the
+add, remove, transfer and batch APIs from many client threads at once, then
+checks that no stock was lost or created, no box exceeded max_per_box and
+the movement ledger still sums to the stock of every entry
+
+Usage: python scripts/stress_concurrency.py [--threads 16] [--requests 200]
+"""
+
+import sys
+import os
+import argparse
+import json
+import logging
+import random
+import tempfile
+import threading
+import urllib.request
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Point the app at a scratch database before it is imported
+_tmp_dir = tempfile.mkdtemp(prefix='inventory-stress-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp_dir, 'stress.db')
+
+from werkzeug.serving import make_server
+from app import create_app, db, Box, ComponentType, BoxComponent, StockMovement
+app = create_app()
+from models import open_stock_ledger
+
+BOX_COUNT = 4
+MAX_PER_BOX = 20
+COMPONENT_TYPE_COUNT = 2
+INITIAL_QUANTITY = 10
+
+def seed():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add_all(
+            ComponentType(name=f'Stress Component {i}', max_per_box=MAX_PER_BOX, category='Electronics')
+            for i in range(COMPONENT_TYPE_COUNT)
+        )
+        db.session.add_all(Box(name=f'Stress Kit {i}') for i in range(BOX_COUNT))
+        db.session.flush()
+        for box_id in range(1, BOX_COUNT + 1):
+            for component_type_id in range(1, COMPONENT_TYPE_COUNT + 1):
+                db.session.add(BoxComponent(box_id=box_id, component_type_id=component_type_id, quantity=INITIAL_QUANTITY))
+        db.session.flush()
+        open_stock_ledger(db.session.connection())
+        db.session.commit()
+
+def post(base_url, path, payload):
+    request = urllib.request.Request(
+        base_url + path,
+        data=json.dumps(payload).encode(),
+        headers={'Content-Type': 'application/json'}
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+def random_operation(rng):
+    component_type_id = rng.randint(1, COMPONENT_TYPE_COUNT)
+    quantity = rng.randint(1, 6)
+    op = rng.choice(['add', 'remove', 'transfer', 'transfer'])
+    if op == 'transfer':
+        from_box_id, to_box_id = rng.sample(range(1, BOX_COUNT + 1), 2)
+        return {'op': op, 'from_box_id': from_box_id, 'to_box_id': to_box_id,
+                'component_type_id': component_type_id, 'quantity': quantity}
+    return {'op': op, 'box_id': rng.randint(1, BOX_COUNT), 'component_type_id': component_type_id, 'quantity': quantity}
+
+def worker(base_url, seed_value, request_count, net_change, errors, lock):
+    """Send request_count random mutations, recording the net stock change of those that succeeded"""
+    rng = random.Random(seed_value)
+    local_change = [0] * (COMPONENT_TYPE_COUNT + 1)
+
+    for _ in range(request_count):
+        if rng.random() < 0.2:
+            operations = [random_operation(rng) for _ in range(rng.randint(2, 5))]
+            response = post(base_url, '/api/batch', {'mode': 'per_item', 'operations': operations})
+            outcomes = [(operation, result['success'], result['message'])
+                        for operation, result in zip(operations, response.get('results', []))]
+            if 'results' not in response:
+                outcomes = [(None, False, response['message'])]
+        else:
+            operation = random_operation(rng)
+            path = {'add': '/api/add_component', 'remove': '/api/remove_component',
+                    'transfer': '/api/transfer_component'}[operation['op']]
+            response = post(base_url, path, operation)
+            outcomes = [(operation, response['success'], response['message'])]
+
+        for operation, success, message in outcomes:
+            if success:
+                if operation['op'] == 'add':
+                    local_change[operation['component_type_id']] += operation['quantity']
+                elif operation['op'] == 'remove':
+                    local_change[operation['component_type_id']] -= operation['quantity']
+            elif not message.startswith(('Cannot', 'Insufficient', 'Transfer would exceed', 'Component not found')):
+                with lock:
+                    errors.append(message)
+
+    with lock:
+        for component_type_id, change in enumerate(local_change):
+            net_change[component_type_id] += change
+
+def stress(thread_count, request_count):
+    seed()
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    net_change = [0] * (COMPONENT_TYPE_COUNT + 1)
+    errors = []
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=worker, args=(base_url, i, request_count, net_change, errors, lock))
+        for i in range(thread_count)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    server.shutdown()
+
+    failures = [f'unexpected error: {message}' for message in sorted(set(errors))]
+    with app.app_context():
+        for component_type_id in range(1, COMPONENT_TYPE_COUNT + 1):
+            rows = BoxComponent.query.filter_by(component_type_id=component_type_id).all()
+            expected = INITIAL_QUANTITY * BOX_COUNT + net_change[component_type_id]
+            actual = sum(row.quantity for row in rows)
+            print(f"Component type {component_type_id}: expected total {expected}, actual {actual}, "
+                  f"per box {[row.quantity for row in rows]}")
+            if actual != expected:
+                failures.append(f'component type {component_type_id}: stock total {actual} != {expected}')
+            for row in rows:
+                if not 0 < row.quantity <= MAX_PER_BOX:
+                    failures.append(f'box {row.box_id} holds {row.quantity} of type {component_type_id}')
+
+        # Every entry must equal the sum of its movements in the ledger
+        rows = db.session.query(
+            StockMovement.box_id, StockMovement.component_type_id, db.func.sum(StockMovement.delta)
+        ).group_by(StockMovement.box_id, StockMovement.component_type_id)
+        ledger = {(box_id, component_type_id): total for box_id, component_type_id, total in rows}
+        stock = {(row.box_id, row.component_type_id): row.quantity for row in BoxComponent.query.all()}
+        for key in set(ledger) | set(stock):
+            if ledger.get(key, 0) != stock.get(key, 0):
+                failures.append(f'box {key[0]} type {key[1]}: ledger total {ledger.get(key, 0)} != stock {stock.get(key, 0)}')
+
+    print(f"{thread_count} threads x {request_count} requests")
+    if failures:
+        print("FAIL:\n  " + "\n  ".join(failures))
+        return 1
+    print("OK: no stock lost, created or over capacity, and the ledger matches")
+    return 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+    sys.exit(stress(args.threads, args.requests))
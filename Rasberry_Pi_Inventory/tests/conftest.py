@@ -0,0 +1,81 @@
+"""
+Shared fixtures: one scratch database per test session, migrated with
+models.migrate() exactly as scripts/migrate.py would, and emptied and reseeded
+by each test that asks for data
+"""
+
+import sys
+import os
+
+import pytest
+from sqlalchemy import delete
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, migrate_database, db, box_card_cache
+from importer import bulk_import
+from models import (Box, ComponentType, ComponentTypeStock, BoxComponent, StockMovement, StockCheckpoint,
+                    StockCheckpointBox, Alert, AlertRule, ScanTag, SiteTransfer, CATALOG_COUNTERS,
+                    mark_catalog_changed)
+
+# Children before parents, as init_sample_data() deletes them
+SEEDED_MODELS = (Alert, AlertRule, ScanTag, SiteTransfer, StockCheckpointBox, StockCheckpoint, StockMovement,
+                 BoxComponent, ComponentTypeStock, ComponentType, Box)
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    tmp_dir = tmp_path_factory.mktemp('inventory')
+    inventory_app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_dir / 'inventory.db'),
+        'JOB_DIR': str(tmp_dir / 'jobs'),
+        'JOB_IMPORT_DIR': str(tmp_dir / 'imports'),
+        'TEMPLATE_CACHE_DIR': '',
+        'INVENTORY_SITES': {'lab': 'sqlite:///' + str(tmp_dir / 'lab.db')},
+    })
+    with inventory_app.app_context():
+        migrate_database()
+    return inventory_app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def seed(app):
+    """Return seed(box_count, types_per_box, quantity=1, max_per_box=10), which replaces the data.
+
+    Every box gets quantity of every component type. Returns (box_ids,
+    component_type_ids), both in creation order.
+    """
+    def seed(box_count, types_per_box, quantity=1, max_per_box=10):
+        with app.app_context():
+            for model in SEEDED_MODELS:
+                db.session.execute(delete(model))
+            mark_catalog_changed(db.session, CATALOG_COUNTERS)
+            component_types = [
+                {'name': f'Component {i}', 'description': 'Test part', 'max_per_box': max_per_box,
+                 'category': 'Electronics'}
+                for i in range(types_per_box)
+            ]
+            boxes = [{'name': f'Box {i}', 'description': 'Test box'} for i in range(box_count)]
+            box_contents = [
+                {'box': box['name'], 'component_type': component_type['name'], 'quantity': quantity}
+                for box in boxes for component_type in component_types
+            ] if quantity else []
+            bulk_import(db.session, component_types, boxes, box_contents)
+            box_ids = db.session.scalars(db.select(Box.id).order_by(Box.id)).all()
+            component_type_ids = db.session.scalars(db.select(ComponentType.id).order_by(ComponentType.id)).all()
+        # The new rows reuse ids and versions, so cards rendered for the last seed would match
+        box_card_cache.clear()
+        return box_ids, component_type_ids
+    return seed
+
+@pytest.fixture
+def stock(app):
+    """Return stock(box_id, component_type_id), the quantity held now"""
+    def stock(box_id, component_type_id):
+        with app.app_context():
+            return db.session.scalar(db.select(BoxComponent.quantity).filter_by(
+                box_id=box_id, component_type_id=component_type_id
+            )) or 0
+    return stock
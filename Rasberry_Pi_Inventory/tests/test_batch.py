@@ -0,0 +1,51 @@
+"""
+/api/batch applies every operation of an all_or_nothing batch or none of them
+"""
+
+def test_all_or_nothing_batch_applies_nothing_when_one_operation_fails(client, seed, stock):
+    (box_id, other_box_id), (first_type_id, second_type_id) = seed(2, 2, quantity=2)
+
+    response = client.post('/api/batch', json={'mode': 'all_or_nothing', 'operations': [
+        {'op': 'add', 'box_id': box_id, 'component_type_id': first_type_id, 'quantity': 3},
+        {'op': 'transfer', 'from_box_id': box_id, 'to_box_id': other_box_id,
+         'component_type_id': second_type_id, 'quantity': 1},
+        {'op': 'remove', 'box_id': other_box_id, 'component_type_id': first_type_id, 'quantity': 5},
+    ]})
+
+    result = response.get_json()
+    assert not result['success']
+    assert (result['applied'], result['failed']) == (0, 1)
+    assert [item['success'] for item in result['results']] == [False, False, False]
+    assert result['results'][0]['message'] == 'Not applied: another operation in the batch failed'
+    assert stock(box_id, first_type_id) == 2
+    assert stock(box_id, second_type_id) == 2
+    assert stock(other_box_id, second_type_id) == 2
+    assert stock(other_box_id, first_type_id) == 2
+
+def test_all_or_nothing_batch_applies_every_operation(client, seed, stock):
+    (box_id, other_box_id), (first_type_id, second_type_id) = seed(2, 2, quantity=2)
+
+    response = client.post('/api/batch', json={'mode': 'all_or_nothing', 'operations': [
+        {'op': 'add', 'box_id': box_id, 'component_type_id': first_type_id, 'quantity': 3},
+        {'op': 'transfer', 'from_box_id': box_id, 'to_box_id': other_box_id,
+         'component_type_id': second_type_id, 'quantity': 1},
+    ]})
+
+    result = response.get_json()
+    assert result['success']
+    assert (result['applied'], result['failed']) == (2, 0)
+    assert stock(box_id, first_type_id) == 5
+    assert stock(box_id, second_type_id) == 1
+    assert stock(other_box_id, second_type_id) == 3
+
+def test_per_item_batch_applies_the_operations_that_pass(client, seed, stock):
+    (box_id,), (component_type_id,) = seed(1, 1, quantity=2)
+
+    response = client.post('/api/batch', json={'mode': 'per_item', 'operations': [
+        {'op': 'add', 'box_id': box_id, 'component_type_id': component_type_id, 'quantity': 3},
+        {'op': 'remove', 'box_id': box_id, 'component_type_id': component_type_id, 'quantity': 50},
+    ]})
+
+    result = response.get_json()
+    assert (result['applied'], result['failed']) == (1, 1)
+    assert stock(box_id, component_type_id) == 5
@@ -0,0 +1,26 @@
+"""
+/api/events refuses streams beyond EVENT_MAX_SUBSCRIBERS with 503 and frees
+a slot when a stream is closed, started or not
+"""
+
+from app import stock_events
+
+def test_streams_over_the_cap_are_refused(app, client, monkeypatch):
+    open_streams = stock_events.subscribers
+    monkeypatch.setitem(app.config, 'EVENT_MAX_SUBSCRIBERS', open_streams + 1)
+
+    first = client.get('/api/events', buffered=False)
+    assert first.status_code == 200
+    assert first.mimetype == 'text/event-stream'
+
+    refused = client.get('/api/events', buffered=False)
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After']
+    assert not refused.get_json()['success']
+
+    first.close()
+    second = client.get('/api/events', buffered=False)
+    assert second.status_code == 200
+    assert next(second.response).startswith(b'retry:')
+    second.close()
+    assert stock_events.subscribers == open_streams
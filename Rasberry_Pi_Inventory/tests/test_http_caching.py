@@ -0,0 +1,28 @@
+"""
+Pages and box reads carry an ETag of the data versions behind them and answer
+a matching If-None-Match with 304 until that data changes
+"""
+
+import pytest
+
+@pytest.mark.parametrize('url', ['/', '/boxes', '/components', 'box', 'api'])
+def test_matching_etag_gets_304_until_stock_changes(client, seed, url):
+    (box_id,), (component_type_id,) = seed(1, 1)
+    url = {'box': f'/box/{box_id}', 'api': f'/api/get_box_components/{box_id}'}.get(url, url)
+
+    first = client.get(url)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+
+    cached = client.get(url, headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == etag
+    assert not cached.data
+
+    response = client.post('/api/add_component', json={'box_id': box_id, 'component_type_id': component_type_id,
+                                                       'quantity': 1})
+    assert response.get_json()['success']
+
+    changed = client.get(url, headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
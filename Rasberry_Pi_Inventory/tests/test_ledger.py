@@ -0,0 +1,69 @@
+"""
+Stock movements are recorded in the ledger, and /api/stock_as_of reads past
+stock back from them, with or without a checkpoint to start from
+"""
+
+from datetime import datetime
+
+from app import db
+from models import BoxComponent, StockMovement, write_stock_checkpoint
+
+def stock_as_of(client, at, box_id):
+    response = client.get('/api/stock_as_of', query_string={'at': at.isoformat(), 'box_id': box_id})
+    assert response.status_code == 200
+    return {item['component_type_id']: item['quantity'] for item in response.get_json()['items']}
+
+def change_stock(client, url, box_id, component_type_id, quantity):
+    response = client.post(url, json={'box_id': box_id, 'component_type_id': component_type_id,
+                                      'quantity': quantity})
+    assert response.get_json()['success']
+
+def take_checkpoint(app):
+    with app.app_context():
+        connection = db.session.connection()
+        last_movement_id = db.session.scalar(db.select(db.func.max(StockMovement.id)))
+        entries = connection.execute(
+            db.select(BoxComponent.box_id, BoxComponent.component_type_id, BoxComponent.quantity)
+            .where(BoxComponent.quantity != 0).order_by(BoxComponent.box_id, BoxComponent.component_type_id)
+        )
+        write_stock_checkpoint(connection, last_movement_id, entries)
+        db.session.commit()
+
+def test_movements_are_recorded(client, seed):
+    (box_id,), (component_type_id,) = seed(1, 1, quantity=2)
+    change_stock(client, '/api/add_component', box_id, component_type_id, 3)
+    change_stock(client, '/api/remove_component', box_id, component_type_id, 4)
+
+    movements = client.get('/api/movements', query_string={'box_id': box_id}).get_json()['items']
+    assert sorted((movement['reason'], movement['delta']) for movement in movements) == [
+        ('add', 3), ('import', 2), ('remove', -4)
+    ]
+
+def run_history(app, client, seed, checkpoint):
+    (box_id,), (first_type_id, second_type_id) = seed(1, 2, quantity=2)
+    seeded = datetime.utcnow()
+    change_stock(client, '/api/add_component', box_id, first_type_id, 5)
+    added = datetime.utcnow()
+    if checkpoint == 'middle':
+        take_checkpoint(app)
+    change_stock(client, '/api/remove_component', box_id, second_type_id, 2)
+    change_stock(client, '/api/remove_component', box_id, first_type_id, 1)
+    if checkpoint == 'end':
+        take_checkpoint(app)
+
+    assert stock_as_of(client, seeded, box_id) == {first_type_id: 2, second_type_id: 2}
+    assert stock_as_of(client, added, box_id) == {first_type_id: 7, second_type_id: 2}
+    # Stock that has run out is left out
+    assert stock_as_of(client, datetime.utcnow(), box_id) == {first_type_id: 6}
+
+def test_stock_as_of_replays_the_ledger(app, client, seed):
+    run_history(app, client, seed, checkpoint=None)
+
+def test_stock_as_of_starts_from_a_checkpoint(app, client, seed):
+    run_history(app, client, seed, checkpoint='middle')
+
+def test_stock_as_of_walks_back_from_a_later_checkpoint(app, client, seed):
+    run_history(app, client, seed, checkpoint='end')
+
+def test_stock_as_of_needs_a_timestamp(client):
+    assert client.get('/api/stock_as_of', query_string={'at': 'yesterday'}).status_code == 400
@@ -0,0 +1,49 @@
+"""
+/api/plan_pick plans where to take a bill of parts from and, with execute,
+moves it into the target box in the same transaction
+"""
+
+def test_executed_pick_moves_stock_into_the_target_box(client, seed, stock):
+    (first_box_id, second_box_id, target_box_id), (component_type_id,) = seed(3, 1, quantity=3)
+    # The target box takes part in the plan as a destination only
+    client.post('/api/remove_component', json={'box_id': target_box_id, 'component_type_id': component_type_id,
+                                               'quantity': 3})
+
+    response = client.post('/api/plan_pick', json={
+        'items': [{'component_type_id': component_type_id, 'quantity': 5}],
+        'target_box_id': target_box_id,
+        'execute': True,
+    })
+
+    result = response.get_json()
+    assert response.status_code == 200
+    assert result['feasible'] and result['executed']
+    assert sum(item['quantity'] for pick in result['picks'] for item in pick['items']) == 5
+    assert stock(target_box_id, component_type_id) == 5
+    assert stock(first_box_id, component_type_id) + stock(second_box_id, component_type_id) == 1
+
+def test_infeasible_pick_moves_nothing(client, seed, stock):
+    (first_box_id, target_box_id), (component_type_id,) = seed(2, 1, quantity=3)
+
+    response = client.post('/api/plan_pick', json={
+        'items': [{'component_type_id': component_type_id, 'quantity': 20}],
+        'target_box_id': target_box_id,
+        'execute': True,
+    })
+
+    result = response.get_json()
+    assert not result['feasible'] and not result['executed']
+    assert result['shortfall']
+    assert stock(first_box_id, component_type_id) == 3
+    assert stock(target_box_id, component_type_id) == 3
+
+def test_plan_without_execute_changes_nothing(client, seed, stock):
+    (first_box_id, target_box_id), (component_type_id,) = seed(2, 1, quantity=3)
+
+    result = client.post('/api/plan_pick', json={
+        'items': [{'component_type_id': component_type_id, 'quantity': 2}],
+        'target_box_id': target_box_id,
+    }).get_json()
+
+    assert result['feasible'] and not result['executed']
+    assert stock(first_box_id, component_type_id) == 3
@@ -0,0 +1,38 @@
+"""
+The list pages run the same number of SQL statements however many boxes and
+box entries there are; scripts/check_query_counts.py prints the counts
+"""
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+
+PAGES = ['/', '/boxes', '/components']
+
+def count_statements(app, client, url):
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    # Read-only pages run on the 'read' engine, so listen on every engine
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', on_execute)
+    try:
+        response = client.get(url)
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', on_execute)
+    assert response.status_code == 200
+    return len(statements)
+
+@pytest.mark.parametrize('url', PAGES)
+def test_statement_count_does_not_grow_with_rows(app, client, seed, url):
+    seed(2, 3)
+    small = count_statements(app, client, url)
+    seed(40, 12)
+    large = count_statements(app, client, url)
+    assert large <= small
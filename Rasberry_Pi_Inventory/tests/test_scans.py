@@ -0,0 +1,39 @@
+"""
+/api/scans commits each coalescing window once it has passed, even while
+the upload is still open and no further line has arrived
+"""
+
+import os
+import threading
+import time
+
+from app import SCAN_COALESCE_WINDOW
+
+def test_pending_window_is_committed_while_the_scanner_is_quiet(client, seed, stock):
+    (box_id,), (component_type_id,) = seed(1, 1, quantity=0)
+    response = client.post('/api/scan_tags', json={'tag': 'PART-1', 'component_type_id': component_type_id})
+    assert response.get_json()['success']
+
+    read_end, write_end = os.pipe()
+    results = []
+    with os.fdopen(read_end, 'rb') as upload:
+        request_thread = threading.Thread(target=lambda: results.append(client.post(
+            # Like a chunked upload: no length, read until the scanner hangs up
+            '/api/scans', environ_overrides={'wsgi.input': upload, 'wsgi.input_terminated': True,
+                                             'CONTENT_LENGTH': ''}
+        )))
+        request_thread.start()
+        with os.fdopen(write_end, 'wb', buffering=0) as scanner:
+            scanner.write(f'PART-1,{box_id},2\n'.encode())
+            deadline = time.monotonic() + 20 * SCAN_COALESCE_WINDOW
+            while stock(box_id, component_type_id) != 2 and time.monotonic() < deadline:
+                time.sleep(SCAN_COALESCE_WINDOW / 5)
+            # Committed before the upload ended
+            assert stock(box_id, component_type_id) == 2
+            scanner.write(f'PART-1,{box_id},1\n'.encode())
+        request_thread.join(5)
+
+    result = results[0].get_json()
+    assert result['success']
+    assert (result['scans'], result['applied'], result['commits']) == (2, 2, 2)
+    assert stock(box_id, component_type_id) == 3
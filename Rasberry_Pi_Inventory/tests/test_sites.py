@@ -0,0 +1,44 @@
+"""
+Each site's boxes live in a database of their own, reached through
+site_context(), and cross-site reads report a failing site instead of failing
+"""
+
+from flask import g
+
+from app import db, fan_out, get_box, site_context
+from models import Box
+
+def test_catalog_cache_keeps_the_boxes_of_each_site_apart(app, seed):
+    (home_box_id,), _ = seed(1, 1)
+    with app.app_context():
+        with site_context('lab'):
+            db.session.execute(db.delete(Box))
+            db.session.add(Box(id=home_box_id, name='Lab bench', description='Box at the lab'))
+            db.session.commit()
+
+        assert get_box(home_box_id).name == 'Box 0'
+        with site_context('lab', read_only=True):
+            assert get_box(home_box_id).name == 'Lab bench'
+        assert get_box(home_box_id).name == 'Box 0'
+
+def test_site_context_keeps_the_request_context_and_session(app):
+    with app.test_request_context('/'):
+        g.marker = 'request'
+        home_session = db.session()
+        with site_context('lab', read_only=True):
+            assert g.marker == 'request'
+            assert db.session() is not home_session
+            assert db.session.info['site'] == 'lab'
+        assert db.session() is home_session
+        assert 'site' not in db.session.info
+
+def test_fan_out_reports_any_failure_under_errors(app):
+    def answer(site):
+        if site == 'lab':
+            raise ZeroDivisionError('division by zero')
+        return site
+
+    with app.app_context():
+        results, errors = fan_out(answer)
+    assert results == {'main': 'main'}
+    assert errors == {'lab': 'division by zero'}